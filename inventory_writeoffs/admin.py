@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import InventoryWriteOff
+from .models import InventoryWriteOff, ReconciliationRun, StockVariance
 
 @admin.register(InventoryWriteOff)
 class InventoryWriteOffAdmin(admin.ModelAdmin):
@@ -22,3 +22,26 @@ class InventoryWriteOffAdmin(admin.ModelAdmin):
     def has_change_permission(self, request, obj=None):
         return False
 
+
+class StockVarianceInline(admin.TabularInline):
+    model = StockVariance
+    extra = 0
+    can_delete = False
+    fields = ('product_name', 'quantity', 'ledger_quantity', 'ledger_variance', 'batch_quantity', 'imbalance_sales', 'fixed')
+    readonly_fields = fields
+
+    def has_add_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(ReconciliationRun)
+class ReconciliationRunAdmin(admin.ModelAdmin):
+    list_display = ('started_at', 'finished_at', 'fix', 'products_checked', 'variance_count', 'run_by')
+    list_filter = ('fix',)
+    inlines = [StockVarianceInline]
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
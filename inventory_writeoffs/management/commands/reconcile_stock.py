@@ -0,0 +1,41 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from inventory_writeoffs.reconcile import reconcile_stock, FIX_MODES
+
+
+class Command(BaseCommand):
+    help = "Reconcile stock against the StockHistory ledger and batches, once or on a fixed interval."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--fix", choices=FIX_MODES,
+                            help="ledger: add adjustment rows so the ledger matches stock")
+        parser.add_argument("--interval", type=float, default=86400.0, help="Seconds between runs")
+        parser.add_argument("--once", action="store_true", help="Reconcile once and exit")
+
+    def _run(self, fix):
+        run = reconcile_stock(fix=fix)
+        return (
+            f"Reconciliation #{run.pk}: {run.products_checked} product(s) checked, "
+            f"{run.variance_count} variance(s)" + (f", fixed in {fix}" if fix and run.variance_count else "")
+        )
+
+    def handle(self, *args, **options):
+        if options["once"]:
+            self.stdout.write(self.style.SUCCESS(self._run(options["fix"])))
+            return
+
+        self.stdout.write("Stock reconciliation job started")
+        try:
+            while True:
+                close_old_connections()
+                try:
+                    self.stdout.write(self._run(options["fix"]))
+                except Exception as e:
+                    # Keep the schedule alive, the next run checks everything again
+                    self.stderr.write(f"Stock reconciliation failed: {e}")
+                time.sleep(options["interval"])
+        except KeyboardInterrupt:
+            self.stdout.write("Stock reconciliation job stopped")
@@ -1,8 +1,8 @@
 from django.db import models
 from django.contrib.auth.models import User
 from products.models import Product
+from products.references import next_reference
 import uuid
-from django.db import IntegrityError
 
 def generate_unique_reference():
     while True:
@@ -12,6 +12,8 @@ def generate_unique_reference():
 
 
 class InventoryWriteOff(models.Model):
+    REFERENCE_PREFIX = "InventoryWriteOff"
+
     REASONS = [
         ('Damaged', 'Damaged'),
         ('Return to supplier', 'Returned to Supplier'),
@@ -47,15 +49,50 @@ class InventoryWriteOff(models.Model):
             self.created_by_name = f"{self.created_by.first_name} {self.created_by.last_name}".strip() or self.created_by.username
 
         if not self.reference:
-            for _ in range(10): 
-                ref = f"InventoryWriteOff-{uuid.uuid4().hex[:12]}"
-                if not InventoryWriteOff.objects.filter(reference=ref).exists():
-                    self.reference = ref
-                    break
-            else:
-                raise IntegrityError("Could not generate unique product reference")
+            self.reference = next_reference(self.REFERENCE_PREFIX)
 
         super().save(*args, **kwargs)
 
     def __str__(self):
         return f"{self.product.name} - {self.get_reason_display()} - {self.quantity}"
+
+
+class ReconciliationRun(models.Model):
+    """One pass of inventory_writeoffs.reconcile over every product."""
+    FIX_CHOICES = [
+        ('', 'Report only'),
+        ('ledger', 'Adjust ledger to stock'),
+    ]
+
+    started_at = models.DateTimeField(auto_now_add=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    run_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name='reconciliation_runs')
+    fix = models.CharField(max_length=10, choices=FIX_CHOICES, blank=True, default='')
+    products_checked = models.PositiveIntegerField(default=0)
+    variance_count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        ordering = ['-started_at']
+
+    def __str__(self):
+        return f"Reconciliation {self.started_at:%Y-%m-%d %H:%M}: {self.variance_count} variance(s)"
+
+
+class StockVariance(models.Model):
+    """A product whose stock disagrees with its ledger or its batches."""
+    run = models.ForeignKey(ReconciliationRun, on_delete=models.CASCADE, related_name='variances')
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='stock_variances')
+    product_name = models.CharField(max_length=255)
+    quantity = models.IntegerField(help_text="Product.quantity when checked")
+    ledger_quantity = models.IntegerField(help_text="Stock implied by the StockHistory ledger")
+    batch_quantity = models.IntegerField(null=True, blank=True, help_text="Sum of batch quantity_left, if batched")
+    ledger_variance = models.IntegerField(help_text="quantity - ledger_quantity")
+    batch_variance = models.IntegerField(null=True, blank=True, help_text="quantity - batch_quantity")
+    imbalance_sales = models.PositiveIntegerField(default=0, help_text='Sold lines noted "(Stock imbalance)"')
+    fixed = models.BooleanField(default=False)
+
+    class Meta:
+        ordering = ['run', 'product_id']
+
+    def __str__(self):
+        return f"{self.product_name}: stock {self.quantity}, ledger {self.ledger_quantity}"
@@ -0,0 +1,143 @@
+"""
+Stock reconciliation: does Product.quantity still match its ledger?
+
+The StockHistory ledger implies a quantity per product: "Sold" rows take
+stock away, every other action adds its (signed) quantity, as written by
+checkout, stock_history_view and the product create / receive paths.
+Products are walked in pk ranges of RECONCILE_CHUNK_SIZE; each range costs
+three grouped queries (products, ledger sums, batch sums), so the run stays
+flat in memory however long the history is.
+
+A product is reported when its quantity differs from the ledger, or its
+batches hold more than its quantity. Each run and its variances are stored
+(ReconciliationRun / StockVariance).
+
+The only fix, "ledger", writes one "Inventory Adjustment" row per variance
+so the ledger agrees with the stock on the shelf. Stock itself is never
+set from the ledger: product create / update records the product's whole
+quantity as "Stock In" (a snapshot, not a delta), so the ledger total
+overstates any product edited that way. Fix runs lock each chunk's
+products like checkout does, so a sale cannot slip in between reading the
+stock and adjusting the ledger.
+"""
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Sum, Count, Case, When, F, Q, IntegerField
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from products.models import Product, ProductBatch, StockHistory
+from products.references import assign_references
+from sales.stock import IMBALANCE_NOTE
+from .models import ReconciliationRun, StockVariance
+
+FIX_MODES = ('ledger',)
+
+
+def _chunk_size():
+    return getattr(settings, "RECONCILE_CHUNK_SIZE", 5000)
+
+
+def _signed_quantity():
+    return Case(
+        When(action='Sold', then=-F('quantity')),
+        default=F('quantity'),
+        output_field=IntegerField(),
+    )
+
+
+def _product_chunks():
+    """(first_pk, last_pk) ranges of at most RECONCILE_CHUNK_SIZE products."""
+    size = _chunk_size()
+    last = 0
+    while True:
+        pks = list(Product.objects.filter(pk__gt=last).order_by('pk').values_list('pk', flat=True)[:size])
+        if not pks:
+            return
+        yield pks[0], pks[-1]
+        last = pks[-1]
+
+
+def _check_chunk(run, first, last, lock):
+    """Variances for products with pk in [first, last]; unsaved StockVariance objects."""
+    products = Product.objects.filter(pk__gte=first, pk__lte=last)
+    if lock:
+        products = products.select_for_update().order_by('pk')
+    stock = {pk: (name, quantity) for pk, name, quantity in products.values_list('pk', 'name', 'quantity')}
+
+    ledger = {
+        row['product_id']: row
+        for row in StockHistory.objects.filter(product_id__gte=first, product_id__lte=last)
+        .values('product_id')
+        .annotate(
+            total=Coalesce(Sum(_signed_quantity()), 0),
+            imbalanced=Count('pk', filter=Q(action='Sold', notes__endswith=IMBALANCE_NOTE)),
+        )
+        .order_by()
+    }
+    batches = dict(
+        ProductBatch.objects.filter(product_id__gte=first, product_id__lte=last)
+        .values('product_id')
+        .annotate(total=Sum('quantity_left'))
+        .order_by()
+        .values_list('product_id', 'total')
+    )
+
+    variances = []
+    for pk, (name, quantity) in stock.items():
+        entry = ledger.get(pk, {'total': 0, 'imbalanced': 0})
+        batch_quantity = batches.get(pk)
+        batch_variance = None if batch_quantity is None else quantity - batch_quantity
+        if quantity == entry['total'] and (batch_variance is None or batch_variance >= 0):
+            continue
+        variances.append(StockVariance(
+            run=run,
+            product_id=pk,
+            product_name=name,
+            quantity=quantity,
+            ledger_quantity=entry['total'],
+            batch_quantity=batch_quantity,
+            ledger_variance=quantity - entry['total'],
+            batch_variance=batch_variance,
+            imbalance_sales=entry['imbalanced'],
+        ))
+    return len(stock), variances
+
+
+def _fix_ledger(variances, run, user):
+    adjustments = [
+        StockHistory(
+            product_id=variance.product_id,
+            action='Inventory Adjustment',
+            quantity=variance.ledger_variance,
+            action_by=user,
+            notes=f"Reconciliation #{run.pk}: ledger adjusted to stock",
+        )
+        for variance in variances if variance.ledger_variance
+    ]
+    StockHistory.objects.bulk_create(assign_references(adjustments))
+    return {adjustment.product_id for adjustment in adjustments}
+
+
+def reconcile_stock(fix=None, user=None):
+    """Run a reconciliation, optionally fixing what it finds. Returns the ReconciliationRun."""
+    if fix is not None and fix not in FIX_MODES:
+        raise ValueError(f"Unknown reconciliation fix: {fix}")
+
+    run = ReconciliationRun.objects.create(run_by=user, fix=fix or '')
+    checked = found = 0
+    for first, last in _product_chunks():
+        with transaction.atomic():
+            count, variances = _check_chunk(run, first, last, lock=fix is not None)
+            fixed = _fix_ledger(variances, run, user) if fix == 'ledger' else set()
+            for variance in variances:
+                variance.fixed = variance.product_id in fixed
+            StockVariance.objects.bulk_create(variances)
+        checked += count
+        found += len(variances)
+
+    run.products_checked = checked
+    run.variance_count = found
+    run.finished_at = timezone.now()
+    run.save(update_fields=['products_checked', 'variance_count', 'finished_at'])
+    return run
@@ -0,0 +1,133 @@
+"""
+Reorder report: what to buy, from whom, before it runs out.
+
+Daily sales velocity per product comes from the cashier daily product
+rollups (one grouped query over REORDER_VELOCITY_DAYS days, backfilled by
+`manage.py rebuild_cashier_summaries`), so the raw sales are never scanned.
+Stock, thresholds and velocities are then turned into days of cover and
+suggested order quantities with NumPy for the whole catalog at once:
+
+    velocity      = units sold in the window / window days
+    days_of_cover = quantity / velocity                (inf when nothing sells)
+    target        = velocity * (lead time + cover days) + min_stock_threshold
+    reorder_qty   = ceil(target - quantity), when positive
+
+A product is on the report when its cover runs out within the supplier
+lead time or it is at/below its min_stock_threshold. Each row names the
+supplier the product was last supplied by. The report is cached for
+REORDER_CACHE_SECONDS.
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Sum
+from django.utils import timezone
+
+from products.models import Product, SupplierProductSupply
+from sales.models import CashierDailyProductTotal
+
+try:
+    import numpy as np
+except ImportError:  # optional, the reorder report is unavailable without it
+    np = None
+
+REPORT_CACHE_KEY = "inventory:reorder_report"
+
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+
+def _velocity_by_product(since):
+    rows = (
+        CashierDailyProductTotal.objects.filter(summary__date__gte=since)
+        .values('product_id')
+        .annotate(sold=Sum('quantity'))
+        .order_by()
+    )
+    return {row['product_id']: row['sold'] or 0 for row in rows.iterator()}
+
+
+def _last_suppliers():
+    """{product_id: (supplier_id, supplier_name)} of each product's latest supply."""
+    suppliers = {}
+    rows = SupplierProductSupply.objects.order_by('product_id', '-supply_date', '-id').values_list(
+        'product_id', 'supplier_id', 'supplier__name'
+    )
+    for product_id, supplier_id, supplier_name in rows.iterator(chunk_size=5000):
+        suppliers.setdefault(product_id, (supplier_id, supplier_name))
+    return suppliers
+
+
+def build_reorder_report(today=None):
+    """
+    Compute the report for every active product. Returns
+    {"generated_at", "window_days", "lead_time_days", "cover_days", "rows"}
+    with rows ordered by days of cover (soonest to run out first).
+    """
+    if np is None:
+        raise ValueError("numpy is not installed.")
+
+    today = today or timezone.localdate()
+    window = _setting("REORDER_VELOCITY_DAYS", 90)
+    lead_time = _setting("REORDER_LEAD_TIME_DAYS", 7)
+    cover_days = _setting("REORDER_COVER_DAYS", 14)
+
+    sold = _velocity_by_product(today - timedelta(days=window - 1))
+    products = list(
+        Product.objects.filter(status='active').values_list(
+            'id', 'product_code', 'name', 'quantity', 'min_stock_threshold', 'unit_buying_price'
+        ).iterator(chunk_size=5000)
+    )
+    report = {
+        "generated_at": timezone.now().isoformat(),
+        "window_days": window,
+        "lead_time_days": lead_time,
+        "cover_days": cover_days,
+        "rows": [],
+    }
+    if not products:
+        return report
+
+    ids = np.fromiter((p[0] for p in products), dtype=np.int64, count=len(products))
+    quantity = np.fromiter((p[3] for p in products), dtype=np.float64, count=len(products))
+    threshold = np.fromiter((p[4] or 0 for p in products), dtype=np.float64, count=len(products))
+    units_sold = np.fromiter((sold.get(pk, 0) for pk in ids.tolist()), dtype=np.float64, count=len(products))
+
+    velocity = units_sold / window
+    with np.errstate(divide='ignore', invalid='ignore'):
+        days_of_cover = np.where(velocity > 0, quantity / velocity, np.inf)
+    target = velocity * (lead_time + cover_days) + threshold
+    reorder_qty = np.ceil(np.maximum(target - quantity, 0)).astype(np.int64)
+    flagged = ((days_of_cover <= lead_time) | (quantity <= threshold)) & (reorder_qty > 0)
+
+    suppliers = _last_suppliers()
+    order = np.argsort(days_of_cover[flagged], kind='stable')
+    for index in np.flatnonzero(flagged)[order].tolist():
+        product_id, code, name, stock, min_threshold, buying_price = products[index]
+        supplier_id, supplier_name = suppliers.get(product_id, (None, None))
+        cover = days_of_cover[index]
+        report["rows"].append({
+            "product_id": product_id,
+            "product_code": code,
+            "name": name,
+            "quantity": stock,
+            "min_stock_threshold": min_threshold,
+            "daily_velocity": round(float(velocity[index]), 3),
+            "days_of_cover": None if np.isinf(cover) else round(float(cover), 1),
+            "reorder_quantity": int(reorder_qty[index]),
+            "estimated_cost": float((buying_price or 0) * int(reorder_qty[index])),
+            "supplier_id": supplier_id,
+            "supplier_name": supplier_name,
+        })
+    return report
+
+
+def get_reorder_report(refresh=False):
+    """The cached report, rebuilt when missing, expired or `refresh` is set."""
+    report = None if refresh else cache.get(REPORT_CACHE_KEY)
+    if report is None:
+        report = build_reorder_report()
+        cache.set(REPORT_CACHE_KEY, report, timeout=_setting("REORDER_CACHE_SECONDS", 15 * 60))
+    return report
@@ -2,7 +2,7 @@ from rest_framework import serializers
 from django.db.models import Sum
 from django.utils.timezone import now
 from calendar import monthrange
-from .models import InventoryWriteOff
+from .models import InventoryWriteOff, ReconciliationRun, StockVariance
 from django.db.models import F
 from products.models import Product
 from django.db.models import Q
@@ -76,8 +76,8 @@ class ProductSerializerCal(serializers.Serializer):
             total=Sum(F('quantity') * (F('unit_price') + F('vat_value')))
         )['total'] or 0
 
-        # Losses from ExpiringProduct
-        expiring_loss = ExpiringProduct.objects.aggregate(
+        # Losses from ExpiringProduct (scanner proposals are not slashed yet)
+        expiring_loss = ExpiringProduct.objects.filter(is_proposal=False).aggregate(
             total=Sum(F('loss_value') * F('quantity'))
         )['total'] or 0
 
@@ -100,23 +100,13 @@ class ProductSerializerCal(serializers.Serializer):
 
 
     def get_low_stock_products(self, obj):
-        products = Product.objects.filter(
+        # Plain rows, no model instances; see reorder-report/ for velocity-based reordering
+        return list(Product.objects.filter(
             quantity__lte=F('min_stock_threshold'),
             quantity__gt=0  # exclude products with 0 stock
-        )
-
-        return [
-            {
-                "id": p.id,
-                "name": p.name,
-                "quantity": p.quantity,
-                "min_stock_threshold": p.min_stock_threshold,
-                "unit_price": p.unit_price,
-                "unit_buying_price": p.unit_buying_price,
-                "description": p.description
-            }
-            for p in products
-        ]
+        ).values(
+            'id', 'name', 'quantity', 'min_stock_threshold', 'unit_price', 'unit_buying_price', 'description'
+        ))
         
 
     def get_out_of_stock_products(self, obj):
@@ -372,3 +362,19 @@ class WriteOffSerializerCal(serializers.Serializer):
             for item in expired_items
         ]
 
+
+class ReconciliationRunSerializer(serializers.ModelSerializer):
+    run_by_name = serializers.CharField(source='run_by.username', default=None, read_only=True)
+
+    class Meta:
+        model = ReconciliationRun
+        fields = ['id', 'started_at', 'finished_at', 'run_by_name', 'fix', 'products_checked', 'variance_count']
+
+
+class StockVarianceSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = StockVariance
+        fields = [
+            'id', 'product', 'product_name', 'quantity', 'ledger_quantity', 'ledger_variance',
+            'batch_quantity', 'batch_variance', 'imbalance_sales', 'fixed',
+        ]
@@ -1,3 +1,78 @@
-from django.test import TestCase
+from decimal import Decimal
+from unittest import skipIf
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from products.models import Product, StockHistory, Supplier, SupplierProductSupply, Unit
+from sales.models import CashierDailySummary, CashierDailyProductTotal
+from price_slash.models import ExpiringProduct
+from .reconcile import reconcile_stock
+from .serializers import ProductSerializerCal
+from .reorder import build_reorder_report, np
+
+
+@skipIf(np is None, "numpy is not installed")
+@override_settings(REORDER_VELOCITY_DAYS=90, REORDER_LEAD_TIME_DAYS=7, REORDER_COVER_DAYS=14)
+class ReorderReportTests(TestCase):
+
+    def test_fast_seller_is_reordered_from_its_supplier(self):
+        unit = Unit.objects.create(name="jar")
+        fast, slow = (
+            Product.objects.create(
+                product_code=code, name=code, description=code, quantity=quantity, min_stock_threshold=2,
+                unit_buying_price=Decimal("10.00"), unit_price=Decimal("15.00"), unit=unit,
+            )
+            for code, quantity in (("FAST", 5), ("SLOW", 10))
+        )
+        supplier = Supplier.objects.create(name="Wholesale")
+        SupplierProductSupply.objects.create(supplier=supplier, product=fast, quantity_supplied=20)
+        summary = CashierDailySummary.objects.create(
+            staff=User.objects.create_user(username="seller", password="pass"), date=timezone.localdate()
+        )
+        CashierDailyProductTotal.objects.create(summary=summary, product=fast, product_name="FAST", quantity=90)
+
+        rows = build_reorder_report()["rows"]
+
+        self.assertEqual([row["product_code"] for row in rows], ["FAST"])
+        self.assertEqual((rows[0]["days_of_cover"], rows[0]["reorder_quantity"]), (5.0, 18))
+        self.assertEqual((rows[0]["supplier_name"], rows[0]["estimated_cost"]), ("Wholesale", 180.0))
+
+
+class StockReconciliationTests(TestCase):
+
+    def test_variance_is_reported_and_ledger_fix_balances_it(self):
+        product = Product.objects.create(
+            product_code="RECON", name="Recon", description="Recon", quantity=5, min_stock_threshold=1,
+            unit_buying_price=Decimal("10.00"), unit_price=Decimal("15.00"), unit=Unit.objects.create(name="box"),
+        )
+        StockHistory.objects.create(product=product, action='Stock In', quantity=10)
+        StockHistory.objects.create(product=product, action='Sold', quantity=3)
+
+        run = reconcile_stock()
+        variance = run.variances.get()
+        self.assertEqual((run.products_checked, run.variance_count), (1, 1))
+        self.assertEqual((variance.ledger_quantity, variance.ledger_variance, variance.fixed), (7, -2, False))
+
+        fixed = reconcile_stock(fix='ledger')
+        self.assertTrue(fixed.variances.get().fixed)
+        self.assertEqual(
+            StockHistory.objects.get(product=product, action='Inventory Adjustment').quantity, -2
+        )
+        self.assertEqual(reconcile_stock().variance_count, 0)
+
+
+class InventoryValueTests(TestCase):
+
+    def test_scanner_proposals_are_not_counted_as_losses(self):
+        product = Product.objects.create(
+            product_code="VAL", name="Value", description="Value", quantity=4, min_stock_threshold=1,
+            unit_buying_price=Decimal("10.00"), markup_percentage=Decimal("50"), unit=Unit.objects.create(name="bag"),
+        )
+        ExpiringProduct.objects.create(
+            product=product, product_code="VAL", product_name="Value", initial_unit_price=Decimal("15.00"),
+            resale_price=Decimal("10.00"), quantity=2, is_proposal=True,
+        )
+
+        self.assertEqual(ProductSerializerCal().get_product_total_value(None), 60.0)
@@ -1,9 +1,11 @@
 # inventory_writeoffs/urls.py
 from django.urls import path
-from .views import inventory_writeoff_list, inventory_dashboard
+from .views import inventory_writeoff_list, inventory_dashboard, reorder_report, stock_reconciliation
 
 urlpatterns = [
     path('write-offs/', inventory_writeoff_list, name='inventory-writeoff-list'),
     path('inventory-dashboard/', inventory_dashboard, name='inventory-writeoff-list'),
+    path('reorder-report/', reorder_report, name='reorder-report'),
+    path('reconciliation/', stock_reconciliation, name='stock-reconciliation'),
     
 ]
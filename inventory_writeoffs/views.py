@@ -12,8 +12,11 @@ from rest_framework.pagination import PageNumberPagination
 from rest_framework.response import Response
 from django.db.models import Q
 from datetime import datetime, time
-from .models import InventoryWriteOff
-from .serializers import InventoryWriteOffSerializer
+from django.shortcuts import get_object_or_404
+from .models import InventoryWriteOff, ReconciliationRun
+from .serializers import InventoryWriteOffSerializer, ReconciliationRunSerializer, StockVarianceSerializer
+from .reorder import get_reorder_report
+from .reconcile import reconcile_stock, FIX_MODES
 
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
@@ -68,3 +71,73 @@ def inventory_dashboard(request):
     combined_data = {**product_data, **writeoff_data}
     return Response(combined_data)
 
+
+@api_view(["GET"])
+@permission_classes([IsAuthenticated])
+def reorder_report(request):
+    """
+    Products to reorder, soonest to run out first, 100 per page.
+    ?supplier=<id> narrows it to one supplier, ?refresh=1 recomputes it.
+    """
+    try:
+        report = get_reorder_report(refresh=request.query_params.get('refresh') == '1')
+    except ValueError as e:
+        return Response({"error": str(e)}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+
+    rows = report["rows"]
+    supplier = request.query_params.get('supplier')
+    if supplier:
+        rows = [row for row in rows if str(row["supplier_id"]) == supplier]
+
+    # Order totals per supplier, over every page
+    suppliers = {}
+    for row in rows:
+        totals = suppliers.setdefault(row["supplier_id"], {
+            "supplier_id": row["supplier_id"], "supplier_name": row["supplier_name"],
+            "products": 0, "estimated_cost": 0.0,
+        })
+        totals["products"] += 1
+        totals["estimated_cost"] += row["estimated_cost"]
+
+    paginator = PageNumberPagination()
+    paginator.page_size = 100
+    page = paginator.paginate_queryset(rows, request)
+    response = paginator.get_paginated_response(page)
+    for key in ("generated_at", "window_days", "lead_time_days", "cover_days"):
+        response.data[key] = report[key]
+    response.data["suppliers"] = list(suppliers.values())
+    return response
+
+
+@api_view(["GET", "POST"])
+@permission_classes([IsAuthenticated])
+def stock_reconciliation(request):
+    """
+    GET: the latest reconciliation run (or ?run=<id>) with its variances,
+    100 per page. POST: run one now; {"fix": "ledger"} also
+    books what it finds as ledger adjustments (staff only). Nightly runs use
+    `manage.py reconcile_stock`.
+    """
+    if request.method == "POST":
+        fix = request.data.get("fix") or None
+        if fix is not None and fix not in FIX_MODES:
+            return Response({"fix": f"Must be one of: {', '.join(FIX_MODES)}."}, status=status.HTTP_400_BAD_REQUEST)
+        if fix is not None and not request.user.is_staff:
+            return Response({"error": "Only staff can apply reconciliation fixes."}, status=status.HTTP_403_FORBIDDEN)
+        run = reconcile_stock(fix=fix, user=request.user)
+        return Response(ReconciliationRunSerializer(run).data, status=status.HTTP_201_CREATED)
+
+    run_id = request.query_params.get("run")
+    if run_id:
+        run = get_object_or_404(ReconciliationRun, pk=run_id)
+    else:
+        run = ReconciliationRun.objects.filter(finished_at__isnull=False).first()
+        if run is None:
+            return Response({"run": None, "results": []})
+
+    paginator = PageNumberPagination()
+    paginator.page_size = 100
+    page = paginator.paginate_queryset(run.variances.all(), request)
+    response = paginator.get_paginated_response(StockVarianceSerializer(page, many=True).data)
+    response.data["run"] = ReconciliationRunSerializer(run).data
+    return response
@@ -1,5 +1,6 @@
 from django.contrib import admin
-from .models import ExpiringProduct, DamageProduct
+from .models import ExpiringProduct, DamageProduct, ExpiryScanRun
+from .scanner import approve_proposals
 from django.utils import timezone
 
 
@@ -36,7 +37,25 @@ class BaseProductAdmin(admin.ModelAdmin):
 
 @admin.register(ExpiringProduct)
 class ExpiringProductAdmin(BaseProductAdmin):
-    pass
+    list_filter = ("is_proposal", "is_approved")
+    actions = ["approve_selected"]
+
+    @admin.action(description="Approve selected expiry proposals")
+    def approve_selected(self, request, queryset):
+        approved = approve_proposals(request.user, list(queryset.values_list('pk', flat=True)))
+        self.message_user(request, f"{approved} proposal(s) approved.")
+
+
+@admin.register(ExpiryScanRun)
+class ExpiryScanRunAdmin(admin.ModelAdmin):
+    list_display = ("scan_date", "started_at", "batches_scanned", "proposals_created")
+    ordering = ("-started_at",)
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
 
 
 @admin.register(DamageProduct)
@@ -0,0 +1,39 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from price_slash.scanner import scan_expiring_batches
+
+
+class Command(BaseCommand):
+    help = "Propose price slashes for expiring stock, once or on a fixed interval (nightly by default)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--interval", type=float, default=86400.0, help="Seconds between scans")
+        parser.add_argument("--once", action="store_true", help="Scan once and exit")
+        parser.add_argument("--full", action="store_true", help="Ignore the last run and scan every expiring batch")
+
+    def report(self, run):
+        return f"Scanned {run.batches_scanned} batch(es), proposed {run.proposals_created} price slash(es)"
+
+    def handle(self, *args, **options):
+        if options["once"]:
+            run = scan_expiring_batches(full=options["full"])
+            self.stdout.write(self.style.SUCCESS(self.report(run)))
+            return
+
+        self.stdout.write("Expiry scanner started")
+        full = options["full"]
+        try:
+            while True:
+                close_old_connections()
+                try:
+                    self.stdout.write(self.report(scan_expiring_batches(full=full)))
+                    full = False
+                except Exception as e:
+                    # Keep the schedule alive, the next run picks up from the last good one
+                    self.stderr.write(f"Expiry scan failed: {e}")
+                time.sleep(options["interval"])
+        except KeyboardInterrupt:
+            self.stdout.write("Expiry scanner stopped")
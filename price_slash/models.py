@@ -1,11 +1,13 @@
 from django.db import models
 from django.contrib.auth.models import User
 from products.models import Product
-import uuid
-from django.db import IntegrityError
+from products.references import next_reference
+from products.catalog import stamp_on_commit
 
 
 class ExpiringProduct(models.Model):
+    REFERENCE_PREFIX = "ExpiringProduct"
+
     reference = models.CharField(max_length=100, unique=True, editable=False, blank=True)
     product = models.ForeignKey(Product, on_delete=models.CASCADE)
     product_code = models.CharField(max_length=100, editable=False, unique=True)
@@ -28,6 +30,10 @@ class ExpiringProduct(models.Model):
     note = models.TextField(blank=True, null=True)
     description = models.TextField(editable=False, blank=True, null=True)
     is_approved = models.BooleanField(default=False)
+    # Suggested by the expiry scanner and not yet approved: kept off the tills
+    is_proposal = models.BooleanField(default=False, editable=False)
+    # Stamped after every change; tills sync the catalog with ?since=<version>
+    catalog_version = models.BigIntegerField(default=0, null=True, db_index=True, editable=False)
 
     class Meta:
         ordering = ['-created_date']
@@ -56,20 +62,18 @@ class ExpiringProduct(models.Model):
             self.last_updated_name = self.last_updated_by.get_full_name() or self.last_updated_by.username
 
         if not self.reference:
-            for _ in range(10): 
-                ref = f"ExpiringProduct-{uuid.uuid4().hex[:12]}"
-                if not ExpiringProduct.objects.filter(reference=ref).exists():
-                    self.reference = ref
-                    break
-            else:
-                raise IntegrityError("Could not generate unique product reference")
+            self.reference = next_reference(self.REFERENCE_PREFIX)
+        self.catalog_version = None
         super().save(*args, **kwargs)
+        stamp_on_commit()
 
     def __str__(self):
         return f"{self.product_name} ({self.product_code})"
 
 
 class DamageProduct(models.Model):
+    REFERENCE_PREFIX = "DamageProduct"
+
     reference = models.CharField(max_length=100, unique=True, editable=False, blank=True)
     product = models.ForeignKey(Product, on_delete=models.CASCADE)
     product_code = models.CharField(max_length=100, unique=True, editable=False)
@@ -93,6 +97,7 @@ class DamageProduct(models.Model):
 
     note = models.TextField(blank=True, null=True)
     description = models.TextField(editable=False, blank=True, null=True)
+    catalog_version = models.BigIntegerField(default=0, null=True, db_index=True, editable=False)
 
     class Meta:
         ordering = ['-created_date']
@@ -120,15 +125,25 @@ class DamageProduct(models.Model):
             return
 
         if not self.reference:
-            for _ in range(10): 
-                ref = f"DamageProduct-{uuid.uuid4().hex[:12]}"
-                if not DamageProduct.objects.filter(reference=ref).exists():
-                    self.reference = ref
-                    break
-            else:
-                raise IntegrityError("Could not generate unique product reference")
+            self.reference = next_reference(self.REFERENCE_PREFIX)
 
+        self.catalog_version = None
         super().save(*args, **kwargs)
+        stamp_on_commit()
 
     def __str__(self):
         return f"{self.product_name} ({self.product_code})"
+
+
+class ExpiryScanRun(models.Model):
+    """One run of the expiry scanner; the next run only looks at what changed since."""
+    scan_date = models.DateField()
+    started_at = models.DateTimeField()
+    batches_scanned = models.PositiveIntegerField(default=0)
+    proposals_created = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        ordering = ['-started_at']
+
+    def __str__(self):
+        return f"Expiry scan {self.scan_date}: {self.proposals_created} proposal(s)"
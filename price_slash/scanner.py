@@ -0,0 +1,160 @@
+"""
+Expiry scanner: proposes price slashes for stock close to its expiry date.
+
+Each run range-scans ProductBatch on expiry_date (see
+ProductBatchQuerySet.expiry_alerts) and only keeps batches whose status can
+have changed since the previous ExpiryScanRun:
+
+- batches that became "expired" or entered their expiry window since then;
+- batches edited since then (quantity, dates or threshold changed).
+
+Products with such batches and no ExpiringProduct row get a pending
+proposal (is_approved=False, is_proposal=True) priced by
+EXPIRY_MARKDOWN_RULES. Proposals stay off the tills until a manager
+approves them with approve_proposals().
+"""
+from decimal import Decimal, ROUND_HALF_UP
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from products.catalog import stamp_on_commit, broadcast_catalog_change
+from products.models import ProductBatch
+from products.references import assign_references
+from sales.pricing import invalidate_price_table
+from .models import ExpiringProduct, ExpiryScanRun
+
+SCANNER_NAME = "Expiry scanner"
+DEFAULT_MARKDOWN_RULES = [(0, 50), (3, 30), (7, 20), (14, 10)]
+
+
+def markdown_percent(days_to_expiry):
+    """Percent off for stock `days_to_expiry` days from expiry (negative: expired)."""
+    rules = sorted(getattr(settings, "EXPIRY_MARKDOWN_RULES", DEFAULT_MARKDOWN_RULES))
+    for max_days, percent in rules:
+        if days_to_expiry <= max_days:
+            return Decimal(str(percent))
+    # Inside a batch's own expiry window but past the last rule
+    return Decimal(str(rules[-1][1]))
+
+
+def suggested_price(unit_price, days_to_expiry):
+    price = (unit_price * (100 - markdown_percent(days_to_expiry)) / 100).quantize(
+        Decimal("0.01"), rounding=ROUND_HALF_UP
+    )
+    return max(price, Decimal("0.01"))
+
+
+def _changed_batches(today, last_run):
+    """In-stock expired / expiring batches whose status can have changed since `last_run`."""
+    alerts = ProductBatch.objects.expiry_alerts(today).select_related('product')
+    if last_run is None:
+        return list(alerts)
+
+    # Newly expired: still in date on the last scan day. Newly expiring: was
+    # further out than its threshold on the last scan day.
+    gap = (today - last_run.scan_date).days
+    newly = alerts.filter(expiry_date__gte=last_run.scan_date).filter(
+        Q(expiry_status="expired")
+        | Q(expiry_status="expiring", days_to_expiry__gt=F('expiry_min_threshold_days') - gap)
+    )
+    edited = alerts.filter(updated_at__gte=last_run.started_at)
+
+    batches = {batch.pk: batch for batch in newly}
+    batches.update((batch.pk, batch) for batch in edited)
+    return list(batches.values())
+
+
+def _proposals(batches, user=None):
+    """One unsaved ExpiringProduct per product, covering all its flagged batches."""
+    by_product = {}
+    for batch in batches:
+        by_product.setdefault(batch.product_id, []).append(batch)
+
+    product_codes = {group[0].product.product_code for group in by_product.values()}
+    taken = set(
+        ExpiringProduct.objects.filter(product_code__in=product_codes).values_list('product_code', flat=True)
+    )
+
+    proposals = []
+    for group in by_product.values():
+        product = group[0].product
+        if product.product_code in taken or not product.unit_price:
+            continue
+        soonest = min(batch.days_to_expiry for batch in group)
+        quantity = sum(batch.quantity_left for batch in group)
+        resale_price = suggested_price(product.unit_price, soonest)
+        batch_list = ", ".join(f"{b.batch_number} ({b.expiry_date})" for b in group)
+        proposals.append(ExpiringProduct(
+            product=product,
+            product_code=product.product_code,
+            product_name=product.name,
+            initial_unit_price=product.unit_price,
+            resale_price=resale_price,
+            quantity=quantity,
+            loss_value=(product.unit_price - resale_price) * quantity,
+            staff=user,
+            staff_name=SCANNER_NAME,
+            description=product.description + " (EP)",
+            note=f"{markdown_percent(soonest)}% markdown proposed for batches {batch_list}",
+            is_approved=False,
+            is_proposal=True,
+        ))
+    return proposals
+
+
+def scan_expiring_batches(today=None, full=False, user=None):
+    """
+    Run one scan and record it. `full` ignores the previous run and looks at
+    every expired / expiring batch. Returns the ExpiryScanRun.
+    """
+    started_at = timezone.now()
+    today = today or started_at.date()
+    last_run = None if full else ExpiryScanRun.objects.first()
+
+    batches = _changed_batches(today, last_run)
+    proposals = _proposals(batches, user)
+
+    with transaction.atomic():
+        if proposals:
+            for proposal in proposals:
+                proposal.catalog_version = None
+            assign_references(proposals)
+            # A product slashed by hand meanwhile keeps its row
+            ExpiringProduct.objects.bulk_create(proposals, batch_size=500, ignore_conflicts=True)
+            stamp_on_commit()
+        return ExpiryScanRun.objects.create(
+            scan_date=today,
+            started_at=started_at,
+            batches_scanned=len(batches),
+            proposals_created=len(proposals),
+        )
+
+
+def approve_proposals(user, ids=None):
+    """
+    Approve pending proposals (all of them, or the given ids) in one UPDATE
+    and publish them to the tills with one catalog change. Returns the count.
+    """
+    with transaction.atomic():
+        pending = ExpiringProduct.objects.select_for_update().filter(is_proposal=True)
+        if ids is not None:
+            pending = pending.filter(pk__in=ids)
+        approved = list(pending.values_list('pk', flat=True))
+        if not approved:
+            return 0
+
+        ExpiringProduct.objects.filter(pk__in=approved).update(
+            is_proposal=False,
+            is_approved=True,
+            catalog_version=None,
+            last_updated_by=user,
+            last_updated_name=user.get_full_name() or user.username,
+            updated_date=timezone.now(),
+        )
+        invalidate_price_table()
+        transaction.on_commit(invalidate_price_table)
+        broadcast_catalog_change(len(approved))
+    return len(approved)
@@ -49,7 +49,16 @@ class ExpiringProductSerializer(serializers.ModelSerializer):
             }
         )
 
-        if not created:
+        if not created and expiring_obj.is_proposal:
+            # A manual slash replaces the scanner's pending proposal
+            expiring_obj.quantity = validated_data['quantity']
+            expiring_obj.resale_price = validated_data['resale_price']
+            expiring_obj.is_proposal = False
+            expiring_obj.last_updated_by = user
+            expiring_obj.note = validated_data['note']
+            expiring_obj.updated_date = timezone.now()
+            expiring_obj.save()
+        elif not created:
             # Aggregate quantity
             expiring_obj.resale_price = validated_data.get('resale_price', expiring_obj.resale_price)
             expiring_obj.quantity += validated_data.get('quantity', 0)
@@ -138,6 +147,11 @@ class ExpiringProductViewSerializer(serializers.ModelSerializer):
         ]
 
 
+class ProposalApprovalSerializer(serializers.Serializer):
+    """Proposal ids to approve; all pending proposals when omitted."""
+    ids = serializers.ListField(child=serializers.IntegerField(min_value=1), required=False, allow_empty=False)
+
+
 class DamageProductViewSerializer(serializers.ModelSerializer):
     class Meta:
         model = DamageProduct
@@ -3,6 +3,7 @@ from django.dispatch import receiver
 from asgiref.sync import async_to_sync
 from channels.layers import get_channel_layer
 from .models import ExpiringProduct, DamageProduct
+from products.catalog import add_tombstone
 import json
 
 def broadcast_update(data):
@@ -64,3 +65,13 @@ def damaged_product_changed(sender, instance, created, **kwargs):
 @receiver(post_delete, sender=DamageProduct)
 def damaged_product_deleted(sender, instance, **kwargs):
     broadcast_update({"id": instance.id, "type": "damaged", "deleted": True})
+
+
+# --- Catalog tombstones (inside the delete transaction) ---
+@receiver(post_delete, sender=ExpiringProduct)
+def expiring_product_tombstone(sender, instance, **kwargs):
+    add_tombstone('expiring', instance.id)
+
+@receiver(post_delete, sender=DamageProduct)
+def damaged_product_tombstone(sender, instance, **kwargs):
+    add_tombstone('damaged', instance.id)
@@ -1,3 +1,48 @@
-from django.test import TestCase
+from datetime import timedelta
+from decimal import Decimal
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from products.models import Product, ProductBatch, Unit
+from sales.pricing import get_price_table, invalidate_price_table
+from .models import ExpiringProduct
+from .scanner import scan_expiring_batches, approve_proposals
+
+
+IN_MEMORY_LAYERS = {"default": {"BACKEND": "channels.layers.InMemoryChannelLayer"}}
+
+
+@override_settings(CHANNEL_LAYERS=IN_MEMORY_LAYERS, EXPIRY_MARKDOWN_RULES=[(0, 50), (7, 30)])
+class ExpiryScannerTests(TestCase):
+
+    def test_scan_proposes_once_and_approval_publishes(self):
+        user = User.objects.create_user(username="manager", password="pass")
+        unit = Unit.objects.create(name="crate")
+        product = Product.objects.create(
+            product_code="EXP-1", name="Yoghurt", description="Yoghurt", quantity=20, min_stock_threshold=1,
+            unit_buying_price=Decimal("60.00"), unit_price=Decimal("100.00"), unit=unit,
+        )
+        today = timezone.now().date()
+        for number, days in (("Y-1", 3), ("Y-2", 5), ("Y-3", 40)):
+            ProductBatch.objects.create(
+                product=product, batch_number=number, quantity_left=4, created_by=user,
+                expiry_date=today + timedelta(days=days), expiry_min_threshold_days=7,
+            )
+
+        first = scan_expiring_batches(today)
+        second = scan_expiring_batches(today)
+
+        self.assertEqual((first.batches_scanned, first.proposals_created), (2, 1))
+        self.assertEqual(second.proposals_created, 0)
+        proposal = ExpiringProduct.objects.get(product=product)
+        self.assertEqual((proposal.resale_price, proposal.quantity), (Decimal("70.00"), 8))
+        self.assertTrue(proposal.is_proposal)
+
+        invalidate_price_table()
+        self.assertIsNone(get_price_table().get('expiring', proposal.pk))
+
+        self.assertEqual(approve_proposals(user), 1)
+        invalidate_price_table()
+        self.assertIsNotNone(get_price_table().get('expiring', proposal.pk))
@@ -6,4 +6,6 @@ urlpatterns = [
     path('damaging/', slash_damaging_product, name='slash-damaging'),
     path('expiring/', slash_expiring_product, name='slash-expiring'),
     path('expiring-damage-products/', views.expiring_damaged_products, name='expiring_damaged_products'),
+    path('expiry-proposals/', views.expiry_proposals, name='expiry-proposals'),
+    path('expiry-proposals/approve/', views.approve_expiry_proposals, name='approve-expiry-proposals'),
 ]
\ No newline at end of file
@@ -12,6 +12,8 @@ from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
 from .models import ExpiringProduct, DamageProduct
 from .serializers import ExpiringProductViewSerializer, DamageProductViewSerializer
+from .serializers import ProposalApprovalSerializer
+from .scanner import approve_proposals
 
 
 
@@ -45,7 +47,7 @@ def expiring_damaged_products(request):
     Returns all expiring and damaged products, ordered by creation date.
     """
     # Fetch all expiring products
-    expiring_products = ExpiringProduct.objects.all().order_by('-created_date')
+    expiring_products = ExpiringProduct.objects.filter(is_proposal=False).order_by('-created_date')
     # Fetch all damaged products
     damaged_products = DamageProduct.objects.all().order_by('-created_date')
 
@@ -61,3 +63,21 @@ def expiring_damaged_products(request):
         "summary": summary
     })
 
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def expiry_proposals(request):
+    """Price slashes proposed by the expiry scanner and waiting for approval."""
+    proposals = ExpiringProduct.objects.filter(is_proposal=True).order_by('-created_date')
+    return Response(ExpiringProductViewSerializer(proposals, many=True).data)
+
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def approve_expiry_proposals(request):
+    """Approve the given proposals (or all pending ones) and publish them to the tills."""
+    serializer = ProposalApprovalSerializer(data=request.data)
+    if not serializer.is_valid():
+        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+    approved = approve_proposals(request.user, serializer.validated_data.get('ids'))
+    return Response({"approved": approved}, status=status.HTTP_200_OK)
@@ -1,7 +1,7 @@
 from django.contrib import admin
 from .models import StockHistory, ProductBatch, SupplierProductSupply, SupplierProductSupply
 from django.utils.html import format_html
-from .models import Product, Category, Supplier, Unit
+from .models import Product, Category, Supplier, Unit, ProductImageJob
 from django.utils import timezone
 today = timezone.now().date()
 
@@ -228,3 +228,19 @@ class SupplierProductSupplyAdmin(admin.ModelAdmin):
     ordering = ("-supply_date",)
 
 
+@admin.register(ProductImageJob)
+class ProductImageJobAdmin(admin.ModelAdmin):
+    list_display = ("product", "status", "attempts", "run_after", "updated_at")
+    readonly_fields = ("product", "source", "attempts", "last_error", "created_at", "updated_at")
+    list_filter = ("status",)
+    search_fields = ("product__name", "product__product_code")
+    ordering = ("-created_at",)
+    actions = ["retry_jobs"]
+
+    def has_add_permission(self, request):
+        return False
+
+    @admin.action(description="Retry selected image jobs")
+    def retry_jobs(self, request, queryset):
+        updated = queryset.exclude(status='done').update(status='pending', attempts=0, run_after=timezone.now())
+        self.message_user(request, f"{updated} image job(s) re-queued.")
@@ -1,4 +1,5 @@
 from django.apps import AppConfig
+from django.db.models.signals import post_migrate
 
 
 class ProductsConfig(AppConfig):
@@ -6,4 +7,6 @@ class ProductsConfig(AppConfig):
     name = 'products'
 
     def ready(self):
-        import products.signals
\ No newline at end of file
+        import products.signals
+        from products.search import ensure_search_indexes
+        post_migrate.connect(ensure_search_indexes, sender=self)
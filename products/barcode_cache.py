@@ -0,0 +1,168 @@
+"""
+Two-tier cache for product-by-code lookups (scanner beeps).
+
+Tier 1 is a bounded in-process LRU of serialized products, tier 2 the
+Django cache (Redis when REDIS_CACHE_URL is set, shared by all processes).
+
+Every product has a generation counter in tier 2. Entries remember the
+generation they were built at, and a hit is only served after one small
+read confirms that generation is still current, so a price changed in
+another process is never served from this one's LRU. Product post_save /
+post_delete and the bulk stock writes bump the generation of exactly the
+products they touch.
+
+That check only works when the generations live in a cache every process
+shares. With a per-process backend (LocMem, the default without
+REDIS_CACHE_URL) neither tier is used and every lookup reads the row;
+BARCODE_CACHE_SHARED overrides the detection.
+"""
+import threading
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import cache, caches, DEFAULT_CACHE_ALIAS
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.db import transaction
+
+ENTRY_KEY = "products:barcode:{code}"
+GENERATION_KEY = "products:barcode_gen:{pk}"
+ENTRY_TIMEOUT = 60 * 60
+
+_local = OrderedDict()
+_lock = threading.Lock()
+_stats = {"local_hits": 0, "shared_hits": 0, "misses": 0, "invalidations": 0}
+
+
+def _max_entries():
+    return getattr(settings, "BARCODE_CACHE_SIZE", 2000)
+
+
+def _shared():
+    """Whether other processes see this one's generation bumps."""
+    shared = getattr(settings, "BARCODE_CACHE_SHARED", None)
+    if shared is None:
+        shared = not isinstance(caches[DEFAULT_CACHE_ALIAS], (LocMemCache, DummyCache))
+    return shared
+
+
+def _count(name):
+    with _lock:
+        _stats[name] += 1
+
+
+def _generation(pk):
+    return cache.get(GENERATION_KEY.format(pk=pk), 0)
+
+
+def _remember(code, entry):
+    with _lock:
+        _local[code] = entry
+        _local.move_to_end(code)
+        while len(_local) > _max_entries():
+            _local.popitem(last=False)
+
+
+def _load(code, pk=None):
+    """
+    Fetch and serialize the product for `code`. The generation is read before
+    the row, so an update committing in between leaves the entry stale
+    rather than caching old data as current.
+    """
+    from .models import Product
+    from .serializers import ProductViewSerializer
+
+    for _ in range(2):
+        if pk is None:
+            pk = Product.objects.filter(product_code=code).values_list('pk', flat=True).first()
+            if pk is None:
+                return None
+        generation = _generation(pk)
+        product = Product.objects.select_related('unit').filter(pk=pk, product_code=code).first()
+        if product is not None:
+            return (pk, generation, dict(ProductViewSerializer(product).data))
+        # The hinted product no longer has this code
+        pk = None
+    return None
+
+
+def get_product_data(code):
+    """Serialized product (ProductViewSerializer) for `code`, or None if there is none."""
+    if not _shared():
+        _count("misses")
+        entry = _load(code)
+        return entry[2] if entry else None
+
+    with _lock:
+        entry = _local.get(code)
+        if entry is not None:
+            _local.move_to_end(code)
+
+    if entry is not None:
+        pk, generation, data = entry
+        if _generation(pk) == generation:
+            _count("local_hits")
+            return data
+
+    shared = cache.get(ENTRY_KEY.format(code=code))
+    if shared is not None:
+        pk, generation, data = shared
+        if _generation(pk) == generation:
+            _remember(code, shared)
+            _count("shared_hits")
+            return data
+        entry = shared
+
+    _count("misses")
+    # Not-found codes are not cached, a product created later must show up
+    entry = _load(code, pk=entry[0] if entry else None)
+    if entry is None:
+        with _lock:
+            _local.pop(code, None)
+        return None
+    cache.set(ENTRY_KEY.format(code=code), entry, timeout=ENTRY_TIMEOUT)
+    _remember(code, entry)
+    return entry[2]
+
+
+def _bump(product_ids):
+    for pk in product_ids:
+        key = GENERATION_KEY.format(pk=pk)
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.add(key, 1, timeout=None)
+    with _lock:
+        _stats["invalidations"] += len(product_ids)
+        for code in [code for code, (pk, _, _) in _local.items() if pk in product_ids]:
+            del _local[code]
+
+
+def invalidate_products(product_ids):
+    """
+    Drop cached lookups for these products, now and again once the current
+    transaction commits (a reader may re-cache the old row in between).
+    """
+    product_ids = set(product_ids)
+    if not product_ids:
+        return
+    _bump(product_ids)
+    transaction.on_commit(lambda: _bump(product_ids))
+
+
+def cache_stats():
+    with _lock:
+        stats = dict(_stats)
+        stats["local_entries"] = len(_local)
+    lookups = stats["local_hits"] + stats["shared_hits"] + stats["misses"]
+    stats["hit_rate"] = round((stats["local_hits"] + stats["shared_hits"]) / lookups, 4) if lookups else None
+    stats["max_local_entries"] = _max_entries()
+    return stats
+
+
+def clear_local():
+    """Forget this process' LRU and counters (tests)."""
+    with _lock:
+        _local.clear()
+        for name in ("local_hits", "shared_hits", "misses", "invalidations"):
+            _stats[name] = 0
@@ -0,0 +1,88 @@
+"""
+Catalog versions for till sync.
+
+Every change to a Product, ExpiringProduct or DamageProduct row stamps it
+with a new catalog version, and deletions leave a CatalogTombstone. A till
+that last synced at version N asks for everything above N.
+
+Writers leave catalog_version NULL (pending) and call stamp_on_commit().
+Once their transaction commits, stamp_pending() gives every pending row the
+next version in one short transaction on the counter row. Stamps commit in
+the order versions are handed out, so a till's cursor never skips a change
+that commits late, and no write holds the counter lock while it runs.
+"""
+from django.apps import apps
+from django.db import transaction
+
+# Models whose rows carry a catalog_version
+CATALOG_MODELS = (
+    'products.Product',
+    'products.CatalogTombstone',
+    'price_slash.ExpiringProduct',
+    'price_slash.DamageProduct',
+)
+
+
+def stamp_pending():
+    """
+    Give every committed pending row the next catalog version. Returns that
+    version, or None when nothing was pending. The sync views call this too,
+    so rows whose on-commit stamp never ran are picked up on the next sync.
+    """
+    from .models import CatalogSequence
+
+    pending = [
+        model for model in map(apps.get_model, CATALOG_MODELS)
+        if model.objects.filter(catalog_version__isnull=True).exists()
+    ]
+    if not pending:
+        return None
+
+    with transaction.atomic():
+        sequence, _ = CatalogSequence.objects.select_for_update().get_or_create(pk=1)
+        version = sequence.value + 1
+        stamped = sum(
+            model.objects.filter(catalog_version__isnull=True).update(catalog_version=version)
+            for model in pending
+        )
+        if not stamped:
+            return None
+        CatalogSequence.objects.filter(pk=1).update(value=version)
+    return version
+
+
+def stamp_on_commit():
+    """Stamp the rows this transaction left pending once it commits."""
+    # robust: a failed stamp must not fail the write, the next sync retries it
+    transaction.on_commit(stamp_pending, robust=True)
+
+
+def current_catalog_version():
+    from .models import CatalogSequence
+
+    return CatalogSequence.objects.filter(pk=1).values_list('value', flat=True).first() or 0
+
+
+def add_tombstone(kind, object_id):
+    from .models import CatalogTombstone
+
+    tombstone = CatalogTombstone.objects.create(kind=kind, object_id=object_id, catalog_version=None)
+    stamp_on_commit()
+    return tombstone
+
+
+def broadcast_catalog_change(count):
+    """
+    One "catalog changed" push for a bulk write, sent on commit instead of a
+    product_update per row. Tills respond by syncing with ?since=.
+    """
+    from .signals import broadcast_update
+
+    def send():
+        try:
+            version = stamp_pending() or current_catalog_version()
+            broadcast_update({"catalog_changed": True, "version": version, "count": count})
+        except Exception as e:
+            print("Catalog broadcast failed:", e)
+
+    transaction.on_commit(send)
@@ -0,0 +1,231 @@
+"""
+Product image derivatives.
+
+An upload to Product.product_image queues a ProductImageJob (see
+products.signals). The worker (`manage.py process_product_images`, or a
+thread when PRODUCT_IMAGE_QUEUE_INLINE is on) renders one WebP and one
+JPEG per PRODUCT_IMAGE_SIZES entry with Pillow and records their names in
+Product.image_variants, so list screens load a few KB thumbnail instead of
+the original.
+
+Derivatives are named after a hash of their bytes
+(products/derived/<stem>.<size>.<hash>.<ext>): a new upload always gets new
+URLs, so they are served with a year-long immutable Cache-Control header.
+"""
+import hashlib
+import io
+import logging
+import os
+import threading
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import transaction, close_old_connections
+from django.utils import timezone
+from PIL import Image, ImageOps
+
+from . import jobs
+from .barcode_cache import invalidate_products
+from .models import Product, ProductImageJob
+
+logger = logging.getLogger(__name__)
+
+DERIVED_DIR = "products/derived/"
+DEFAULT_SIZES = {"thumbnail": 160, "card": 480, "full": 1600}
+FORMATS = (("webp", "WEBP"), ("jpeg", "JPEG"))
+
+RETRY_BASE_DELAY = 30  # seconds, doubled on every failed attempt
+
+
+def _sizes():
+    """(name, longest edge) pairs, largest first."""
+    sizes = getattr(settings, "PRODUCT_IMAGE_SIZES", DEFAULT_SIZES)
+    return sorted(sizes.items(), key=lambda item: -item[1])
+
+
+def _quality():
+    return getattr(settings, "PRODUCT_IMAGE_QUALITY", 80)
+
+
+# -------------------------
+# Rendering
+# -------------------------
+def _encode(image, fmt):
+    buffer = io.BytesIO()
+    if fmt == "JPEG":
+        if image.mode != "RGB":
+            # JPEG has no alpha: flatten onto white like the grid background
+            background = Image.new("RGB", image.size, (255, 255, 255))
+            background.paste(image, mask=image.getchannel("A"))
+            image = background
+        image.save(buffer, "JPEG", quality=_quality(), optimize=True, progressive=True)
+    else:
+        image.save(buffer, "WEBP", quality=_quality(), method=4)
+    return buffer.getvalue()
+
+
+def _store(stem, size_name, ext, data):
+    digest = hashlib.sha256(data).hexdigest()[:12]
+    name = f"{DERIVED_DIR}{stem}.{size_name}.{digest}.{'jpg' if ext == 'jpeg' else ext}"
+    # Same bytes, same name: a re-run never writes a file twice
+    if not default_storage.exists(name):
+        name = default_storage.save(name, ContentFile(data))
+    return name
+
+
+def render_variants(source):
+    """
+    Render and store every derivative of the image stored as `source`.
+    Returns the dict saved in Product.image_variants.
+    """
+    sizes = _sizes()
+    with default_storage.open(source, "rb") as f:
+        image = Image.open(f)
+        # Let the JPEG decoder downscale while decoding (no-op for other formats)
+        image.draft("RGB", (sizes[0][1], sizes[0][1]))
+        image.load()
+
+    image = ImageOps.exif_transpose(image)
+    has_alpha = image.mode in ("RGBA", "LA") or (image.mode == "P" and "transparency" in image.info)
+    image = image.convert("RGBA" if has_alpha else "RGB")
+
+    stem = os.path.splitext(os.path.basename(source))[0]
+    variants = {"source": source}
+    # Each size is resized from the previous (larger) one; thumbnail() never upscales
+    for size_name, edge in sizes:
+        image.thumbnail((edge, edge), Image.Resampling.LANCZOS)
+        entry = {"width": image.width, "height": image.height}
+        for ext, fmt in FORMATS:
+            entry[ext] = _store(stem, size_name, ext, _encode(image, fmt))
+        variants[size_name] = entry
+    return variants
+
+
+def variant_names(variants):
+    return {
+        entry[ext]
+        for entry in variants.values() if isinstance(entry, dict)
+        for ext, _ in FORMATS if entry.get(ext)
+    }
+
+
+def _delete_files(names):
+    for name in names:
+        try:
+            default_storage.delete(name)
+        except OSError as e:
+            logger.warning("Could not delete product image derivative %s: %s", name, e)
+
+
+# -------------------------
+# Queue
+# -------------------------
+def enqueue_image(product, inline=True):
+    """
+    Queue derivatives for the product's current image, or drop the old ones
+    when the image was removed. Call inside the save transaction.
+    """
+    source = product.product_image.name if product.product_image else ""
+    if source == (product.image_variants or {}).get("source", ""):
+        return None
+    # The instance may predate the worker's update() of image_variants
+    variants = Product.objects.filter(pk=product.pk).values_list('image_variants', flat=True).first() or {}
+    if source == variants.get("source", ""):
+        return None
+
+    if not source:
+        Product.objects.filter(pk=product.pk).update(image_variants={})
+        ProductImageJob.objects.filter(product=product).delete()
+        stale = variant_names(variants)
+        transaction.on_commit(lambda: _delete_files(stale))
+        return None
+
+    queued = ProductImageJob.objects.filter(product=product, source=source, status__in=('pending', 'processing'))
+    if queued.exists():
+        return None
+
+    job, _ = ProductImageJob.objects.update_or_create(
+        product=product,
+        defaults={
+            "source": source,
+            "status": "pending",
+            "attempts": 0,
+            "last_error": None,
+            "run_after": timezone.now(),
+        },
+    )
+    if inline and getattr(settings, "PRODUCT_IMAGE_QUEUE_INLINE", False):
+        # Local stand-in for the worker: render on a thread once the upload commits
+        transaction.on_commit(lambda: _run_in_thread(job.pk))
+    return job
+
+
+def _run_in_thread(job_id):
+    thread = threading.Thread(target=_process_in_thread, args=(job_id,), daemon=True)
+    thread.start()
+
+
+def _process_in_thread(job_id):
+    try:
+        job = jobs.claim_job(ProductImageJob, job_id)
+        if job:
+            process_job(job)
+    finally:
+        close_old_connections()
+
+
+def claim_jobs(limit=10):
+    """Claim up to `limit` due image jobs (see products.jobs.claim_jobs)."""
+    return jobs.claim_jobs(ProductImageJob, limit)
+
+
+def process_job(job):
+    """
+    Render the derivatives for a claimed job and attach them to the product,
+    unless the image was replaced meanwhile (its own job renders that one).
+    Failures are retried with exponential backoff up to max_attempts.
+    """
+    # Only this job's row: a new upload resets it to pending under our feet
+    same_job = ProductImageJob.objects.filter(pk=job.pk, source=job.source)
+    try:
+        variants = render_variants(job.source)
+    except Exception as e:
+        logger.exception("Product image job %s failed", job.pk)
+        jobs.schedule_retry(job, e, RETRY_BASE_DELAY, queryset=same_job)
+        if job.status == 'pending' and getattr(settings, "PRODUCT_IMAGE_QUEUE_INLINE", False):
+            jobs.retry_in_thread(job, _process_in_thread)
+        return job
+
+    with transaction.atomic():
+        product = Product.objects.select_for_update().only('pk', 'product_image', 'image_variants').get(pk=job.product_id)
+        stale = set()
+        if product.product_image.name == job.source:
+            stale = variant_names(product.image_variants or {}) - variant_names(variants)
+            # update(), not save(): a new image URL is not a catalog change for the tills
+            Product.objects.filter(pk=product.pk).update(image_variants=variants)
+            invalidate_products([product.pk])
+        same_job.update(status='done', last_error=None, updated_at=timezone.now())
+    _delete_files(stale)
+    return job
+
+
+def run_pending_jobs(limit=10):
+    """Claim and process one batch of due jobs. Returns the number processed."""
+    claimed = claim_jobs(limit)
+    for job in claimed:
+        process_job(job)
+    return len(claimed)
+
+
+def enqueue_missing(chunk_size=500):
+    """Queue every product whose image has no (current) derivatives. Returns the count."""
+    queued = 0
+    products = Product.objects.exclude(product_image="").exclude(product_image__isnull=True).only(
+        'pk', 'product_image', 'image_variants'
+    )
+    for product in products.iterator(chunk_size=chunk_size):
+        with transaction.atomic():
+            if enqueue_image(product, inline=False):
+                queued += 1
+    return queued
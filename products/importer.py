@@ -0,0 +1,271 @@
+"""
+Bulk product import from CSV / XLSX files.
+
+Rows are streamed from the file and handled a chunk at a time, each chunk
+in its own transaction: rows are validated with ProductImportRowSerializer
+(ProductSerializer's rules), products are upserted with bulk_create /
+bulk_update after Product.derive_fields(), and the StockHistory,
+ProductBatch and SupplierProductSupply rows are written in bulk. The
+effect on each row matches ProductCreateUpdateAPIView.post. Bad rows are
+reported by line number and skipped; the rest of the file still imports.
+"""
+import csv
+import io
+from itertools import islice
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from sales.pricing import invalidate_price_table
+from .barcode_cache import invalidate_products
+from .catalog import broadcast_catalog_change
+from .models import Product, Category, Unit, Supplier, ProductBatch, StockHistory, SupplierProductSupply
+from .references import assign_references
+from .serializers import ProductImportRowSerializer
+
+try:
+    import openpyxl
+except ImportError:  # optional, only needed for .xlsx files
+    openpyxl = None
+
+
+# Product columns an import writes (everything ProductSerializer accepts,
+# plus what derive_fields() fills in)
+PRODUCT_FIELDS = [
+    'name', 'description', 'unit_buying_price', 'markup_percentage', 'unit_price',
+    'discount_quantity', 'discount_percentage', 'discount', 'quantity', 'min_stock_threshold',
+    'expiry_date', 'expiry_min_threshold_days', 'category', 'unit', 'measurement_value',
+    'measurement_unit', 'apply_vat', 'vat_value', 'catalog_version',
+]
+
+# Columns that may appear only once in a file (both are unique in the database)
+UNIQUE_IN_FILE = ('product_code', 'batch_number')
+
+
+class Rollback(Exception):
+    pass
+
+
+def _chunk_size():
+    return getattr(settings, "PRODUCT_IMPORT_CHUNK_SIZE", 500)
+
+
+def _clean(row):
+    """Strip cells and drop empty ones so serializer defaults apply."""
+    cleaned = {}
+    for key, value in row.items():
+        if key is None:
+            continue
+        if isinstance(value, str):
+            value = value.strip()
+        if value is None or value == '':
+            continue
+        cleaned[str(key).strip()] = value
+    return cleaned
+
+
+def iter_csv_rows(file):
+    text = io.TextIOWrapper(file, encoding='utf-8-sig', newline='')
+    try:
+        for row in csv.DictReader(text):
+            yield _clean(row)
+    finally:
+        text.detach()
+
+
+def iter_xlsx_rows(file):
+    if openpyxl is None:
+        raise ValueError("XLSX import needs openpyxl; upload a CSV file instead.")
+    workbook = openpyxl.load_workbook(file, read_only=True, data_only=True)
+    try:
+        rows = workbook.active.iter_rows(values_only=True)
+        header = [str(cell).strip() if cell is not None else None for cell in next(rows, [])]
+        for values in rows:
+            yield _clean(dict(zip(header, values)))
+    finally:
+        workbook.close()
+
+
+def iter_rows(file, filename):
+    """Stream rows as dicts from a CSV or XLSX upload / file object."""
+    if filename.lower().endswith(('.xlsx', '.xlsm')):
+        return iter_xlsx_rows(file)
+    if filename.lower().endswith('.csv'):
+        return iter_csv_rows(file)
+    raise ValueError("Upload a .csv or .xlsx file.")
+
+
+def _lookup_maps():
+    """Units / categories by id and lowercased name, suppliers by id (one query each)."""
+    units, categories = {}, {}
+    for table, model in ((units, Unit), (categories, Category)):
+        for obj in model.objects.all():
+            table[str(obj.pk)] = obj
+            table.setdefault(obj.name.lower(), obj)
+    suppliers = {str(supplier.pk): supplier for supplier in Supplier.objects.all()}
+    return {"units": units, "categories": categories, "suppliers": suppliers}
+
+
+def _validate(chunk, context, report, seen):
+    valid = []
+    for line, raw in chunk:
+        serializer = ProductImportRowSerializer(data=raw, context=context)
+        if not serializer.is_valid():
+            report["errors"].append({"row": line, "errors": serializer.errors})
+            continue
+        data = dict(serializer.validated_data)
+        # Caught here, a unique violation in the bulk write would fail the whole chunk
+        duplicate = next((field for field in UNIQUE_IN_FILE if data.get(field) and data[field] in seen[field]), None)
+        if duplicate:
+            report["errors"].append({"row": line, "errors": {duplicate: ["Appears more than once in the file."]}})
+            continue
+        for field in UNIQUE_IN_FILE:
+            if data.get(field):
+                seen[field].add(data[field])
+        valid.append((line, data))
+    return valid
+
+
+def _write_chunk(valid, user, report):
+    codes = [data['product_code'] for _, data in valid]
+    existing = {product.product_code: product for product in Product.objects.filter(product_code__in=codes)}
+    batch_numbers = [data['batch_number'] for _, data in valid if data.get('batch_number')]
+    batches = {batch.batch_number: batch for batch in ProductBatch.objects.filter(batch_number__in=batch_numbers)}
+
+    created, updated, rows = [], [], []
+    for line, data in valid:
+        supplier = data.pop('supplier_id', None)
+        batch_number = data.pop('batch_number', None)
+        note = data.pop('note', None)
+
+        product = existing.get(data['product_code'])
+        batch = batches.get(batch_number) if batch_number else None
+        if batch is not None and (product is None or batch.product_id != product.pk):
+            report["errors"].append({"row": line, "errors": {
+                "batch_number": ["This batch number already exists for a different product."]
+            }})
+            continue
+
+        if product is not None:
+            for attr, value in data.items():
+                setattr(product, attr, value)
+            product.updated_by = user
+            updated.append(product)
+        else:
+            product = Product(created_by=user, **data)
+            created.append(product)
+        product.derive_fields()
+        # Pending until the chunk commits, then stamped in one go
+        product.catalog_version = None
+        rows.append((line, product, supplier, batch_number, batch, note))
+
+    Product.objects.bulk_create(
+        created, update_conflicts=True, unique_fields=['product_code'], update_fields=PRODUCT_FIELDS
+    )
+    Product.objects.bulk_update(updated, PRODUCT_FIELDS + ['updated_by', 'updated_by_name'])
+
+    today = timezone.now().strftime('%Y-%m-%d')
+    now = timezone.now()
+    history, new_batches, touched_batches = [], [], []
+    supplies = {
+        (supply.supplier_id, supply.product_id): supply
+        for supply in SupplierProductSupply.objects.filter(
+            product__in=[product for _, product, supplier, *_ in rows if supplier]
+        )
+    }
+    new_supplies, touched_supplies = [], {}
+    created_ids = {id(product) for product in created}
+
+    for line, product, supplier, batch_number, batch, note in rows:
+        is_new = id(product) in created_ids
+        history.append(StockHistory(
+            product=product,
+            action='Stock In',
+            notes=note or (f"Initial stock added on {today}" if is_new else f"Stock updated on {today}"),
+            action_by=user,
+            quantity=product.quantity,
+        ))
+
+        if batch_number:
+            if batch is None:
+                new_batches.append(ProductBatch(
+                    product=product,
+                    batch_number=batch_number,
+                    quantity_left=product.quantity,
+                    expiry_date=product.expiry_date,
+                    expiry_min_threshold_days=product.expiry_min_threshold_days,
+                    created_by=user,
+                ))
+            else:
+                batch.quantity_left += product.quantity
+                batch.updated_by = user
+                batch.updated_at = now
+                touched_batches.append(batch)
+
+        if supplier:
+            supply = supplies.get((supplier.pk, product.pk))
+            if supply is None:
+                supply = SupplierProductSupply(supplier=supplier, product=product, quantity_supplied=0)
+                supplies[(supplier.pk, product.pk)] = supply
+                new_supplies.append(supply)
+            else:
+                touched_supplies[(supplier.pk, product.pk)] = supply
+            supply.quantity_supplied += product.quantity
+            supply.unit_price = product.unit_buying_price
+            # SupplierProductSupply.save() keeps this in step, bulk writes do not call it
+            if supply.unit_price and supply.quantity_supplied:
+                supply.total_amount = supply.unit_price * supply.quantity_supplied
+
+    # bulk_create skips StockHistory.save(), so references are assigned here
+    StockHistory.objects.bulk_create(assign_references(history))
+    ProductBatch.objects.bulk_create(new_batches)
+    ProductBatch.objects.bulk_update(touched_batches, ['quantity_left', 'updated_by', 'updated_at'])
+    SupplierProductSupply.objects.bulk_create(new_supplies)
+    SupplierProductSupply.objects.bulk_update(list(touched_supplies.values()), ['quantity_supplied', 'unit_price', 'total_amount'])
+
+    # Bulk writes skip post_save: drop cached lookups / prices, one push for the chunk
+    invalidate_products([product.pk for product in updated])
+    invalidate_price_table()
+    transaction.on_commit(invalidate_price_table)
+    broadcast_catalog_change(len(rows))
+
+    report["created"] += len(created)
+    report["updated"] += len(updated)
+
+
+def import_products(rows, user, chunk_size=None, dry_run=False):
+    """
+    Import an iterable of row dicts (see iter_rows). Returns a report with the
+    created / updated counts and per-row errors (row numbers count the
+    header as row 1). With dry_run every chunk is rolled back.
+    """
+    chunk_size = chunk_size or _chunk_size()
+    context = _lookup_maps()
+    report = {"rows": 0, "created": 0, "updated": 0, "errors": [], "dry_run": dry_run}
+    seen = {field: set() for field in UNIQUE_IN_FILE}
+
+    numbered = enumerate(rows, start=2)
+    while True:
+        chunk = list(islice(numbered, chunk_size))
+        if not chunk:
+            break
+        report["rows"] += len(chunk)
+
+        valid = _validate(chunk, context, report, seen)
+        if not valid:
+            continue
+        try:
+            with transaction.atomic():
+                _write_chunk(valid, user, report)
+                if dry_run:
+                    raise Rollback
+        except Rollback:
+            pass
+        except Exception as e:
+            # One failing chunk (e.g. a concurrent edit) does not stop the file
+            for line, _ in valid:
+                report["errors"].append({"row": line, "errors": {"non_field_errors": [str(e)]}})
+
+    report["failed"] = len(report["errors"])
+    return report
@@ -0,0 +1,93 @@
+"""
+Claim / release / backoff shared by the database job queues
+(sales.receipts, products.images).
+
+A job model has status ('pending' / 'processing' / 'done' / 'failed'),
+attempts, max_attempts, last_error, run_after and updated_at, with an
+index on (status, run_after); see ReceiptJob.
+"""
+import threading
+from datetime import timedelta
+
+from django.db import transaction
+from django.utils import timezone
+
+# Jobs stuck in "processing" longer than this are assumed to belong to a dead worker
+STALE_AFTER = timedelta(minutes=5)
+
+
+def claim_job(model, job_id):
+    """Claim a single pending job by id, returns None if another worker has it."""
+    with transaction.atomic():
+        job = (
+            model.objects.select_for_update(skip_locked=True)
+            .filter(pk=job_id, status='pending')
+            .first()
+        )
+        if not job:
+            return None
+        job.status = 'processing'
+        job.attempts += 1
+        job.save(update_fields=['status', 'attempts', 'updated_at'])
+    return job
+
+
+def claim_jobs(model, limit=10):
+    """
+    Claim up to `limit` due jobs. SKIP LOCKED lets several workers poll the
+    same table without handing out a job twice.
+    """
+    now = timezone.now()
+
+    # Release jobs whose worker died mid-run
+    model.objects.filter(
+        status='processing', updated_at__lt=now - STALE_AFTER
+    ).update(status='pending', run_after=now)
+
+    with transaction.atomic():
+        jobs = list(
+            model.objects.select_for_update(skip_locked=True)
+            .filter(status='pending', run_after__lte=now)
+            .order_by('run_after', 'pk')[:limit]
+        )
+        for job in jobs:
+            job.status = 'processing'
+            job.attempts += 1
+            # bulk_update() skips auto_now: without this the claim looks stale at once
+            job.updated_at = now
+        model.objects.bulk_update(jobs, ['status', 'attempts', 'updated_at'])
+    return jobs
+
+
+def schedule_retry(job, error, base_delay, queryset=None):
+    """
+    Record a failed attempt: back to pending after `base_delay` seconds,
+    doubled per attempt, or failed once max_attempts is used up. `queryset`
+    narrows the write for jobs that can be re-queued while they run.
+    """
+    now = timezone.now()
+    job.last_error = str(error)
+    if job.attempts >= job.max_attempts:
+        job.status = 'failed'
+    else:
+        job.status = 'pending'
+        job.run_after = now + timedelta(seconds=base_delay * 2 ** (job.attempts - 1))
+    job.updated_at = now
+
+    fields = ['status', 'last_error', 'run_after', 'updated_at']
+    if queryset is None:
+        job.save(update_fields=fields)
+    else:
+        queryset.update(**{field: getattr(job, field) for field in fields})
+    return job
+
+
+def retry_in_thread(job, target):
+    """
+    Inline mode has no worker polling the queue: call target(job.pk) on a
+    timer once the job's backoff has passed.
+    """
+    delay = max((job.run_after - timezone.now()).total_seconds(), 0)
+    timer = threading.Timer(delay, target, args=(job.pk,))
+    timer.daemon = True
+    timer.start()
@@ -0,0 +1,84 @@
+import random
+import statistics
+import time
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+
+from products.models import Product, Unit
+from products.search import search_products, ensure_search_indexes
+
+
+class Rollback(Exception):
+    pass
+
+
+WORDS = [
+    "rice", "beans", "garri", "yam", "palm", "oil", "sugar", "salt", "milk", "tea",
+    "coffee", "noodles", "pasta", "tomato", "pepper", "onion", "soap", "bleach", "tissue", "juice",
+]
+SIZES = ["250g", "500g", "1kg", "2kg", "5kg", "50cl", "1L", "5L"]
+
+
+class Command(BaseCommand):
+    help = "Time typeahead search over a synthetic catalog of growing size (rolled back)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000])
+        parser.add_argument("--repeat", type=int, default=30, help="Runs per query")
+        parser.add_argument("--explain", action="store_true", help="Print the plan of each query at the largest size")
+
+    def handle(self, *args, **options):
+        try:
+            with transaction.atomic():
+                self.bench(sorted(options["sizes"]), options["repeat"], options["explain"])
+                raise Rollback
+        except Rollback:
+            pass
+
+    def bench(self, sizes, repeat, explain):
+        rng = random.Random(42)
+        unit, _ = Unit.objects.get_or_create(name="bench")
+        ensure_search_indexes()
+
+        queries = ["ric", "BSRCH-0004", "BSRCH-00012", "palm oil", "tomatto", "5kg", "ju"]
+        created = 0
+        for size in sizes:
+            batch = []
+            for i in range(created, size):
+                first, second = rng.sample(WORDS, 2)
+                name = f"{first.title()} {second} {rng.choice(SIZES)}"
+                batch.append(Product(
+                    product_code=f"BSRCH-{i:07d}",
+                    name=name,
+                    description=f"{name} bench item {i}",
+                    quantity=10,
+                    min_stock_threshold=1,
+                    unit_buying_price=Decimal("100.00"),
+                    unit_price=Decimal("120.00"),
+                    unit=unit,
+                ))
+            Product.objects.bulk_create(batch, batch_size=5000)
+            created = size
+
+            if connection.vendor == 'postgresql':
+                with connection.cursor() as cursor:
+                    cursor.execute("ANALYZE products_product")
+
+            self.stdout.write(f"--- {size} products ({connection.vendor}) ---")
+            for query in queries:
+                timings = []
+                for _ in range(repeat):
+                    start = time.perf_counter()
+                    list(search_products(query))
+                    timings.append((time.perf_counter() - start) * 1000)
+                timings.sort()
+                p95 = timings[max(int(len(timings) * 0.95) - 1, 0)]
+                self.stdout.write(
+                    f"{query!r:>14}: p50 {statistics.median(timings):7.2f} ms  p95 {p95:7.2f} ms"
+                )
+
+        if explain and connection.vendor == 'postgresql':
+            for query in queries:
+                self.stdout.write(f"\n{query!r}:\n{search_products(query).explain()}")
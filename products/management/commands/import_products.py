@@ -0,0 +1,41 @@
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+from products.importer import iter_rows, import_products
+
+
+class Command(BaseCommand):
+    help = "Bulk create/update products from a CSV or XLSX file, reporting bad rows."
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", help=".csv or .xlsx file")
+        parser.add_argument("--user", required=True, help="Username recorded as creator / on stock history")
+        parser.add_argument("--chunk-size", type=int, default=None, help="Rows per transaction")
+        parser.add_argument("--dry-run", action="store_true", help="Validate and write, then roll every chunk back")
+
+    def handle(self, *args, **options):
+        try:
+            user = get_user_model().objects.get(username=options["user"])
+        except get_user_model().DoesNotExist:
+            raise CommandError(f"No user named {options['user']}.")
+
+        start = time.perf_counter()
+        try:
+            with open(options["path"], "rb") as f:
+                report = import_products(
+                    iter_rows(f, options["path"]), user,
+                    chunk_size=options["chunk_size"], dry_run=options["dry_run"],
+                )
+        except (OSError, ValueError) as e:
+            raise CommandError(str(e))
+        elapsed = time.perf_counter() - start
+
+        for error in report["errors"]:
+            self.stderr.write(f"row {error['row']}: {error['errors']}")
+        self.stdout.write(
+            f"{report['rows']} rows in {elapsed:.1f}s: {report['created']} created, "
+            f"{report['updated']} updated, {report['failed']} failed"
+            + (" (dry run, nothing saved)" if report["dry_run"] else "")
+        )
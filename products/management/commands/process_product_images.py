@@ -0,0 +1,37 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from products.images import run_pending_jobs, enqueue_missing
+
+
+class Command(BaseCommand):
+    help = "Render WebP/JPEG derivatives (thumbnail, card, full) for uploaded product images."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch", type=int, default=10, help="Jobs claimed per poll")
+        parser.add_argument("--interval", type=float, default=2.0, help="Seconds to sleep when the queue is empty")
+        parser.add_argument("--once", action="store_true", help="Process one batch and exit")
+        parser.add_argument("--backfill", action="store_true",
+                            help="First queue every product image that has no derivatives yet")
+
+    def handle(self, *args, **options):
+        batch = options["batch"]
+        interval = options["interval"]
+
+        if options["backfill"]:
+            queued = enqueue_missing()
+            self.stdout.write(f"Queued {queued} product image(s)")
+
+        if options["once"]:
+            processed = run_pending_jobs(batch)
+            self.stdout.write(self.style.SUCCESS(f"Processed {processed} product image job(s)"))
+            return
+
+        self.stdout.write("Product image worker started")
+        try:
+            while True:
+                if not run_pending_jobs(batch):
+                    time.sleep(interval)
+        except KeyboardInterrupt:
+            self.stdout.write("Product image worker stopped")
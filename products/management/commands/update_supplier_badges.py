@@ -0,0 +1,34 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from products.models import Supplier
+
+
+class Command(BaseCommand):
+    help = "Recalculate supplier badges, once or on a fixed interval."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--interval", type=float, default=3600.0, help="Seconds between runs")
+        parser.add_argument("--once", action="store_true", help="Update badges once and exit")
+
+    def handle(self, *args, **options):
+        if options["once"]:
+            updated = Supplier.update_badges()
+            self.stdout.write(self.style.SUCCESS(f"Updated {updated} supplier badge(s)"))
+            return
+
+        self.stdout.write("Supplier badge job started")
+        try:
+            while True:
+                close_old_connections()
+                try:
+                    updated = Supplier.update_badges()
+                    self.stdout.write(f"Updated {updated} supplier badge(s)")
+                except Exception as e:
+                    # Keep the schedule alive, the next run recomputes everything
+                    self.stderr.write(f"Supplier badge update failed: {e}")
+                time.sleep(options["interval"])
+        except KeyboardInterrupt:
+            self.stdout.write("Supplier badge job stopped")
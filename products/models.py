@@ -3,13 +3,19 @@ from django.core.exceptions import ValidationError
 from django.utils import timezone
 from django.contrib.auth import get_user_model
 from decimal import Decimal
-from django.db.models import Sum, Value
-from django.db.models.functions import Coalesce
-import uuid
+from datetime import timedelta
 from django.conf import settings
 from django.utils import timezone
-from django.db import models, IntegrityError
+from django.db import models, connection
+from django.db.models.functions import Cast, Concat
+from django.core.validators import MaxValueValidator
 from decimal import Decimal, ROUND_HALF_UP
+from .references import next_reference
+from .catalog import stamp_on_commit
+
+# Widest expiry window a product or batch may have; expiry alerts only look
+# this far ahead, so their query stays a range scan on expiry_date
+EXPIRY_HORIZON_DAYS = getattr(settings, "EXPIRY_ALERT_HORIZON_DAYS", 365)
 
 
 STATUS_CHOICES = [
@@ -47,6 +53,8 @@ class Unit(models.Model):
 
 
 class StockHistory(models.Model):
+    REFERENCE_PREFIX = "StockHistory"
+
     ACTION_CHOICES = [
         ('Stock In', 'Stock In'),
         ('Sold', 'Sold'),
@@ -67,13 +75,7 @@ class StockHistory(models.Model):
 
     def save(self, *args, **kwargs):
         if not self.reference:
-            for _ in range(10): 
-                ref = f"StockHistory-{uuid.uuid4().hex[:12]}"
-                if not StockHistory.objects.filter(reference=ref).exists():
-                    self.reference = ref
-                    break
-            else:
-                raise IntegrityError("Could not generate unique product reference")
+            self.reference = next_reference(self.REFERENCE_PREFIX)
         super().save(*args, **kwargs)
 
     def __str__(self):
@@ -81,6 +83,12 @@ class StockHistory(models.Model):
 
     class Meta:
         ordering = ['-date']
+        # Newest-first ledger pages, alone or filtered by action / product
+        indexes = [
+            models.Index(fields=['-date', '-id'], name='stockhistory_date_id_idx'),
+            models.Index(fields=['action', '-date', '-id'], name='stockhistory_action_date_idx'),
+            models.Index(fields=['product', '-date', '-id'], name='stockhistory_product_date_idx'),
+        ]
 
 
 class Supplier(models.Model):
@@ -113,6 +121,9 @@ class Supplier(models.Model):
     def __str__(self):
         return self.name
 
+    TOP_BADGE_LIMIT = 10
+    LOW_BADGE_LIMIT = 10
+
     @staticmethod
     def update_badges():
         """
@@ -120,33 +131,42 @@ class Supplier(models.Model):
         Top 10 suppliers = Top Supplier
         Bottom 10 suppliers = Low Supplier
         Middle = Normal Supplier
-        """
-
-        # Annotate suppliers with total quantity and amount, treating null as 0
-        suppliers_data = Supplier.objects.annotate(
-            total_qty=Coalesce(Sum('supplies__quantity_supplied'), 0),
-            total_amt=Coalesce(Sum('supplies__total_amount'), 0)
-        ).order_by('-total_qty', '-total_amt')
-
-        total_suppliers = suppliers_data.count()
-        if total_suppliers == 0:
-            return
-
-        top_limit = 10
-        low_limit = 10
 
-        for index, supplier in enumerate(suppliers_data, start=1):
-            if index <= top_limit:
-                badge = "Top Supplier"
-            elif index > total_suppliers - low_limit:
-                badge = "Low Supplier"
-            else:
-                badge = "Normal Supplier"
-
-            # Update only if badge changed (avoid unnecessary saves)
-            if supplier.badge != badge:
-                supplier.badge = badge
-                supplier.save(update_fields=['badge'])
+        Suppliers are ranked with ROW_NUMBER() and the badges written by one
+        UPDATE ... FROM, touching only rows whose badge changes. Returns the
+        number of suppliers updated.
+        """
+        supplier_table = Supplier._meta.db_table
+        supply_table = SupplierProductSupply._meta.db_table
+        sql = f"""
+            UPDATE {supplier_table} AS s
+            SET badge = ranked.badge
+            FROM (
+                SELECT id,
+                       CASE
+                           WHEN position <= %s THEN 'Top Supplier'
+                           WHEN position > total - %s THEN 'Low Supplier'
+                           ELSE 'Normal Supplier'
+                       END AS badge
+                FROM (
+                    SELECT sup.id,
+                           ROW_NUMBER() OVER (
+                               ORDER BY COALESCE(SUM(supply.quantity_supplied), 0) DESC,
+                                        COALESCE(SUM(supply.total_amount), 0) DESC,
+                                        sup.id
+                           ) AS position,
+                           COUNT(*) OVER () AS total
+                    FROM {supplier_table} AS sup
+                    LEFT JOIN {supply_table} AS supply ON supply.supplier_id = sup.id
+                    GROUP BY sup.id
+                ) AS positions
+            ) AS ranked
+            WHERE s.id = ranked.id
+              AND (s.badge IS NULL OR s.badge <> ranked.badge)
+        """
+        with connection.cursor() as cursor:
+            cursor.execute(sql, [Supplier.TOP_BADGE_LIMIT, Supplier.LOW_BADGE_LIMIT])
+            return cursor.rowcount
 
 # =====================
 # Product Table
@@ -182,7 +202,9 @@ class Product(models.Model):
     measurement_unit = models.CharField(max_length=20, blank=True)
 
     expiry_date = models.DateField(blank=True, null=True)
-    expiry_min_threshold_days = models.PositiveIntegerField(blank=True, null=True)
+    expiry_min_threshold_days = models.PositiveIntegerField(
+        blank=True, null=True, validators=[MaxValueValidator(EXPIRY_HORIZON_DAYS)]
+    )
 
     status = models.CharField(max_length=12, choices=STATUS_CHOICES, default='active')
 
@@ -190,6 +212,9 @@ class Product(models.Model):
     vat_value = models.DecimalField(max_digits=5, decimal_places=2, blank=True, null=True, default=Decimal("0.00"))
 
     product_image = models.ImageField(upload_to="products/", blank=True, null=True)
+    # Resized copies of product_image, written by products.images:
+    # {"source": <image name>, "<size>": {"webp": <name>, "jpeg": <name>, "width", "height"}}
+    image_variants = models.JSONField(default=dict, blank=True, editable=False)
 
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
@@ -204,6 +229,9 @@ class Product(models.Model):
     )
     updated_by_name = models.CharField(max_length=255, blank=True, editable=False)
 
+    # Stamped after every save; tills sync the catalog with ?since=<version>
+    catalog_version = models.BigIntegerField(default=0, null=True, db_index=True, editable=False)
+
 
     def clean(self):
         # VAT validation
@@ -215,6 +243,19 @@ class Product(models.Model):
 
 
     def save(self, *args, **kwargs):
+        self.derive_fields()
+
+        # Pending until the save commits, then stamped with the next version
+        self.catalog_version = None
+        super().save(*args, **kwargs)
+        stamp_on_commit()
+
+    def derive_fields(self):
+        """
+        Fill the fields save() derives: staff names, description, unit price /
+        markup and discount / discount percentage. Bulk writers call this
+        directly since bulk_create / bulk_update skip save().
+        """
         # Set created_by_name and updated_by_name
         if not self.pk and self.created_by:
             self.created_by_name = self.created_by.get_full_name() or self.created_by.username
@@ -249,19 +290,79 @@ class Product(models.Model):
                 self.discount / self.unit_price * 100
             ).quantize(Decimal('0.01'), rounding=ROUND_HALF_UP)
 
-        super().save(*args, **kwargs)
-
     def __str__(self):
         return f"{self.name} ({self.product_code})"
 
 
 
+class DaysUntil(models.Func):
+    """Whole days from `today` to a date column, negative once it has passed."""
+    output_field = models.IntegerField()
+
+    def __init__(self, expression, today, **extra):
+        super().__init__(expression, models.Value(today, output_field=models.DateField()), **extra)
+
+    def as_sql(self, compiler, connection, **extra_context):
+        # PostgreSQL: date - date is an integer number of days
+        return super().as_sql(compiler, connection, template='(%(expressions)s)', arg_joiner=' - ', **extra_context)
+
+    def as_sqlite(self, compiler, connection, **extra_context):
+        return super().as_sql(
+            compiler, connection,
+            template='CAST(julianday(%(expressions)s) AS INTEGER)', arg_joiner=') - julianday(',
+            **extra_context
+        )
+
+
+class ProductBatchQuerySet(models.QuerySet):
+    """ProductBatch.status as SQL, so batches can be filtered and ordered by it."""
+
+    def with_status(self, today=None):
+        """
+        Annotate `days_to_expiry` and `expiry_status`, the same values the
+        `status` property computes ("sold out", "no expiry", "expired",
+        "expiring" or "N days left to expiry").
+        """
+        today = today or timezone.now().date()
+        days = models.F('days_to_expiry')
+        return self.annotate(days_to_expiry=DaysUntil('expiry_date', today)).annotate(
+            expiry_status=models.Case(
+                models.When(quantity_left=0, then=models.Value("sold out")),
+                models.When(expiry_date__isnull=True, then=models.Value("no expiry")),
+                models.When(days_to_expiry__lt=0, then=models.Value("expired")),
+                models.When(
+                    expiry_min_threshold_days__isnull=False,
+                    days_to_expiry__lte=models.F('expiry_min_threshold_days'),
+                    then=models.Value("expiring"),
+                ),
+                default=Concat(Cast(days, models.CharField()), models.Value(" days left to expiry")),
+                output_field=models.CharField(),
+            )
+        )
+
+    def expiry_alerts(self, today=None, statuses=("expired", "expiring")):
+        """
+        In-stock batches that are expired and/or inside their expiry window.
+        The range on expiry_date (up to EXPIRY_HORIZON_DAYS, the widest window
+        allowed) is what lets the (expiry_date, quantity_left) index serve the scan.
+        """
+        today = today or timezone.now().date()
+        batches = self.filter(quantity_left__gt=0, expiry_date__isnull=False)
+        if "expiring" in statuses:
+            batches = batches.filter(expiry_date__lte=today + timedelta(days=EXPIRY_HORIZON_DAYS))
+        else:
+            batches = batches.filter(expiry_date__lt=today)
+        return batches.with_status(today).filter(expiry_status__in=statuses)
+
+
 class ProductBatch(models.Model):
     product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name="batches")
     batch_number = models.CharField(max_length=100, unique=True)  
     quantity_left = models.PositiveIntegerField()
     expiry_date = models.DateField(blank=True, null=True)
-    expiry_min_threshold_days = models.PositiveIntegerField(blank=True, null=True)
+    expiry_min_threshold_days = models.PositiveIntegerField(
+        blank=True, null=True, validators=[MaxValueValidator(EXPIRY_HORIZON_DAYS)]
+    )
 
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='Unknown')
 
@@ -271,6 +372,15 @@ class ProductBatch(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True, null=True, blank=True)
 
+    objects = ProductBatchQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['expiry_date', 'quantity_left'], name='batch_expiry_quantity_idx'),
+            # Incremental expiry scans pick up batches edited since the last run
+            models.Index(fields=['updated_at'], name='batch_updated_at_idx'),
+        ]
+
     def __str__(self):
         return f"{self.product.name} - Batch {self.batch_number}"
 
@@ -295,6 +405,7 @@ class ProductBatch(models.Model):
 
     @property
     def status(self):
+        # Keep in step with ProductBatchQuerySet.with_status()
         if self.quantity_left == 0:
             return "sold out"
 
@@ -330,3 +441,62 @@ class SupplierProductSupply(models.Model):
         super().save(*args, **kwargs)
 
 
+
+# =====================
+# Catalog sync
+# =====================
+class CatalogSequence(models.Model):
+    """Single row holding the last catalog version handed out (see products.catalog)."""
+    value = models.BigIntegerField(default=0)
+
+    def __str__(self):
+        return f"Catalog version {self.value}"
+
+
+class CatalogTombstone(models.Model):
+    """A catalog row that was deleted at `catalog_version`."""
+    KIND_CHOICES = [
+        ('product', 'Product'),
+        ('expiring', 'Expiring'),
+        ('damaged', 'Damaged'),
+    ]
+
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES)
+    object_id = models.BigIntegerField()
+    catalog_version = models.BigIntegerField(null=True, db_index=True)
+    deleted_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.kind} #{self.object_id} deleted at v{self.catalog_version}"
+
+
+class ProductImageJob(models.Model):
+    """
+    Queued derivative rendering for a product image upload. Processed by
+    `manage.py process_product_images` (or in-process when
+    PRODUCT_IMAGE_QUEUE_INLINE is on).
+    """
+    STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('processing', 'Processing'),
+        ('done', 'Done'),
+        ('failed', 'Failed'),
+    ]
+
+    product = models.OneToOneField(Product, on_delete=models.CASCADE, related_name="image_job")
+    source = models.CharField(max_length=255)
+    status = models.CharField(max_length=12, choices=STATUS_CHOICES, default='pending')
+    attempts = models.PositiveIntegerField(default=0)
+    max_attempts = models.PositiveIntegerField(default=3)
+    last_error = models.TextField(blank=True, null=True)
+    run_after = models.DateTimeField(default=timezone.now)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'run_after']),
+        ]
+
+    def __str__(self):
+        return f"Image job for product {self.product_id} ({self.status})"
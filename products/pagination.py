@@ -0,0 +1,173 @@
+"""
+Keyset (cursor) pagination and sparse fieldsets for the inventory endpoints.
+
+Pagination is opt-in so the current UI, which expects a bare list, keeps
+working: a request with ?page_size= or ?cursor= gets
+{"next", "previous", "results"} pages walked on a unique, indexed ordering
+(no OFFSET, so page 500 costs the same as page 1).
+
+?fields=id,name,quantity limits the serialized fields of a GET (unknown
+names are ignored); on the product endpoints it also limits the columns
+loaded.
+
+The stock ledger has its own keyset pages on (date, id) below, since its
+dates are not unique.
+"""
+import base64
+import json
+
+from django.db import connection
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from rest_framework.exceptions import ValidationError
+from rest_framework.pagination import CursorPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+class InventoryCursorPagination(CursorPagination):
+    page_size = 100
+    page_size_query_param = 'page_size'
+    max_page_size = 500
+    ordering = 'id'
+
+
+def wants_page(request):
+    params = request.query_params
+    return InventoryCursorPagination.cursor_query_param in params or 'page_size' in params
+
+
+def requested_fields(request):
+    """Field names from ?fields= on a GET, or None for all fields."""
+    if request is None or request.method != 'GET':
+        return None
+    fields = request.query_params.get('fields')
+    if not fields:
+        return None
+    return {name.strip() for name in fields.split(',') if name.strip()}
+
+
+class SparseFieldsMixin:
+    """
+    Drop the serializer fields not named in context["fields"] (the parsed
+    ?fields=). Read from its own key rather than the request, so passing it
+    does not turn file fields into absolute URLs.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        wanted = self.context.get('fields')
+        if wanted:
+            for name in set(self.fields) - wanted:
+                self.fields.pop(name)
+
+
+def project(queryset, request, related=()):
+    """
+    Load only the columns behind the requested fields, joining the `related`
+    foreign keys that were asked for (select_related cannot follow a
+    deferred key).
+    """
+    wanted = requested_fields(request)
+    if not wanted:
+        return queryset.select_related(*related) if related else queryset
+
+    concrete = {field.name for field in queryset.model._meta.concrete_fields}
+    columns = (wanted & concrete) | {'id'}
+    joined = [name for name in related if name in columns]
+    if joined:
+        queryset = queryset.select_related(*joined)
+    return queryset.only(*columns)
+
+
+def paginate(request, queryset, serializer_class, ordering='id'):
+    """
+    Response for a function view: a cursor page when the client asked for
+    one, the whole (unordered as before) list otherwise.
+    """
+    context = {'fields': requested_fields(request)}
+    if not wants_page(request):
+        return Response(serializer_class(queryset, many=True, context=context).data)
+
+    paginator = InventoryCursorPagination()
+    paginator.ordering = ordering
+    page = paginator.paginate_queryset(queryset, request)
+    return paginator.get_paginated_response(serializer_class(page, many=True, context=context).data)
+
+
+# -------------------------
+# Stock ledger keyset pages
+# -------------------------
+LEDGER_PAGE_SIZE = 100
+LEDGER_MAX_PAGE_SIZE = 500
+
+
+def _encode_position(row):
+    position = f"{row.date.isoformat()}|{row.pk}"
+    return base64.urlsafe_b64encode(position.encode()).decode()
+
+
+def _decode_position(cursor):
+    try:
+        date, pk = base64.urlsafe_b64decode(cursor.encode()).decode().split("|")
+        date = parse_datetime(date)
+        pk = int(pk)
+    except (ValueError, UnicodeDecodeError):
+        date = None
+    if date is None:
+        raise ValidationError({"cursor": "Invalid cursor."})
+    return date, pk
+
+
+def approximate_count(queryset):
+    """
+    Row estimate from the PostgreSQL planner (no scan); an exact COUNT(*)
+    elsewhere.
+    """
+    if connection.vendor != 'postgresql':
+        return queryset.count()
+    sql, params = queryset.order_by().values('pk').query.sql_with_params()
+    with connection.cursor() as cursor:
+        cursor.execute(f"EXPLAIN (FORMAT JSON) {sql}", params)
+        plan = cursor.fetchone()[0]
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return int(plan[0]["Plan"]["Plan Rows"])
+
+
+def keyset_paginate(request, queryset, serializer_class):
+    """
+    Newest-first page after ?cursor=, seeking on (date, id) so every page
+    costs one index range read however deep it is. ?count=approx|exact adds
+    a total (none by default).
+    """
+    try:
+        page_size = min(int(request.query_params.get('page_size', LEDGER_PAGE_SIZE)), LEDGER_MAX_PAGE_SIZE)
+    except ValueError:
+        page_size = LEDGER_PAGE_SIZE
+    page_size = max(page_size, 1)
+
+    count_mode = request.query_params.get('count')
+    count = None
+    if count_mode == 'approx':
+        count = approximate_count(queryset)
+    elif count_mode == 'exact':
+        count = queryset.count()
+
+    cursor = request.query_params.get('cursor')
+    if cursor:
+        date, pk = _decode_position(cursor)
+        # date__lte is the index range start; the OR alone would scan from the top
+        queryset = queryset.filter(date__lte=date).filter(Q(date__lt=date) | Q(date=date, pk__lt=pk))
+
+    rows = list(queryset.order_by('-date', '-id')[:page_size + 1])
+    next_url = None
+    if len(rows) > page_size:
+        rows = rows[:page_size]
+        next_url = replace_query_param(request.build_absolute_uri(), 'cursor', _encode_position(rows[-1]))
+
+    return Response({
+        "count": count,
+        "next": next_url,
+        "results": serializer_class(rows, many=True).data,
+    })
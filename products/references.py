@@ -0,0 +1,100 @@
+"""
+Reference allocator for Sale, StockHistory, ExpiringProduct, DamageProduct
+and InventoryWriteOff.
+
+References are handed out without an exists() pre-check: on PostgreSQL each
+prefix has its own sequence and every process takes numbers from it in
+blocks; elsewhere (SQLite dev mode) a random token is used. In both cases the
+unique constraint on `reference` is the safety net.
+"""
+import re
+import threading
+import uuid
+
+from django.conf import settings
+from django.db import connection, transaction, IntegrityError
+
+
+_blocks = {}
+_ready = set()
+_lock = threading.Lock()
+
+
+def _block_size():
+    return getattr(settings, "REFERENCE_BLOCK_SIZE", 50)
+
+
+def _sequence_name(prefix):
+    return "ref_seq_" + re.sub(r"[^a-z0-9_]", "_", prefix.lower())
+
+
+def _ensure_sequence(cursor, name):
+    if name in _ready:
+        return
+    try:
+        with transaction.atomic():
+            cursor.execute(f'CREATE SEQUENCE IF NOT EXISTS "{name}"')
+    except IntegrityError:
+        # Another process created it between our check and our CREATE
+        pass
+    # Only trust it once it is committed, a rolled back CREATE leaves nothing behind
+    transaction.on_commit(lambda: _ready.add(name))
+
+
+def _fetch_numbers(prefix, count):
+    name = _sequence_name(prefix)
+    with connection.cursor() as cursor:
+        _ensure_sequence(cursor, name)
+        cursor.execute("SELECT nextval(%s) FROM generate_series(1, %s)", [name, count])
+        return [row[0] for row in cursor.fetchall()]
+
+
+def _take_numbers(prefix, count):
+    """Take `count` numbers for a prefix, refilling the process' block in one query."""
+    with _lock:
+        block = _blocks.setdefault(prefix, [])
+        if len(block) < count:
+            block.extend(_fetch_numbers(prefix, max(_block_size(), count - len(block))))
+        taken = block[:count]
+        del block[:count]
+    return taken
+
+
+def format_reference(prefix, number):
+    # 8+ digits never clash with the legacy 12-char hex references
+    return f"{prefix}-{number:08d}"
+
+
+def new_references(prefix, count):
+    if count <= 0:
+        return []
+    if connection.vendor != 'postgresql':
+        return [f"{prefix}-{uuid.uuid4().hex[:12]}" for _ in range(count)]
+    return [format_reference(prefix, number) for number in _take_numbers(prefix, count)]
+
+
+def next_reference(prefix):
+    return new_references(prefix, 1)[0]
+
+
+def assign_references(objs):
+    """
+    Give every unsaved object without a reference one, so the batch can go
+    through bulk_create. Objects are grouped by their model's REFERENCE_PREFIX.
+    """
+    missing = {}
+    for obj in objs:
+        if not obj.reference:
+            missing.setdefault(type(obj).REFERENCE_PREFIX, []).append(obj)
+
+    for prefix, group in missing.items():
+        for obj, reference in zip(group, new_references(prefix, len(group))):
+            obj.reference = reference
+    return objs
+
+
+def reset_reference_blocks():
+    """Forget the cached blocks (tests, or after a database restore)."""
+    with _lock:
+        _blocks.clear()
+        _ready.clear()
@@ -0,0 +1,155 @@
+"""
+Set-based repricing.
+
+A rule is applied to every matching product with one UPDATE whose
+expressions reproduce Product.derive_fields() (ROUND to 2 places, half
+away from zero, which is ROUND_HALF_UP for prices):
+
+- markup:   unit_price from unit_buying_price and the new markup %, then the
+            discount / discount % pair recomputed against the new price;
+- vat:      vat_value (VAT per unit, money) of VAT-able products set to the
+            given rate of their unit_price (optionally a category);
+- discount: discount % (and discount amount) for a supplier's products.
+
+dry_run returns the per-product diff from the same expressions without
+writing anything.
+
+Rates are bound as precomputed multipliers written with decimal places
+("0.2500", "1.2500"): SQLite receives Decimals as text and would do
+'25' / '100' as integer division.
+"""
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import Case, When, F, Value, DecimalField, Q
+from django.db.models.functions import Round
+
+from sales.pricing import invalidate_price_table
+from .barcode_cache import invalidate_products
+from .catalog import current_catalog_version, broadcast_catalog_change
+from .models import Product
+
+MONEY = DecimalField(max_digits=10, decimal_places=2)
+PERCENT = DecimalField(max_digits=5, decimal_places=2)
+RATE = DecimalField(max_digits=9, decimal_places=4)
+HUNDRED = Value(Decimal("100.00"), output_field=MONEY)
+PER_CENT = Value(Decimal("0.0100"), output_field=RATE)
+DIFF_LIMIT = 200
+
+
+def _round(expression, output_field=MONEY):
+    return Round(expression, 2, output_field=output_field)
+
+
+def _rate(percent, base=Decimal("0")):
+    """base + percent / 100 as a bound multiplier."""
+    return Value((base + percent / 100).quantize(Decimal("0.0001")), output_field=RATE)
+
+
+def _discount_updates(unit_price):
+    """discount / discount_percentage as derive_fields() steps 3 and 4 would set them."""
+    return {
+        'discount': Case(
+            When(discount_percentage__isnull=False,
+                 then=_round(unit_price * F('discount_percentage') * PER_CENT)),
+            default=F('discount'),
+            output_field=MONEY,
+        ),
+        'discount_percentage': Case(
+            When(Q(discount_percentage__isnull=True) & Q(discount__gt=0),
+                 then=_round(F('discount') * HUNDRED / unit_price, PERCENT)),
+            default=F('discount_percentage'),
+            output_field=PERCENT,
+        ),
+    }
+
+
+def _markup_rule(queryset, value, category=None):
+    if category is not None:
+        queryset = queryset.filter(category=category)
+    unit_price = _round(F('unit_buying_price') * _rate(value, base=Decimal("1")))
+    updates = {'unit_price': unit_price, 'markup_percentage': Value(value, output_field=PERCENT)}
+    updates.update(_discount_updates(unit_price))
+    # derive_fields() leaves the discount % alone when the price is 0; so do we
+    return queryset.filter(unit_buying_price__gt=0), updates
+
+
+def _vat_rule(queryset, value, category=None):
+    if category is not None:
+        queryset = queryset.filter(category=category)
+    # vat_value is VAT per unit in money (pricing charges vat_value * qty)
+    return queryset.filter(apply_vat=True), {'vat_value': _round(F('unit_price') * _rate(value))}
+
+
+def _discount_rule(queryset, value, supplier=None, discount_quantity=None):
+    if supplier is not None:
+        queryset = queryset.filter(supplies__supplier=supplier).distinct()
+    updates = {
+        'discount_percentage': Value(value, output_field=PERCENT),
+        'discount': _round(F('unit_price') * _rate(value)),
+    }
+    if discount_quantity:
+        updates['discount_quantity'] = Value(discount_quantity)
+    return queryset, updates
+
+
+RULES = {
+    'markup': _markup_rule,
+    'vat': _vat_rule,
+    'discount': _discount_rule,
+}
+
+
+def _diff(queryset, updates):
+    """Old and new values of every changed field, computed by the database."""
+    new_names = {field: f"new_{field}" for field in updates}
+    rows = queryset.annotate(**{new_names[field]: expr for field, expr in updates.items()}).values(
+        'id', 'product_code', 'name', *updates.keys(), *new_names.values()
+    )
+    changes = []
+    for row in rows.order_by('pk').iterator():
+        fields = {
+            field: {"old": row[field], "new": row[new_names[field]]}
+            for field in updates
+            if row[field] != row[new_names[field]]
+        }
+        if fields:
+            changes.append({"id": row['id'], "product_code": row['product_code'], "name": row['name'], "changes": fields})
+    return changes
+
+
+def reprice(rule, value, user=None, dry_run=False, **scope):
+    """
+    Apply `rule` ('markup' / 'vat' / 'discount') with `value` (a percentage)
+    to the products in `scope` (category= or supplier=). Returns
+    {"matched", "changed", "diff"}; the diff is capped at DIFF_LIMIT rows.
+    """
+    if rule not in RULES:
+        raise ValueError(f"Unknown repricing rule: {rule}")
+    queryset, updates = RULES[rule](Product.objects.all(), Decimal(str(value)), **scope)
+
+    # Only rows the rule actually changes are written and reported
+    changes = _diff(queryset, updates)
+    result = {"rule": rule, "matched": queryset.count(), "changed": len(changes),
+              "diff": changes[:DIFF_LIMIT], "dry_run": dry_run}
+    if dry_run or not changes:
+        return result
+
+    changed_ids = [change["id"] for change in changes]
+    with transaction.atomic():
+        extra = {'catalog_version': None}
+        if user is not None:
+            extra['updated_by'] = user
+            extra['updated_by_name'] = user.get_full_name() or user.username
+        # Product.objects, not the scoped queryset: UPDATE cannot take DISTINCT
+        Product.objects.filter(pk__in=changed_ids).update(**updates, **extra)
+
+        # One UPDATE, no post_save: refresh caches and send a single push
+        invalidate_products(changed_ids)
+        invalidate_price_table()
+        transaction.on_commit(invalidate_price_table)
+        broadcast_catalog_change(len(changed_ids))
+
+    # Stamped on commit (see products.catalog)
+    result["version"] = current_catalog_version()
+    return result
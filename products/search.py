@@ -0,0 +1,108 @@
+"""
+Product search for the till typeahead.
+
+On PostgreSQL the lookups Django emits for the search below are served by
+indexes created in ensure_search_indexes():
+
+- product_code prefixes (barcode fragments) use the varchar_pattern_ops
+  index Django already keeps for the unique product_code;
+- name prefixes use a text_pattern_ops index on UPPER(name);
+- substrings of name / description (icontains) use pg_trgm GIN indexes on
+  UPPER(name) / UPPER(description), and plain name trigrams catch typos.
+
+Results are ranked: exact code, code prefix, name prefix, then trigram
+similarity. SQLite (dev mode) gets the same filters and ranking without the
+indexes or the fuzzy match.
+"""
+import logging
+
+from django.db import connection
+from django.db.models import Q, Case, When, Value, FloatField
+from django.db.models.functions import Upper
+
+from .models import Product
+
+logger = logging.getLogger(__name__)
+
+# pg_trgm cannot use its index for patterns shorter than a trigram
+MIN_SUBSTRING_LENGTH = 3
+MAX_RESULTS = 10
+
+SEARCH_INDEXES = [
+    'CREATE EXTENSION IF NOT EXISTS pg_trgm',
+    'CREATE INDEX IF NOT EXISTS products_product_name_upper_prefix '
+    'ON products_product (UPPER(name::text) text_pattern_ops)',
+    'CREATE INDEX IF NOT EXISTS products_product_name_upper_trgm '
+    'ON products_product USING gin (UPPER(name::text) gin_trgm_ops)',
+    'CREATE INDEX IF NOT EXISTS products_product_description_upper_trgm '
+    'ON products_product USING gin (UPPER(description::text) gin_trgm_ops)',
+    'CREATE INDEX IF NOT EXISTS products_product_name_trgm '
+    'ON products_product USING gin (name gin_trgm_ops)',
+]
+
+
+def ensure_search_indexes(**kwargs):
+    """Create the search indexes (PostgreSQL only). Safe to run repeatedly."""
+    if connection.vendor != 'postgresql':
+        return
+    try:
+        with connection.cursor() as cursor:
+            for statement in SEARCH_INDEXES:
+                cursor.execute(statement)
+    except Exception as e:
+        # e.g. no permission to create the extension; search still works, unindexed
+        logger.warning("Could not create product search indexes: %s", e)
+
+
+def _rank(query):
+    code = query.upper()
+    return Case(
+        When(product_code=query, then=Value(4.0)),
+        When(product_code__startswith=query, then=Value(3.0)),
+        When(product_code__startswith=code, then=Value(3.0)),
+        When(name__istartswith=query, then=Value(2.0)),
+        default=Value(0.0),
+        output_field=FloatField(),
+    )
+
+
+def _filters(query):
+    """Prefix matches always; substring matches once the index can serve them."""
+    code = query.upper()
+    match = Q(product_code__startswith=query) | Q(product_code__startswith=code) | Q(name__istartswith=query)
+    if len(query) >= MIN_SUBSTRING_LENGTH:
+        match |= Q(name__icontains=query) | Q(description__icontains=query)
+    return match
+
+
+def _postgres_search(queryset, query, limit):
+    from django.contrib.postgres.search import TrigramSimilarity
+
+    match = _filters(query)
+    if len(query) >= MIN_SUBSTRING_LENGTH:
+        match |= Q(name__trigram_similar=query)
+    return (
+        queryset.filter(match)
+        .annotate(search_rank=_rank(query) + TrigramSimilarity('name', query))
+        .order_by('-search_rank', 'name', 'pk')[:limit]
+    )
+
+
+def _fallback_search(queryset, query, limit):
+    return (
+        queryset.filter(_filters(query))
+        .annotate(search_rank=_rank(query))
+        .order_by('-search_rank', Upper('name'), 'pk')[:limit]
+    )
+
+
+def search_products(query, limit=MAX_RESULTS, queryset=None):
+    """Ranked typeahead results for `query` (a name, description or code fragment)."""
+    query = (query or '').strip()
+    if not query:
+        return Product.objects.none()
+    if queryset is None:
+        queryset = Product.objects.select_related('unit')
+    if connection.vendor == 'postgresql':
+        return _postgres_search(queryset, query, limit)
+    return _fallback_search(queryset, query, limit)
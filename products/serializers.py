@@ -1,6 +1,6 @@
 from rest_framework import serializers
 from decimal import Decimal, InvalidOperation
-from .models import Product, Category, Unit, Supplier, ProductBatch, StockHistory, ProductBatch, SupplierProductSupply
+from .models import Product, Category, Unit, Supplier, ProductBatch, StockHistory, ProductBatch, SupplierProductSupply, EXPIRY_HORIZON_DAYS
 from decimal import Decimal, InvalidOperation
 from django.db.models import F
 from django.contrib.auth import get_user_model
@@ -8,6 +8,9 @@ import re
 from django.utils import timezone
 from django.db import transaction
 from rest_framework import serializers
+from .barcode_cache import invalidate_products
+from .pagination import SparseFieldsMixin
+from django.core.files.storage import default_storage
 
 
 
@@ -25,7 +28,7 @@ class UserSerializer(serializers.ModelSerializer):
         return full_name if full_name else obj.username
 
 
-class ProductSerializer(serializers.ModelSerializer):
+class ProductSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     product_code = serializers.CharField(required=True)
     name = serializers.CharField(required=True)
     batch_number = serializers.CharField(write_only=True, required=False, allow_blank=True, allow_null=True)
@@ -40,7 +43,9 @@ class ProductSerializer(serializers.ModelSerializer):
     min_stock_threshold = serializers.IntegerField(required=True, min_value=1)
 
     expiry_date = serializers.DateField(required=False, allow_null=True,)
-    expiry_min_threshold_days = serializers.IntegerField(required=False, allow_null=True)
+    expiry_min_threshold_days = serializers.IntegerField(
+        required=False, allow_null=True, max_value=EXPIRY_HORIZON_DAYS
+    )
 
     category = serializers.PrimaryKeyRelatedField(queryset=Category.objects.all(), required=False, allow_null=True)
     unit = serializers.PrimaryKeyRelatedField(queryset=Unit.objects.all(), required=True)
@@ -214,6 +219,78 @@ class ProductSerializer(serializers.ModelSerializer):
         return product
 
 
+class _PreloadedLookupField(serializers.Field):
+    """Category / Unit given by id or by name, resolved from maps in the serializer context."""
+
+    def __init__(self, lookup, **kwargs):
+        self.lookup = lookup
+        super().__init__(**kwargs)
+
+    def to_internal_value(self, data):
+        key = str(data).strip()
+        obj = self.context[self.lookup].get(key) or self.context[self.lookup].get(key.lower())
+        if obj is None:
+            raise serializers.ValidationError(f"Unknown {self.field_name} '{data}'.")
+        return obj
+
+    def to_representation(self, value):
+        return value.pk
+
+
+class ProductImportRowSerializer(ProductSerializer):
+    """
+    One row of a bulk import (products.importer). Same rules as
+    ProductSerializer, but category / unit / supplier come from maps the
+    importer loads once per file instead of one query per row.
+    """
+    category = _PreloadedLookupField('categories', required=False, allow_null=True)
+    unit = _PreloadedLookupField('units')
+    note = serializers.CharField(required=False, allow_blank=True)
+
+    class Meta(ProductSerializer.Meta):
+        fields = [field for field in ProductSerializer.Meta.fields if field != 'product_image'] + ['note']
+
+    def validate_supplier_id(self, value):
+        if not value:
+            return None
+        supplier = self.context['suppliers'].get(str(value).strip())
+        if supplier is None:
+            raise serializers.ValidationError("Supplier not found.")
+        return supplier
+
+
+class RepricingRuleSerializer(serializers.Serializer):
+    """A bulk repricing request (products.repricing.reprice)."""
+    rule = serializers.ChoiceField(choices=['markup', 'vat', 'discount'])
+    value = serializers.DecimalField(max_digits=5, decimal_places=2, min_value=Decimal("0.00"))
+    category = serializers.PrimaryKeyRelatedField(queryset=Category.objects.all(), required=False, allow_null=True)
+    supplier = serializers.PrimaryKeyRelatedField(queryset=Supplier.objects.all(), required=False, allow_null=True)
+    discount_quantity = serializers.IntegerField(required=False, min_value=1)
+    dry_run = serializers.BooleanField(required=False, default=False)
+
+    def validate(self, data):
+        rule = data['rule']
+        if rule == 'discount':
+            if not data.get('supplier'):
+                raise serializers.ValidationError({'supplier': "supplier is required for a discount rule."})
+            if data.get('category'):
+                raise serializers.ValidationError({'category': "A discount rule is scoped by supplier."})
+        else:
+            if data.get('supplier') or data.get('discount_quantity'):
+                raise serializers.ValidationError(f"A {rule} rule takes an optional category only.")
+            if rule == 'markup' and not data.get('category'):
+                raise serializers.ValidationError({'category': "category is required for a markup rule."})
+        if rule == 'vat' and data['value'] <= 0:
+            raise serializers.ValidationError({'value': "vat value must be greater than 0."})
+        return data
+
+    def scope(self):
+        data = self.validated_data
+        if data['rule'] == 'discount':
+            return {'supplier': data['supplier'], 'discount_quantity': data.get('discount_quantity')}
+        return {'category': data.get('category')}
+
+
 class CategorySerializer(serializers.ModelSerializer):
     product_count = serializers.IntegerField(read_only=True)
 
@@ -233,7 +310,7 @@ class UnitSerializer(serializers.ModelSerializer):
         model = Unit
         fields = '__all__'
 
-class ProductViewSerializer(serializers.ModelSerializer):
+class ProductViewSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     unit_price = serializers.DecimalField(
         max_digits=10, decimal_places=2, coerce_to_string=False, read_only=True
     )
@@ -253,6 +330,8 @@ class ProductViewSerializer(serializers.ModelSerializer):
     vat_value = serializers.DecimalField(
         max_digits=5, decimal_places=2, coerce_to_string=False, read_only=True
     )
+    # {"thumbnail" | "card" | "full": {"webp", "jpeg", "width", "height"}}, {} until rendered
+    image_variants = serializers.SerializerMethodField()
 
     class Meta:
         model = Product
@@ -273,6 +352,7 @@ class ProductViewSerializer(serializers.ModelSerializer):
             'apply_vat',
             'vat_value',
             'product_image',
+            'image_variants',
             'unit_buying_price',
             'markup_percentage',
             'unit',
@@ -283,6 +363,19 @@ class ProductViewSerializer(serializers.ModelSerializer):
     def get_category_name(self, obj):
         return obj.category.name if obj.category else None
 
+    def get_image_variants(self, obj):
+        request = self.context.get('request')
+        variants = {}
+        for size, entry in (obj.image_variants or {}).items():
+            if not isinstance(entry, dict):
+                continue
+            urls = dict(entry)
+            for key in ('webp', 'jpeg'):
+                url = default_storage.url(entry[key])
+                urls[key] = request.build_absolute_uri(url) if request else url
+            variants[size] = urls
+        return variants
+
 
 
 class StockHistorySerializer(serializers.ModelSerializer):
@@ -326,7 +419,7 @@ class SupplierProductSupplySerializer(serializers.ModelSerializer):
         fields = ["id", 'product', 'quantity_supplied', 'total_amount', 'supply_date', 'product_name', 'product_price' ]
 
 
-class SupplierSerializer(serializers.ModelSerializer):
+class SupplierSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     supplies = SupplierProductSupplySerializer(many=True, read_only=True)
 
     class Meta:
@@ -357,11 +450,11 @@ class SupplierSerializer(serializers.ModelSerializer):
             value = " ".join([word.capitalize() for word in value.split()])
         return value
 
-class ProductBatchSerializer(serializers.ModelSerializer):
+class ProductBatchSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     product = ProductSerializer(read_only=True)
     mark_sold = serializers.BooleanField(write_only=True, required=False, default=False)
     mark_expired = serializers.BooleanField(write_only=True, required=False, default=False)
-    expiry_min_threshold_days = serializers.IntegerField(required=False, min_value=0)
+    expiry_min_threshold_days = serializers.IntegerField(required=False, min_value=0, max_value=EXPIRY_HORIZON_DAYS)
 
     class Meta:
         model = ProductBatch
@@ -377,6 +470,16 @@ class ProductBatchSerializer(serializers.ModelSerializer):
             rep['expiry_min_threshold_days'] = instance.expiry_min_threshold_days
         return rep
 
+
+class ExpiringBatchSerializer(ProductBatchSerializer):
+    """A batch from ProductBatch.objects.with_status(), status read from the annotation."""
+    status = serializers.CharField(source='expiry_status', read_only=True)
+    days_to_expiry = serializers.IntegerField(read_only=True)
+
+    class Meta(ProductBatchSerializer.Meta):
+        fields = ProductBatchSerializer.Meta.fields + ['days_to_expiry']
+
+
 class CategoryWriteSerializer(serializers.ModelSerializer):
     class Meta:
         model = Category
@@ -433,6 +536,7 @@ class ProductUpdateSerializer(serializers.ModelSerializer):
             if purchased_qty > 0:
                 Product.objects.filter(pk=instance.pk).update(quantity=F("quantity") + purchased_qty)
                 instance.refresh_from_db(fields=["quantity"])
+                invalidate_products([instance.pk])
 
             # 2) batch management
             if batch_number and expiry_date and expiry_threshold:
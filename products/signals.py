@@ -3,6 +3,9 @@ from django.dispatch import receiver
 from asgiref.sync import async_to_sync
 from channels.layers import get_channel_layer
 from .models import Product
+from .catalog import add_tombstone
+from .barcode_cache import invalidate_products
+from .images import enqueue_image
 import json
 
 def broadcast_update(data):
@@ -46,3 +49,21 @@ def product_deleted(sender, instance, **kwargs):
         "deleted": True
     }
     broadcast_update(data)
+
+
+@receiver(post_delete, sender=Product)
+def product_tombstone(sender, instance, **kwargs):
+    # Runs inside the delete transaction, tills syncing with ?since= drop the row
+    add_tombstone('product', instance.id)
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+def product_barcode_cache(sender, instance, **kwargs):
+    invalidate_products([instance.pk])
+
+
+@receiver(post_save, sender=Product)
+def product_image_changed(sender, instance, **kwargs):
+    # Runs inside the save transaction, so the job commits with the new image
+    enqueue_image(instance)
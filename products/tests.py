@@ -1,3 +1,347 @@
-from django.test import TestCase
+import io
+import shutil
+import tempfile
+from unittest import mock
+from datetime import timedelta
+from decimal import Decimal
 
-# Create your tests here.
+from django.core.cache import cache
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.contrib.auth.models import User
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from .models import StockHistory, Product, ProductBatch, Unit, Category, Supplier, SupplierProductSupply
+from .search import search_products
+from .barcode_cache import get_product_data, cache_stats, clear_local
+from .importer import iter_rows, import_products
+from .repricing import reprice
+from .images import run_pending_jobs
+from .references import assign_references, new_references, reset_reference_blocks
+
+
+IN_MEMORY_LAYERS = {"default": {"BACKEND": "channels.layers.InMemoryChannelLayer"}}
+
+
+@override_settings(CHANNEL_LAYERS=IN_MEMORY_LAYERS, REFERENCE_BLOCK_SIZE=5)
+class ReferenceAllocatorTests(TestCase):
+
+    def setUp(self):
+        reset_reference_blocks()
+
+    def test_references_are_unique_across_blocks(self):
+        references = new_references("Test", 12) + new_references("Test", 3)
+
+        self.assertEqual(len(set(references)), 15)
+        self.assertTrue(all(ref.startswith("Test-") for ref in references))
+
+    def test_assign_references_for_a_batch(self):
+        rows = [StockHistory(quantity=1, action='Sold') for _ in range(7)]
+        rows[0].reference = "StockHistory-legacy"
+
+        assign_references(rows)
+
+        self.assertEqual(rows[0].reference, "StockHistory-legacy")
+        self.assertEqual(len({row.reference for row in rows}), 7)
+        self.assertTrue(all(row.reference.startswith("StockHistory-") for row in rows))
+
+
+@override_settings(CHANNEL_LAYERS=IN_MEMORY_LAYERS)
+class ProductSearchTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        unit = Unit.objects.create(name="bag")
+        for code, name, description in [
+            ("6151100001", "Golden Penny Rice", "Long grain rice 5kg"),
+            ("6151100002", "Rice Cooker", "Kitchen appliance"),
+            ("4000000001", "Sugar cubes", "Contains rice flour"),
+        ]:
+            Product.objects.create(
+                product_code=code, name=name, description=description, quantity=1,
+                min_stock_threshold=1, unit_buying_price=Decimal("1.00"),
+                unit_price=Decimal("2.00"), unit=unit,
+            )
+
+    def test_name_prefix_ranks_first(self):
+        names = [product.name for product in search_products("rice")]
+
+        self.assertEqual(names[0], "Rice Cooker")
+        self.assertEqual(set(names), {"Rice Cooker", "Golden Penny Rice", "Sugar cubes"})
+
+    def test_barcode_fragment_matches_by_prefix(self):
+        codes = [product.product_code for product in search_products("615110")]
+
+        self.assertEqual(sorted(codes), ["6151100001", "6151100002"])
+        self.assertEqual(list(search_products("  ")), [])
+
+
+@override_settings(CHANNEL_LAYERS=IN_MEMORY_LAYERS)
+@override_settings(BARCODE_CACHE_SHARED=True)
+class BarcodeCacheTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        clear_local()
+        self.product = Product.objects.create(
+            product_code="5900000000017", name="Scanned", quantity=4, min_stock_threshold=1,
+            unit_buying_price=Decimal("1.00"), unit_price=Decimal("2.00"),
+            unit=Unit.objects.create(name="tin"),
+        )
+
+    def test_hits_are_served_until_the_product_changes(self):
+        self.assertEqual(get_product_data("5900000000017")["unit_price"], Decimal("2.00"))
+        with self.assertNumQueries(0):
+            get_product_data("5900000000017")
+
+        # unit_price is derived from the markup on save
+        self.product.markup_percentage = Decimal("150")
+        self.product.save()
+
+        self.assertEqual(get_product_data("5900000000017")["unit_price"], Decimal("2.50"))
+        self.assertIsNone(get_product_data("unknown"))
+
+        stats = cache_stats()
+        self.assertEqual(stats["local_hits"], 1)
+        self.assertEqual(stats["misses"], 3)
+
+    @override_settings(BARCODE_CACHE_SHARED=None)
+    def test_process_local_cache_is_not_used(self):
+        # LocMem generations are per process: another worker's bump would be missed
+        get_product_data("5900000000017")
+        Product.objects.filter(pk=self.product.pk).update(quantity=9)
+
+        self.assertEqual(get_product_data("5900000000017")["quantity"], 9)
+        self.assertEqual(cache_stats()["local_entries"], 0)
+
+
+@override_settings(CHANNEL_LAYERS=IN_MEMORY_LAYERS)
+class ProductImportTests(TestCase):
+
+    def test_imports_good_rows_and_reports_bad_ones(self):
+        user = User.objects.create_user(username="importer", password="pass")
+        unit = Unit.objects.create(name="carton")
+        Product.objects.create(
+            product_code="IMP-1", name="Old name", description="Old", quantity=1, min_stock_threshold=1,
+            unit_buying_price=Decimal("10.00"), unit_price=Decimal("12.00"), unit=unit,
+        )
+        csv_file = io.BytesIO(
+            b"product_code,name,description,unit_buying_price,markup_percentage,unit_price,quantity,min_stock_threshold,unit,discount,discount_quantity\n"
+            b"IMP-1,New name,Updated,10.00,25,1,8,2,carton,0.50,6\n"
+            b"IMP-2,Fresh,Brand new,4.00,,5.00,3,1,carton,0.20,6\n"
+            b"IMP-3,Broken,No unit,4.00,,5.00,3,1,crate,0.20,6\n"
+        )
+
+        report = import_products(iter_rows(csv_file, "catalog.csv"), user, chunk_size=2)
+
+        self.assertEqual((report["created"], report["updated"], report["failed"]), (1, 1, 1))
+        self.assertEqual(report["errors"][0]["row"], 4)
+        updated = Product.objects.get(product_code="IMP-1")
+        self.assertEqual((updated.name, updated.unit_price, updated.quantity), ("New name", Decimal("12.50"), 8))
+        self.assertEqual(Product.objects.get(product_code="IMP-2").markup_percentage, Decimal("25.00"))
+        self.assertEqual(StockHistory.objects.filter(action="Stock In").count(), 2)
+
+    def test_repeated_batch_number_fails_only_its_row(self):
+        user = User.objects.create_user(username="importer", password="pass")
+        Unit.objects.create(name="carton")
+        csv_file = io.BytesIO(
+            b"product_code,name,description,unit_buying_price,unit_price,quantity,min_stock_threshold,unit,batch_number,expiry_date,expiry_min_threshold_days,discount,discount_quantity\n"
+            b"IMP-4,First,One,4.00,5.00,3,1,carton,LOT-7,2030-01-01,30,0.20,6\n"
+            b"IMP-5,Second,Two,4.00,5.00,3,1,carton,LOT-7,2030-01-01,30,0.20,6\n"
+        )
+
+        report = import_products(iter_rows(csv_file, "catalog.csv"), user)
+
+        self.assertEqual((report["created"], report["failed"]), (1, 1))
+        self.assertEqual(report["errors"], [{"row": 3, "errors": {"batch_number": ["Appears more than once in the file."]}}])
+
+
+class RepricingTests(TestCase):
+
+    def test_markup_rule_dry_run_then_apply(self):
+        unit = Unit.objects.create(name="pack")
+        drinks = Category.objects.create(name="Drinks")
+        product = Product.objects.create(
+            product_code="REP-1", name="Juice", description="Juice", quantity=5, min_stock_threshold=1,
+            unit_buying_price=Decimal("10.00"), unit_price=Decimal("12.00"), discount=Decimal("0.50"),
+            unit=unit, category=drinks,
+        )
+        Product.objects.create(
+            product_code="REP-2", name="Soap", description="Soap", quantity=5, min_stock_threshold=1,
+            unit_buying_price=Decimal("10.00"), unit_price=Decimal("12.00"), unit=unit,
+        )
+
+        preview = reprice("markup", Decimal("25"), dry_run=True, category=drinks)
+        self.assertEqual((preview["matched"], preview["changed"]), (1, 1))
+        product.refresh_from_db()
+        self.assertEqual(product.unit_price, Decimal("12.00"))
+
+        reprice("markup", Decimal("25"), category=drinks)
+        product.refresh_from_db()
+        expected = Product(unit_buying_price=Decimal("10.00"), markup_percentage=Decimal("25"),
+                           discount=Decimal("0.50"), discount_percentage=Decimal("4.17"))
+        expected.derive_fields()
+        self.assertEqual((product.unit_price, product.discount), (expected.unit_price, expected.discount))
+        self.assertEqual(Product.objects.get(product_code="REP-2").unit_price, Decimal("12.00"))
+
+    def test_vat_rule_sets_vat_per_unit_from_each_price(self):
+        unit = Unit.objects.create(name="tin")
+        for code, buying in (("VAT-1", "10.00"), ("VAT-2", "40.00")):
+            Product.objects.create(
+                product_code=code, name=code, description=code, quantity=5, min_stock_threshold=1,
+                unit_buying_price=Decimal(buying), markup_percentage=Decimal("25"), unit=unit,
+                apply_vat=True, vat_value=Decimal("0.00"),
+            )
+
+        reprice("vat", Decimal("7.5"))
+
+        self.assertEqual(
+            dict(Product.objects.values_list("product_code", "vat_value")),
+            {"VAT-1": Decimal("0.94"), "VAT-2": Decimal("3.75")},
+        )
+
+
+class SupplierBadgeTests(TestCase):
+
+    def test_badges_follow_supply_ranking(self):
+        unit = Unit.objects.create(name="box")
+        product = Product.objects.create(
+            product_code="SUP-1", name="Rice", description="Rice", quantity=1, min_stock_threshold=1,
+            unit_buying_price=Decimal("10.00"), unit_price=Decimal("12.00"), unit=unit,
+        )
+        big, middle, small = (Supplier.objects.create(name=name) for name in ("Big", "Middle", "Small"))
+        for supplier, quantity in ((big, 50), (middle, 20), (small, 5)):
+            SupplierProductSupply.objects.create(supplier=supplier, product=product, quantity_supplied=quantity)
+
+        with mock.patch.object(Supplier, "TOP_BADGE_LIMIT", 1), mock.patch.object(Supplier, "LOW_BADGE_LIMIT", 1):
+            self.assertEqual(Supplier.update_badges(), 3)
+            self.assertEqual(Supplier.update_badges(), 0)
+
+        badges = dict(Supplier.objects.values_list("name", "badge"))
+        self.assertEqual(badges, {"Big": "Top Supplier", "Middle": "Normal Supplier", "Small": "Low Supplier"})
+
+
+class InventoryPaginationTests(TestCase):
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create_user(username="grid", password="pass"))
+        unit = Unit.objects.create(name="tin")
+        for n in range(3):
+            Product.objects.create(
+                product_code=f"PAGE-{n}", name=f"Paged {n}", description="Paged", quantity=1, min_stock_threshold=1,
+                unit_buying_price=Decimal("1.00"), unit_price=Decimal("2.00"), unit=unit,
+            )
+
+    def test_cursor_pages_with_sparse_fields(self):
+        first = self.client.get(reverse("product-list"), {"page_size": 2, "fields": "id,name"})
+        self.assertEqual([set(row) for row in first.data["results"]], [{"id", "name"}] * 2)
+
+        second = self.client.get(first.data["next"])
+        names = [row["name"] for row in first.data["results"] + second.data["results"]]
+        self.assertEqual(names, ["Paged 0", "Paged 1", "Paged 2"])
+        self.assertIsNone(second.data["next"])
+
+    def test_unpaginated_list_is_unchanged(self):
+        response = self.client.get(reverse("product-list"))
+        self.assertEqual(len(response.data), 3)
+        self.assertIn("unit_price", response.data[0])
+
+
+class BatchStatusTests(TestCase):
+
+    def test_sql_status_matches_property_and_alerts(self):
+        user = User.objects.create_user(username="batches", password="pass")
+        unit = Unit.objects.create(name="bag")
+        product = Product.objects.create(
+            product_code="BATCH-1", name="Flour", description="Flour", quantity=40, min_stock_threshold=1,
+            unit_buying_price=Decimal("1.00"), unit_price=Decimal("2.00"), unit=unit,
+        )
+        today = timezone.now().date()
+        for number, quantity, days, threshold in (
+            ("B-SOLD", 0, -3, None), ("B-NONE", 5, None, None), ("B-OLD", 5, -1, 7),
+            ("B-SOON", 5, 3, 7), ("B-LATER", 5, 30, 7),
+        ):
+            ProductBatch.objects.create(
+                product=product, batch_number=number, quantity_left=quantity, created_by=user,
+                expiry_date=today + timedelta(days=days) if days is not None else None,
+                expiry_min_threshold_days=threshold,
+            )
+
+        for batch in ProductBatch.objects.with_status(today):
+            self.assertEqual(batch.expiry_status, batch.status)
+        # One range query, no scan of the batch table for the widest window first
+        with self.assertNumQueries(1):
+            alerts = list(ProductBatch.objects.expiry_alerts(today).order_by('expiry_date'))
+        self.assertEqual([b.batch_number for b in alerts], ["B-OLD", "B-SOON"])
+
+
+class StockLedgerTests(TestCase):
+
+    def test_keyset_pages_walk_the_ledger_newest_first(self):
+        user = User.objects.create_user(username="ledger", password="pass")
+        client = APIClient()
+        client.force_authenticate(user)
+        unit = Unit.objects.create(name="sack")
+        product = Product.objects.create(
+            product_code="LEDGER-1", name="Beans", description="Beans", quantity=1, min_stock_threshold=1,
+            unit_buying_price=Decimal("1.00"), unit_price=Decimal("2.00"), unit=unit,
+        )
+        entries = [
+            StockHistory.objects.create(product=product, action="Stock In", quantity=n, action_by=user)
+            for n in range(1, 4)
+        ]
+        StockHistory.objects.update(date=timezone.now())  # identical dates: ties broken by id
+
+        first = client.get(reverse("get-all-stock-history"), {"page_size": 2, "action": "stock in", "count": "exact"})
+        second = client.get(first.data["next"])
+
+        seen = [row["id"] for row in first.data["results"] + second.data["results"]]
+        self.assertEqual(seen, [entry.pk for entry in reversed(entries)])
+        self.assertEqual(first.data["count"], 3)
+        self.assertIsNone(second.data["next"])
+
+        for query, expected in (("EANS", 3), ("LEDGER-1", 3), ("rice", 0)):
+            page = client.get(reverse("get-all-stock-history"), {"page_size": 10, "product": query})
+            self.assertEqual(len(page.data["results"]), expected, query)
+
+
+MEDIA_DIR = tempfile.mkdtemp()
+
+
+@override_settings(
+    CHANNEL_LAYERS=IN_MEMORY_LAYERS, MEDIA_ROOT=MEDIA_DIR, PRODUCT_IMAGE_QUEUE_INLINE=False,
+    PRODUCT_IMAGE_SIZES={"thumbnail": 160, "card": 480},
+)
+class ProductImageTests(TestCase):
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(MEDIA_DIR, ignore_errors=True)
+
+    def test_upload_is_rendered_into_hashed_derivatives(self):
+        from PIL import Image
+
+        original = io.BytesIO()
+        Image.new("RGB", (1200, 600), (200, 30, 30)).save(original, "PNG")
+        product = Product.objects.create(
+            product_code="IMG", name="Image", description="Image", quantity=1, min_stock_threshold=1,
+            unit_buying_price=Decimal("1.00"), unit_price=Decimal("2.00"), unit=Unit.objects.create(name="pc"),
+            product_image=SimpleUploadedFile("photo.png", original.getvalue(), content_type="image/png"),
+        )
+
+        self.assertEqual(run_pending_jobs(), 1)
+        variants = Product.objects.get(pk=product.pk).image_variants
+        self.assertEqual(variants["source"], product.product_image.name)
+        self.assertEqual((variants["thumbnail"]["width"], variants["thumbnail"]["height"]), (160, 80))
+        self.assertEqual(variants["card"]["width"], 480)
+        self.assertTrue(variants["thumbnail"]["webp"].startswith("products/derived/photo"))
+        self.assertTrue(default_storage.exists(variants["card"]["jpeg"]))
+
+        # Saving the product again does not queue the same image twice
+        Product.objects.get(pk=product.pk).save()
+        self.assertEqual(run_pending_jobs(), 0)
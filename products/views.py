@@ -35,14 +35,22 @@ from datetime import datetime
 from rest_framework import generics, permissions
 from .models import Product
 from .serializers import ProductViewSerializer
+from .search import search_products, MIN_SUBSTRING_LENGTH
+from .barcode_cache import get_product_data, cache_stats
+from .importer import iter_rows, import_products
+from .repricing import reprice
+from .serializers import RepricingRuleSerializer, ExpiringBatchSerializer
+from .pagination import InventoryCursorPagination, wants_page, requested_fields, project, paginate, keyset_paginate
+
+from django.db.models import Prefetch
+from rest_framework.parsers import MultiPartParser, FormParser
 from django.db import transaction
 
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
 def product_batch_list(request):
-    batches = ProductBatch.objects.all()
-    serializer = ProductBatchSerializer(batches, many=True)
-    return Response(serializer.data)
+    batches = ProductBatch.objects.select_related('product')
+    return paginate(request, batches, ProductBatchSerializer)
 
 
 class ProductCreateUpdateAPIView(APIView):
@@ -146,12 +154,59 @@ class ProductCreateUpdateAPIView(APIView):
 
 
 
+class ProductRepriceAPIView(APIView):
+    """
+    Apply a markup (per category), VAT (optionally per category) or discount
+    (per supplier) rule to all matching products in one UPDATE.
+    dry_run=true returns the diff without saving.
+    """
+    permission_classes = [permissions.IsAuthenticated]
+
+    def post(self, request, *args, **kwargs):
+        serializer = RepricingRuleSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        data = serializer.validated_data
+
+        result = reprice(
+            data['rule'], data['value'], user=request.user,
+            dry_run=data['dry_run'], **serializer.scope()
+        )
+        return Response(result, status=status.HTTP_200_OK)
+
+
+class ProductImportAPIView(APIView):
+    """
+    Bulk create/update products from an uploaded CSV or XLSX `file`
+    (columns as in ProductCreateUpdateAPIView; unit / category by id or name).
+    Rows with errors are skipped and reported, the rest are imported.
+    """
+    permission_classes = [permissions.IsAuthenticated]
+    parser_classes = [MultiPartParser, FormParser]
+
+    def post(self, request, *args, **kwargs):
+        upload = request.FILES.get('file')
+        if not upload:
+            return Response({"file": "Upload a .csv or .xlsx file."}, status=status.HTTP_400_BAD_REQUEST)
+
+        dry_run = str(request.data.get('dry_run', '')).lower() in ('1', 'true', 'yes')
+        try:
+            rows = iter_rows(upload, upload.name)
+            report = import_products(rows, request.user, dry_run=dry_run)
+        except ValueError as e:
+            return Response({"file": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        return Response(report, status=status.HTTP_200_OK)
+
+
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
 def get_suppliers(request):
     suppliers = Supplier.objects.all()
-    serializer = SupplierSerializer(suppliers, many=True)
-    return Response(serializer.data)
+    if 'supplies' in (requested_fields(request) or {'supplies'}):
+        suppliers = suppliers.prefetch_related(
+            Prefetch('supplies', queryset=SupplierProductSupply.objects.select_related('product'))
+        )
+    return paginate(request, suppliers, SupplierSerializer)
 
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
@@ -170,9 +225,23 @@ def get_units(request):
 
 
 class ProductListView(generics.ListAPIView):
-    queryset = Product.objects.all()
     serializer_class = ProductViewSerializer
     permission_classes = [permissions.IsAuthenticated]
+    pagination_class = InventoryCursorPagination
+
+    def get_queryset(self):
+        return project(Product.objects.all(), self.request, related=('unit', 'category'))
+
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        context['fields'] = requested_fields(self.request)
+        return context
+
+    def paginate_queryset(self, queryset):
+        # Opt-in: without ?page_size / ?cursor the full list is returned as before
+        if not wants_page(self.request):
+            return None
+        return super().paginate_queryset(queryset)
 
 
 class ProductDetailView(generics.RetrieveAPIView):
@@ -192,16 +261,20 @@ def products_by_category(request):
     if not category_id:
         return Response({"error": "select a category to view it's details."}, status=400)
 
-    products = Product.objects.filter(category_id=category_id)
-    serializer = ProductSerializer(products, many=True)
-    return Response(serializer.data)
+    products = project(Product.objects.filter(category_id=category_id), request)
+    return paginate(request, products, ProductSerializer)
 
 
 
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
 def get_all_stock_history(request):
-    stock_history = StockHistory.objects.all().order_by('-date')
+    """
+    Stock ledger, newest first. ?cursor= or ?page_size= walks it with keyset
+    pages on (date, id) (see products.pagination.keyset_paginate); without
+    them the numbered pages are served as before.
+    """
+    stock_history = StockHistory.objects.select_related('product', 'action_by').order_by('-date', '-id')
 
     # Filters
     action = request.GET.get('action')
@@ -210,12 +283,21 @@ def get_all_stock_history(request):
     to_date = request.GET.get('to')
 
     if action:
-        stock_history = stock_history.filter(action__iexact=action)
+        # Exact match on the stored choice, so the (action, date) index applies
+        actions = {choice.lower(): choice for choice, _ in StockHistory.ACTION_CHOICES}
+        action = actions.get(action.strip().lower())
+        stock_history = stock_history.filter(action=action) if action else stock_history.none()
 
     if product:
+        # Every matching product (a subquery, not a capped search): exact code
+        # or name prefix, and name substrings once pg_trgm can index them
+        product = product.strip()
+        matches = Q(product_code=product) | Q(name__istartswith=product)
+        if len(product) >= MIN_SUBSTRING_LENGTH:
+            matches |= Q(name__icontains=product)
         stock_history = stock_history.filter(
-            Q(product__name__icontains=product) |
-            Q(reference__icontains=product)
+            Q(product__in=Product.objects.filter(matches).values('pk')) |
+            Q(reference__startswith=product)
         )
 
     if from_date:
@@ -232,6 +314,8 @@ def get_all_stock_history(request):
         except ValueError:
             pass
 
+    if wants_page(request):
+        return keyset_paginate(request, stock_history, StockHistorySerializer)
 
     # Pagination
     paginator = PageNumberPagination()
@@ -246,9 +330,21 @@ def get_all_stock_history(request):
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
 def product_batch_list(request):
-    batches = ProductBatch.objects.all()
-    serializer = ProductBatchSerializer(batches, many=True)
-    return Response(serializer.data)
+    batches = ProductBatch.objects.select_related('product')
+    return paginate(request, batches, ProductBatchSerializer)
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def expiring_batches(request):
+    """
+    In-stock batches across the store that are expired or inside their
+    expiry window, soonest first. ?status=expired|expiring narrows it.
+    """
+    wanted = request.query_params.get('status')
+    statuses = (wanted,) if wanted in ('expired', 'expiring') else ('expired', 'expiring')
+    batches = ProductBatch.objects.expiry_alerts(statuses=statuses).select_related('product').order_by('expiry_date', 'id')
+    return paginate(request, batches, ExpiringBatchSerializer, ordering='expiry_date')
 
 
 @api_view(['POST'])
@@ -456,12 +552,8 @@ class ProductSearchAPIView(generics.ListAPIView):
     permission_classes = [IsAuthenticated] 
 
     def get_queryset(self):
-        query = self.request.query_params.get('q', None)
-        if query:
-            return Product.objects.filter(
-                Q(name__icontains=query) | Q(description__icontains=query)
-            )[:10]  
-        return Product.objects.none()
+        # Ranked, index-backed matching on name, description and product_code
+        return search_products(self.request.query_params.get('q', None))
 
 
 class ProductReceiveAPIView(APIView):
@@ -499,10 +591,16 @@ def get_product_by_code(request, code):
     """
     Lookup a product by its product_code and return details for update form prefill.
     """
-    try:
-        product = Product.objects.get(product_code=code)
-    except Product.DoesNotExist:
+    # Served from the barcode cache; precise invalidation keeps prices fresh
+    data = get_product_data(code)
+    if data is None:
         return Response({"detail": "Product not found."}, status=status.HTTP_404_NOT_FOUND)
 
-    serializer = ProductViewSerializer(product)
-    return Response(serializer.data, status=status.HTTP_200_OK)
+    return Response(data, status=status.HTTP_200_OK)
+
+
+@api_view(["GET"])
+@permission_classes([IsAuthenticated])
+def barcode_cache_stats(request):
+    """Hit/miss counters of this process' barcode cache."""
+    return Response(cache_stats(), status=status.HTTP_200_OK)
@@ -1,5 +1,6 @@
 from django.contrib import admin
-from .models import Sale, SaleItem, Customer, Receipt
+from django.utils import timezone
+from .models import Sale, SaleItem, Customer, Receipt, ReceiptJob, CashierDailySummary, CustomerSpend
 
 
 class SaleItemInline(admin.TabularInline):
@@ -22,7 +23,8 @@ class SaleAdmin(admin.ModelAdmin):
     list_display = ("id", "customer", "staff", "total_amount", "sale_date", "reference")
     readonly_fields = (
         "reference", "total_cost", "total_vat", "total_discount", "total_amount",
-        "total_profit", "payment_type", "staff", "staff_name", "sale_date", "customer"
+        "total_profit", "payment_type", "staff", "staff_name", "sale_date", "customer",
+        "idempotency_key", "synced_at"
     )
     list_filter = ("sale_date", "staff_name", "payment_type")
     search_fields = ("customer__name", "staff_name", "reference")
@@ -53,6 +55,54 @@ class ReceiptAdmin(admin.ModelAdmin):
 
 
 
+@admin.register(ReceiptJob)
+class ReceiptJobAdmin(admin.ModelAdmin):
+    list_display = ("sale", "status", "attempts", "run_after", "updated_at")
+    readonly_fields = ("sale", "sale_data", "attempts", "last_error", "created_at", "updated_at")
+    list_filter = ("status",)
+    search_fields = ("sale__reference",)
+    ordering = ("-created_at",)
+    actions = ["retry_jobs"]
+
+    def has_add_permission(self, request):
+        return False
+
+    @admin.action(description="Retry selected receipt jobs")
+    def retry_jobs(self, request, queryset):
+        updated = queryset.exclude(status='done').update(status='pending', attempts=0, run_after=timezone.now())
+        self.message_user(request, f"{updated} receipt job(s) re-queued.")
+
+
+
+@admin.register(CashierDailySummary)
+class CashierDailySummaryAdmin(admin.ModelAdmin):
+    list_display = ("staff", "date", "sales_count", "total_sales", "cash_amount", "card_amount", "transfer_amount", "top_product_name")
+    list_filter = ("date",)
+    search_fields = ("staff__username", "staff__first_name", "staff__last_name")
+    ordering = ("-date",)
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+
+
+@admin.register(CustomerSpend)
+class CustomerSpendAdmin(admin.ModelAdmin):
+    list_display = ("customer", "sales_count", "total_amount", "total_qty", "updated_at")
+    search_fields = ("customer__name", "customer__phone")
+    ordering = ("-total_amount",)
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+
+
 @admin.register(SaleItem)
 class SaleItemAdmin(admin.ModelAdmin):
     list_display = ("sale", "product", "quantity", "unit_price", "amount")
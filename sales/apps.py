@@ -5,4 +5,5 @@ class SalesConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'sales'
 
-
+    def ready(self):
+        import sales.signals
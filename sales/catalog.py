@@ -0,0 +1,166 @@
+"""
+Till catalog feed built on the catalog versions in products.catalog.
+
+Full mode returns every active product. Delta mode (?since=<version>)
+returns only the products, expiring and damaged rows stamped after that
+version, plus the ids that were deleted or discontinued since.
+The columnar snapshot below is what a till downloads on boot.
+"""
+import json
+import threading
+
+from django.core.cache import cache
+
+from products.models import Product, CatalogTombstone
+from price_slash.models import ExpiringProduct, DamageProduct
+from .serializers import ProductSalesSerializer, ExpiringProductSerializer, DamagedProductSerializer
+
+try:
+    import msgpack
+except ImportError:  # optional, the snapshot falls back to JSON
+    msgpack = None
+
+try:
+    import brotli
+except ImportError:  # optional, the snapshot is sent uncompressed
+    brotli = None
+
+BROTLI_QUALITY = 9
+SNAPSHOT_TIMEOUT = 60 * 60 * 24
+
+
+def catalog_etag(version, since=None):
+    return f'"catalog-{version}"' if since is None else f'"catalog-{since}-{version}"'
+
+
+def full_catalog():
+    products = Product.objects.filter(status='active').only(*ProductSalesSerializer.Meta.fields)
+    return ProductSalesSerializer(products, many=True).data
+
+
+def catalog_delta(since, version):
+    """
+    Everything that changed after `since`. `version` is read before the rows,
+    so a change committed in between is sent again next time, never skipped.
+    """
+    changed = Product.objects.filter(catalog_version__gt=since).only(
+        'status', *ProductSalesSerializer.Meta.fields
+    )
+    products = []
+    deleted = {'product': [], 'expiring': [], 'damaged': []}
+    for product in changed:
+        if product.status == 'active':
+            products.append(product)
+        else:
+            deleted['product'].append(product.id)
+
+    for kind, object_id in CatalogTombstone.objects.filter(catalog_version__gt=since).values_list('kind', 'object_id'):
+        deleted[kind].append(object_id)
+
+    # Proposals are published (with a new version) when they are approved
+    expiring = ExpiringProduct.objects.filter(catalog_version__gt=since, is_proposal=False)
+    damaged = DamageProduct.objects.filter(catalog_version__gt=since)
+
+    return {
+        "version": version,
+        "since": since,
+        "products": ProductSalesSerializer(products, many=True).data,
+        "expiring_products": ExpiringProductSerializer(expiring, many=True).data,
+        "damaged_products": DamagedProductSerializer(damaged, many=True).data,
+        "deleted": deleted,
+    }
+
+
+# -------------------------
+# Columnar snapshot
+# -------------------------
+# One array per field instead of one object per product. Category and unit
+# are dictionary-encoded (index into "dictionaries", -1 for none) and money
+# is sent in minor units (kobo) so msgpack can pack it as integers.
+SNAPSHOT_FIELDS = [
+    'id', 'name', 'product_code', 'description', 'unit_price', 'apply_vat',
+    'vat_value', 'discount', 'discount_quantity', 'category', 'unit',
+]
+MONEY_COLUMNS = ('unit_price', 'vat_value', 'discount')
+DICTIONARY_COLUMNS = {'category': 'category__name', 'unit': 'unit__name'}
+SNAPSHOT_CACHE_PREFIX = "sales:catalog_snapshot"
+
+_snapshots = {}
+_snapshot_lock = threading.Lock()
+
+
+def _minor_units(value):
+    return int((value or 0) * 100)
+
+
+def build_snapshot(version):
+    """The active catalog at `version` as a columnar dict, from one query."""
+    lookups = [DICTIONARY_COLUMNS.get(field, field) for field in SNAPSHOT_FIELDS]
+    columns = {field: [] for field in SNAPSHOT_FIELDS}
+    dictionaries = {field: [] for field in DICTIONARY_COLUMNS}
+    indexes = {field: {} for field in DICTIONARY_COLUMNS}
+
+    rows = Product.objects.filter(status='active').order_by('pk').values_list(*lookups)
+    for row in rows.iterator(chunk_size=2000):
+        for field, value in zip(SNAPSHOT_FIELDS, row):
+            if field in MONEY_COLUMNS:
+                value = _minor_units(value)
+            elif field in DICTIONARY_COLUMNS:
+                if value is None:
+                    value = -1
+                else:
+                    index = indexes[field]
+                    if value not in index:
+                        index[value] = len(dictionaries[field])
+                        dictionaries[field].append(value)
+                    value = index[value]
+            elif field == 'discount_quantity':
+                value = value or 0
+            columns[field].append(value)
+
+    return {
+        "version": version,
+        "count": len(columns['id']),
+        "money_scale": 100,
+        "columns": columns,
+        "dictionaries": dictionaries,
+    }
+
+
+def _encode(snapshot, encoding, compress):
+    if encoding == 'msgpack':
+        body = msgpack.packb(snapshot, use_bin_type=True)
+    else:
+        body = json.dumps(snapshot, separators=(",", ":")).encode()
+    if compress:
+        body = brotli.compress(body, quality=BROTLI_QUALITY)
+    return body
+
+
+def get_snapshot_blob(version, encoding='json', compress=False):
+    """
+    Encoded snapshot for `version`, built once and then served from this
+    process' memo or the shared cache until the catalog version moves.
+    """
+    if encoding == 'msgpack' and msgpack is None:
+        raise ValueError("msgpack is not installed.")
+    if compress and brotli is None:
+        raise ValueError("brotli is not installed.")
+
+    key = f"{SNAPSHOT_CACHE_PREFIX}:{version}:{encoding}:{'br' if compress else 'raw'}"
+    blob = _snapshots.get(key)
+    if blob is not None:
+        return blob
+
+    with _snapshot_lock:
+        blob = _snapshots.get(key)
+        if blob is None:
+            blob = cache.get(key)
+        if blob is None:
+            blob = _encode(build_snapshot(version), encoding, compress)
+            cache.set(key, blob, timeout=SNAPSHOT_TIMEOUT)
+        # Older versions are never asked for again
+        for stale in [k for k in _snapshots if not k.startswith(f"{SNAPSHOT_CACHE_PREFIX}:{version}:")]:
+            del _snapshots[stale]
+        _snapshots[key] = blob
+    return blob
@@ -0,0 +1,133 @@
+import zlib
+from decimal import Decimal, ROUND_HALF_UP
+
+from django.db import connection
+from django.utils import timezone
+
+from .models import Sale
+from .receipts import enqueue_receipt
+from .stock import deduct_sale_stock, IMBALANCE_NOTE
+from .summary import add_sale_to_summary, add_sale_to_customer_spend
+
+
+IDEMPOTENCY_HEADER = "HTTP_IDEMPOTENCY_KEY"
+IDEMPOTENCY_KEY_MAX_LENGTH = Sale._meta.get_field('idempotency_key').max_length
+
+
+def get_idempotency_key(request):
+    """
+    Read the client-generated sale token from the Idempotency-Key header or
+    the `idempotency_key` body field. Returns None when the till sent none.
+    """
+    key = request.META.get(IDEMPOTENCY_HEADER) or request.data.get('idempotency_key')
+    if not key:
+        return None
+    key = str(key).strip()
+    if len(key) > IDEMPOTENCY_KEY_MAX_LENGTH:
+        raise ValueError(f"Idempotency key must be at most {IDEMPOTENCY_KEY_MAX_LENGTH} characters.")
+    return key or None
+
+
+def find_sale_by_key(key):
+    if not key:
+        return None
+    return (
+        Sale.objects.select_related('receipt', 'receipt_job')
+        .filter(idempotency_key=key)
+        .first()
+    )
+
+
+def lock_sale_key(key):
+    """
+    Serialise transactions submitting the same key. On PostgreSQL this takes a
+    transaction-scoped advisory lock; the unique constraint on
+    Sale.idempotency_key is the backstop everywhere else.
+    Must be called inside transaction.atomic().
+    """
+    if connection.vendor != 'postgresql':
+        return
+    lock_id = zlib.crc32(f"sale:{key}".encode())
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT pg_advisory_xact_lock(%s)", [lock_id])
+
+
+def build_receipt_data(sale, items, username):
+    """The sale_data dict the receipt renderers consume."""
+    items_list = []
+    subtotal = Decimal("0.00")
+
+    for item in items:
+        amount = item.unit_price * item.quantity
+        subtotal += amount
+        items_list.append({
+            "description": f"{item.product.description} {' (EP)' if item.sale_type == 'expiring' else ' (DM)' if item.sale_type == 'damaged' else ''}",
+            "qty": f"{item.quantity}{getattr(item.product.unit, 'name', '')}{'s' if item.quantity > 1 and getattr(item.product.unit, 'name', '') else ''}",
+            "unit_price": item.unit_price,
+            "amount": amount,
+        })
+
+    # Discounts and VAT as priced by the server (sales.pricing)
+    total_discount = sale.total_discount
+    total_vat = sale.total_vat
+    grand_total = subtotal + total_vat - total_discount
+
+    sale_data = {
+        "receipt_no": sale.id,
+        "cashier_name": username,
+        "datetime": sale.sale_date.strftime("%Y-%m-%d %H:%M:%S"),
+        "customer_name": getattr(sale.customer, "name", "N/A") if sale.customer else "N/A",
+        "customer_phone": getattr(sale.customer, "phone", "N/A") if sale.customer else "N/A",
+        "items": items_list,
+        "subtotal": subtotal,
+        "discount": total_discount,
+        "vat": total_vat,
+        "grand_total": grand_total,
+        "reference": sale.reference,
+    }
+
+    # Convert all numeric values to Decimal safely
+    for key in ['subtotal', 'discount', 'vat', 'grand_total']:
+        sale_data[key] = Decimal(str(sale_data.get(key, '0.00'))).quantize(Decimal("0.01"), rounding=ROUND_HALF_UP)
+
+    return sale_data
+
+
+def record_sale(serializer, user, idempotency_key=None, sale_date=None):
+    """
+    Save a validated SaleSerializer, deduct stock and queue the receipt.
+
+    `sale_date` is the till's timestamp for a sale made offline: it replaces
+    the server time, marks the sale as synced and lets stock shortfalls
+    through as "(Stock imbalance)" since the goods have already left.
+    The lines that were short are left on `sale.stock_imbalances`.
+    Must be called inside transaction.atomic().
+    """
+    sale = serializer.save(idempotency_key=idempotency_key)
+    offline = sale_date is not None
+    if offline:
+        # sale_date is auto_now_add, so it can only be overridden after the insert
+        sale.sale_date = min(sale_date, timezone.now())
+        sale.synced_at = timezone.now()
+        Sale.objects.filter(pk=sale.pk).update(sale_date=sale.sale_date, synced_at=sale.synced_at)
+
+    items = list(sale.items.select_related('product', 'product__unit').order_by('pk'))
+
+    # Lock and deduct Product / Expiring / Damaged / batch stock in bulk
+    history = deduct_sale_stock(items, user, allow_shortfall=offline)
+    sale.stock_imbalances = [
+        item for item, entry in zip(items, history) if entry.notes.endswith(IMBALANCE_NOTE)
+    ]
+    add_sale_to_summary(sale, items)
+    username = user.get_full_name() or user.username or "Cashier"
+
+    sale_data = build_receipt_data(sale, items, username)
+
+    #save to Sale safely
+    sale.total_amount = sale_data['grand_total']
+    sale.save(update_fields=['total_amount'])
+    add_sale_to_customer_spend(sale, items)
+
+    # Rendering, storage and printing happen after commit in the receipt worker
+    enqueue_receipt(sale, sale_data)
+    return sale
@@ -0,0 +1,65 @@
+import time
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+
+from sales.utils import generate_receipt, get_receipt_template
+
+
+def sample_sale_data(receipt_no, item_count):
+    items = [
+        {
+            "description": f"Sample product {i} 500ml bottle",
+            "qty": f"{i % 5 + 1}pcs",
+            "unit_price": Decimal("1250.00"),
+            "amount": Decimal("1250.00") * (i % 5 + 1),
+        }
+        for i in range(item_count)
+    ]
+    subtotal = sum((item["amount"] for item in items), Decimal("0.00"))
+    return {
+        "receipt_no": receipt_no,
+        "cashier_name": "Benchmark",
+        "datetime": "2025-01-01 12:00:00",
+        "customer_name": "N/A",
+        "customer_phone": "N/A",
+        "items": items,
+        "subtotal": subtotal,
+        "discount": Decimal("0.00"),
+        "vat": Decimal("0.00"),
+        "grand_total": subtotal,
+        "reference": f"Sale-bench{receipt_no:08d}",
+    }
+
+
+class Command(BaseCommand):
+    help = "Report receipts per second with a cold (rebuilt every receipt) and a cached receipt template."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--count", type=int, default=200, help="Receipts rendered per run")
+        parser.add_argument("--items", type=int, default=10, help="Line items per receipt")
+
+    def run(self, count, items, cached):
+        sales = [sample_sale_data(n, items) for n in range(1, count + 1)]
+        get_receipt_template(force_rebuild=True)
+        size = 0
+        start = time.perf_counter()
+        for sale_data in sales:
+            template = get_receipt_template(force_rebuild=not cached)
+            buffer = generate_receipt(sale_data, template=template)
+            size += len(buffer.getvalue())
+            buffer.close()
+        elapsed = time.perf_counter() - start
+        return count / elapsed, size / count
+
+    def handle(self, *args, **options):
+        count = options["count"]
+        items = options["items"]
+
+        cold_rate, cold_size = self.run(count, items, cached=False)
+        warm_rate, warm_size = self.run(count, items, cached=True)
+
+        self.stdout.write(f"{count} receipts, {items} items each")
+        self.stdout.write(f"  cold template:   {cold_rate:8.1f} receipts/s  {cold_size / 1024:8.1f} KB/receipt")
+        self.stdout.write(f"  cached template: {warm_rate:8.1f} receipts/s  {warm_size / 1024:8.1f} KB/receipt")
+        self.stdout.write(self.style.SUCCESS(f"Speed-up: {warm_rate / cold_rate:.1f}x"))
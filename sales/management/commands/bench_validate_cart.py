@@ -0,0 +1,70 @@
+import time
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+
+from products.models import Product, Unit
+from sales.pricing import price_cart, invalidate_price_table
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = "Time cart pricing for 1/10/100-line carts against throwaway products (rolled back)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--sizes", type=int, nargs="+", default=[1, 10, 100])
+        parser.add_argument("--repeat", type=int, default=50, help="Pricing runs per cart size")
+
+    def handle(self, *args, **options):
+        sizes = options["sizes"]
+        repeat = options["repeat"]
+        try:
+            with transaction.atomic():
+                self.bench(sizes, repeat)
+                raise Rollback
+        except Rollback:
+            pass
+
+    def bench(self, sizes, repeat):
+        unit, _ = Unit.objects.get_or_create(name="bench")
+        products = Product.objects.bulk_create([
+            Product(
+                product_code=f"BENCH-CART-{i}",
+                name=f"Bench product {i}",
+                description=f"Bench product {i}",
+                quantity=1000,
+                min_stock_threshold=1,
+                unit_buying_price=Decimal("100.00"),
+                unit_price=Decimal("125.50"),
+                discount=Decimal("10.00"),
+                discount_quantity=6,
+                apply_vat=bool(i % 2),
+                vat_value=Decimal("7.50"),
+                unit=unit,
+            )
+            for i in range(max(sizes))
+        ])
+        # bulk_create skips post_save, so drop the memoized price table by hand
+        invalidate_price_table()
+
+        for size in sizes:
+            cart = [
+                {"checker": f"{product.id}-sales", "sale_type": "sales", "quantity": 12}
+                for product in products[:size]
+            ]
+            invalidate_price_table()
+            with CaptureQueriesContext(connection) as ctx:
+                price_cart(cart)
+            queries = len(ctx.captured_queries)
+
+            start = time.perf_counter()
+            for _ in range(repeat):
+                price_cart(cart)
+            elapsed_ms = (time.perf_counter() - start) * 1000 / repeat
+
+            self.stdout.write(f"{size:>4} lines: {elapsed_ms:8.2f} ms/cart  {queries} queries on a cold price table")
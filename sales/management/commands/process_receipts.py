@@ -0,0 +1,31 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from sales.receipts import run_pending_jobs
+
+
+class Command(BaseCommand):
+    help = "Render, store and print queued sale receipts."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch", type=int, default=10, help="Jobs claimed per poll")
+        parser.add_argument("--interval", type=float, default=1.0, help="Seconds to sleep when the queue is empty")
+        parser.add_argument("--once", action="store_true", help="Process one batch and exit")
+
+    def handle(self, *args, **options):
+        batch = options["batch"]
+        interval = options["interval"]
+
+        if options["once"]:
+            processed = run_pending_jobs(batch)
+            self.stdout.write(self.style.SUCCESS(f"Processed {processed} receipt job(s)"))
+            return
+
+        self.stdout.write("Receipt worker started")
+        try:
+            while True:
+                if not run_pending_jobs(batch):
+                    time.sleep(interval)
+        except KeyboardInterrupt:
+            self.stdout.write("Receipt worker stopped")
@@ -0,0 +1,88 @@
+from datetime import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from sales.models import SaleItem, CashierDailySummary, CashierDailyProductTotal
+from sales.summary import compute_summaries, PAYMENT_FIELDS
+
+
+COMPARED_FIELDS = ['sales_count', 'total_sales', 'top_product_qty'] + list(PAYMENT_FIELDS.values())
+
+
+def parse_date(value):
+    try:
+        return datetime.strptime(value, "%Y-%m-%d").date()
+    except ValueError:
+        raise CommandError(f"Invalid date '{value}', expected YYYY-MM-DD")
+
+
+class Command(BaseCommand):
+    help = "Recompute CashierDailySummary rollups from raw sales (backfill), or audit them with --check."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--from", dest="date_from", help="First day to rebuild (YYYY-MM-DD)")
+        parser.add_argument("--to", dest="date_to", help="Last day to rebuild (YYYY-MM-DD)")
+        parser.add_argument("--staff", type=int, help="Only rebuild this staff user id")
+        parser.add_argument("--check", action="store_true", help="Report differences without writing")
+
+    def handle(self, *args, **options):
+        sale_items = SaleItem.objects.all()
+        summaries = CashierDailySummary.objects.all()
+
+        if options["date_from"]:
+            day = parse_date(options["date_from"])
+            sale_items = sale_items.filter(sale__sale_date__date__gte=day)
+            summaries = summaries.filter(date__gte=day)
+        if options["date_to"]:
+            day = parse_date(options["date_to"])
+            sale_items = sale_items.filter(sale__sale_date__date__lte=day)
+            summaries = summaries.filter(date__lte=day)
+        if options["staff"]:
+            sale_items = sale_items.filter(sale__staff_id=options["staff"])
+            summaries = summaries.filter(staff_id=options["staff"])
+
+        computed = compute_summaries(sale_items)
+
+        if options["check"]:
+            self.check_summaries(computed, summaries)
+            return
+
+        with transaction.atomic():
+            summaries.delete()
+            rows = [data["summary"] for data in computed.values()]
+            CashierDailySummary.objects.bulk_create(rows, batch_size=1000)
+
+            products = []
+            for data in computed.values():
+                for product_total in data["products"].values():
+                    product_total.summary = data["summary"]
+                    products.append(product_total)
+            CashierDailyProductTotal.objects.bulk_create(products, batch_size=1000)
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Rebuilt {len(rows)} cashier day(s) with {len(products)} product total(s)"
+        ))
+
+    def check_summaries(self, computed, summaries):
+        stored = {(s.staff_id, s.date): s for s in summaries}
+        mismatches = 0
+
+        for key in sorted(set(stored) | set(computed), key=lambda k: (k[1], k[0])):
+            expected = computed.get(key, {}).get("summary")
+            actual = stored.get(key)
+            if expected is None or actual is None:
+                mismatches += 1
+                self.stdout.write(f"staff {key[0]} {key[1]}: {'missing rollup' if actual is None else 'no sales for rollup'}")
+                continue
+            for field in COMPARED_FIELDS:
+                if getattr(expected, field) != getattr(actual, field):
+                    mismatches += 1
+                    self.stdout.write(
+                        f"staff {key[0]} {key[1]}: {field} is {getattr(actual, field)}, expected {getattr(expected, field)}"
+                    )
+
+        if mismatches:
+            self.stdout.write(self.style.WARNING(f"{mismatches} difference(s) found"))
+        else:
+            self.stdout.write(self.style.SUCCESS(f"{len(stored)} rollup(s) match raw sales"))
@@ -0,0 +1,44 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction, close_old_connections
+
+from sales.models import Customer, CustomerSpend
+from sales.summary import compute_customer_spend
+
+
+class Command(BaseCommand):
+    help = "Recalculate customer badges from the CustomerSpend rollup, once or on a fixed interval."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--interval", type=float, default=3600.0, help="Seconds between runs")
+        parser.add_argument("--once", action="store_true", help="Update badges once and exit")
+        parser.add_argument("--rebuild", action="store_true",
+                            help="Recompute the CustomerSpend rollup from raw sales first (backfill)")
+
+    def handle(self, *args, **options):
+        if options["rebuild"]:
+            rows = compute_customer_spend()
+            with transaction.atomic():
+                CustomerSpend.objects.all().delete()
+                CustomerSpend.objects.bulk_create(rows, batch_size=1000)
+            self.stdout.write(f"Rebuilt spend for {len(rows)} customer(s)")
+
+        if options["once"]:
+            updated = Customer.update_all_badges()
+            self.stdout.write(self.style.SUCCESS(f"Updated {updated} customer badge(s)"))
+            return
+
+        self.stdout.write("Customer badge job started")
+        try:
+            while True:
+                close_old_connections()
+                try:
+                    updated = Customer.update_all_badges()
+                    self.stdout.write(f"Updated {updated} customer badge(s)")
+                except Exception as e:
+                    # Keep the schedule alive, the next run recomputes everything
+                    self.stderr.write(f"Customer badge update failed: {e}")
+                time.sleep(options["interval"])
+        except KeyboardInterrupt:
+            self.stdout.write("Customer badge job stopped")
@@ -1,15 +1,14 @@
 from django.db import models
 from products.models import Product
+from products.references import next_reference
 from decimal import Decimal
 from django.contrib.auth import get_user_model
-from django.db.models import Sum, F, Value, IntegerField
-from django.db.models.functions import Coalesce
-import uuid
-from django.db import IntegrityError
-from django.db import models, transaction
+from django.db.models import F, Value, IntegerField
+from django.db import models, transaction, connection
 from products.models import Product
 from django.utils import timezone
 import datetime
+from django.core.serializers.json import DjangoJSONEncoder
 
 
 User = get_user_model()
@@ -43,36 +42,76 @@ class Customer(models.Model):
 
 
 
+    TOP_BADGE_LIMIT = 10
+    LOW_BADGE_LIMIT = 10
+    # Score = amount spent + QUANTITY_WEIGHT per item bought
+    QUANTITY_WEIGHT = 10
+
     @classmethod
     def update_all_badges(cls):
-        # Annotate customers with total_amount and total_qty
-        annotated_customers = cls.objects.annotate(
-            total_amount=Coalesce(Sum('sales__total_amount'), 0),
-            total_qty=Coalesce(Sum('sales__items__quantity'), 0)
-        )
-
-        customer_data = [
-            (customer, customer.total_amount + (customer.total_qty * 10))
-            for customer in annotated_customers
-        ]
+        """
+        Rank customers by their CustomerSpend score and write Top / Normal /
+        Low Customer badges in one UPDATE ... FROM. Only customers whose badge
+        changes are written. Returns how many were updated.
+        """
+        customer_table = cls._meta.db_table
+        spend_table = CustomerSpend._meta.db_table
+        sql = f"""
+            UPDATE {customer_table} AS c
+            SET badge = ranked.badge
+            FROM (
+                SELECT id,
+                       CASE
+                           WHEN position <= %s THEN 'Top Customer'
+                           WHEN position > total - %s THEN 'Low Customer'
+                           ELSE 'Normal Customer'
+                       END AS badge
+                FROM (
+                    SELECT cust.id,
+                           ROW_NUMBER() OVER (
+                               ORDER BY COALESCE(spend.total_amount + spend.total_qty * %s, 0) DESC, cust.id
+                           ) AS position,
+                           COUNT(*) OVER () AS total
+                    FROM {customer_table} AS cust
+                    LEFT JOIN {spend_table} AS spend ON spend.customer_id = cust.id
+                ) AS positions
+            ) AS ranked
+            WHERE c.id = ranked.id
+              AND (c.badge IS NULL OR c.badge <> ranked.badge)
+        """
+        with connection.cursor() as cursor:
+            cursor.execute(sql, [cls.TOP_BADGE_LIMIT, cls.LOW_BADGE_LIMIT, cls.QUANTITY_WEIGHT])
+            return cursor.rowcount
 
-        ranked = sorted(customer_data, key=lambda x: x[1], reverse=True)
 
-        top_customers = [c for c, _ in ranked[:10]]
-        low_customers = [c for c, _ in ranked[-10:]]
+class CustomerSpend(models.Model):
+    """
+    Running totals of a customer's purchases, incremented inside the
+    create_sale transaction. Badge ranking reads these instead of the sales;
+    rebuilt from raw sales with `manage.py update_customer_badges --rebuild`.
+    """
+    customer = models.OneToOneField(Customer, on_delete=models.CASCADE, primary_key=True, related_name="spend")
+    sales_count = models.PositiveIntegerField(default=0)
+    total_amount = models.DecimalField(max_digits=14, decimal_places=2, default=Decimal('0.00'))
+    total_qty = models.PositiveIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
 
-        for customer, _ in ranked:
-            if customer in top_customers:
-                customer.badge = "Top Customer"
-            elif customer in low_customers:
-                customer.badge = "Low Customer"
-            else:
-                customer.badge = "Normal Customer"
-            customer.save()
+    def __str__(self):
+        return f"{self.customer}: {self.total_amount} ({self.total_qty} items)"
 
 
 class Sale(models.Model):
+    REFERENCE_PREFIX = "Sale"
+
     reference = models.CharField(max_length=100, unique=True, editable=False, blank=True)
+    idempotency_key = models.CharField(
+        max_length=64,
+        unique=True,
+        null=True,
+        blank=True,
+        editable=False,
+        help_text="Client-generated sale token; retries with the same key return this sale"
+    )
     customer = models.ForeignKey(
         Customer,
         on_delete=models.SET_NULL,
@@ -106,6 +145,12 @@ class Sale(models.Model):
     total_amount = models.DecimalField(max_digits=14, decimal_places=2, editable=False, default=Decimal('0.00'))
     total_profit = models.DecimalField(max_digits=14, decimal_places=2, default=0)
     sale_date = models.DateTimeField(auto_now_add=True)
+    synced_at = models.DateTimeField(
+        null=True,
+        blank=True,
+        editable=False,
+        help_text="Set when the sale was made offline and uploaded later; sale_date is then the till's time"
+    )
 
     def save(self, *args, **kwargs):
         # Auto-set staff_name when creating
@@ -113,13 +158,7 @@ class Sale(models.Model):
             self.staff_name = self.staff.get_full_name() or self.staff.username
         # Generate unique reference if blank
         if not self.reference:
-            for _ in range(10):
-                ref = f"Sale-{uuid.uuid4().hex[:12]}"
-                if not Sale.objects.filter(reference=ref).exists():
-                    self.reference = ref
-                    break
-            else:
-                raise IntegrityError("Could not generate unique sale reference")
+            self.reference = next_reference(self.REFERENCE_PREFIX)
         super().save(*args, **kwargs)
 
     def __str__(self):
@@ -162,3 +201,77 @@ class Receipt(models.Model):
 
     def is_expired(self):
         return timezone.now() > self.created_at + datetime.timedelta(days=30)
+
+
+class ReceiptJob(models.Model):
+    """
+    Queued receipt render/print for a committed sale.
+    Processed outside the checkout transaction by `manage.py process_receipts`
+    (or in-process when RECEIPT_QUEUE_INLINE is on).
+    """
+    STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('processing', 'Processing'),
+        ('done', 'Done'),
+        ('failed', 'Failed'),
+    ]
+
+    sale = models.OneToOneField("Sale", on_delete=models.CASCADE, related_name="receipt_job")
+    sale_data = models.JSONField(encoder=DjangoJSONEncoder)
+    status = models.CharField(max_length=12, choices=STATUS_CHOICES, default='pending')
+    attempts = models.PositiveIntegerField(default=0)
+    max_attempts = models.PositiveIntegerField(default=5)
+    last_error = models.TextField(blank=True, null=True)
+    run_after = models.DateTimeField(default=timezone.now)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'run_after']),
+        ]
+
+    def __str__(self):
+        return f"Receipt job for {self.sale_id} ({self.status})"
+
+
+class CashierDailySummary(models.Model):
+    """
+    Running totals of one cashier's sales for one (local) day.
+    Incremented inside the create_sale transaction; rebuilt from raw sales
+    with `manage.py rebuild_cashier_summaries`.
+    """
+    staff = models.ForeignKey(User, on_delete=models.CASCADE, related_name="daily_summaries")
+    date = models.DateField()
+    sales_count = models.PositiveIntegerField(default=0)
+    total_sales = models.DecimalField(max_digits=14, decimal_places=2, default=Decimal('0.00'))
+    cash_amount = models.DecimalField(max_digits=14, decimal_places=2, default=Decimal('0.00'))
+    card_amount = models.DecimalField(max_digits=14, decimal_places=2, default=Decimal('0.00'))
+    transfer_amount = models.DecimalField(max_digits=14, decimal_places=2, default=Decimal('0.00'))
+    top_product_name = models.CharField(max_length=255, blank=True)
+    top_product_qty = models.PositiveIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['staff', 'date'], name='unique_cashier_daily_summary'),
+        ]
+
+    def __str__(self):
+        return f"{self.staff} - {self.date}: {self.total_sales}"
+
+
+class CashierDailyProductTotal(models.Model):
+    summary = models.ForeignKey(CashierDailySummary, on_delete=models.CASCADE, related_name="products")
+    product = models.ForeignKey(Product, on_delete=models.CASCADE)
+    product_name = models.CharField(max_length=255)
+    quantity = models.PositiveIntegerField(default=0)
+    amount = models.DecimalField(max_digits=14, decimal_places=2, default=Decimal('0.00'))
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['summary', 'product'], name='unique_cashier_daily_product'),
+        ]
+
+    def __str__(self):
+        return f"{self.product_name} x {self.quantity} ({self.summary.date})"
@@ -0,0 +1,288 @@
+"""
+Shared pricing engine for the till.
+
+validate_cart and SaleSerializer both price baskets through price_basket(),
+so discounts, VAT and profit are computed one way. Prices come from an
+immutable PriceTable snapshot of Product / ExpiringProduct / DamageProduct.
+
+validate_cart uses a snapshot memoized per process, rebuilt after the
+post_save / post_delete signals in sales.signals call
+invalidate_price_table() and at least every PRICE_TABLE_TTL seconds: the
+version that tells other processes about a change only travels through a
+shared cache (Redis), not the per-process default. Checkout never uses the
+memo; it prices from a table of just the basket's rows read at the time of
+sale (basket_price_table()).
+"""
+import hashlib
+import json
+import threading
+import time
+from collections import defaultdict, namedtuple
+from decimal import Decimal, ROUND_HALF_UP
+from types import MappingProxyType
+
+from django.conf import settings
+from django.core.cache import cache
+
+from products.models import Product
+from price_slash.models import ExpiringProduct, DamageProduct
+
+
+ZERO = Decimal("0.00")
+CENT = Decimal("0.01")
+
+# Shared across processes when CACHES points at a shared backend (e.g. Redis)
+VERSION_CACHE_KEY = "sales:price_table_version"
+
+NOT_FOUND_MESSAGES = {
+    'sales': "Product not found",
+    'damaged': "Damaged product not found",
+    'expiring': "Expiring product not found",
+}
+
+# One priceable row. For 'sales' rows `available` is None (stock is not
+# clamped at the till); for damaged/expiring rows it is the slashed quantity.
+PriceRow = namedtuple("PriceRow", [
+    "sale_type", "id", "product_id", "unit_price", "cost_price",
+    "discount", "discount_quantity", "vat_value", "available",
+])
+
+# One priced basket line, field names match SaleItem
+PricedLine = namedtuple("PricedLine", [
+    "checker", "sale_type", "row", "quantity", "unit_price", "cost_price",
+    "vat_value", "discount_value", "amount", "profit", "message",
+])
+
+
+def money(value):
+    return Decimal(str(value or 0)).quantize(CENT, rounding=ROUND_HALF_UP)
+
+
+def parse_checker(checker):
+    """
+    Checker keys look like "<id>-<suffix>". Returns the id or None if malformed.
+    """
+    try:
+        product_id_str, _ = checker.split('-')
+        return int(product_id_str)
+    except Exception:
+        return None
+
+
+class PriceTable:
+    """Immutable snapshot of every priceable row, keyed by (sale_type, id)."""
+
+    def __init__(self, version, rows):
+        self.version = version
+        self.rows = MappingProxyType(rows)
+        self.built_at = time.monotonic()
+
+    def get(self, sale_type, row_id):
+        return self.rows.get((sale_type, row_id))
+
+    @classmethod
+    def build(cls, version, only=None):
+        """
+        Snapshot every priceable row, or with `only` ({sale_type: ids}) just
+        those rows (sale types without ids are not queried).
+        """
+        def scoped(sale_type, queryset):
+            if only is None:
+                return queryset
+            if not only.get(sale_type):
+                return queryset.none()
+            return queryset.filter(pk__in=only[sale_type])
+
+        rows = {}
+
+        for (pk, unit_price, cost, discount, discount_qty, apply_vat, vat_value) in scoped('sales', Product.objects.all()).values_list(
+            'pk', 'unit_price', 'unit_buying_price', 'discount', 'discount_quantity', 'apply_vat', 'vat_value'
+        ):
+            rows[('sales', pk)] = PriceRow(
+                'sales', pk, pk, money(unit_price), money(cost),
+                money(discount), discount_qty or 0,
+                money(vat_value) if apply_vat else ZERO, None,
+            )
+
+        # Expiry scanner proposals are not sellable until approved
+        sellable = (('expiring', ExpiringProduct.objects.filter(is_proposal=False)), ('damaged', DamageProduct.objects.all()))
+        for sale_type, rows_qs in sellable:
+            for (pk, product_id, resale_price, cost, quantity) in scoped(sale_type, rows_qs).values_list(
+                'pk', 'product_id', 'resale_price', 'product__unit_buying_price', 'quantity'
+            ):
+                rows[(sale_type, pk)] = PriceRow(
+                    sale_type, pk, product_id, money(resale_price), money(cost),
+                    ZERO, 0, ZERO, quantity,
+                )
+
+        return cls(version, rows)
+
+
+_table = None
+_table_lock = threading.Lock()
+
+
+def price_version():
+    """The shared price table version (bumped by invalidate_price_table)."""
+    version = cache.get(VERSION_CACHE_KEY)
+    if version is None:
+        cache.add(VERSION_CACHE_KEY, 1, timeout=None)
+        version = cache.get(VERSION_CACHE_KEY, 1)
+    return version
+
+
+def invalidate_price_table():
+    """Drop this process' table and bump the shared version for the others."""
+    global _table
+    try:
+        cache.incr(VERSION_CACHE_KEY)
+    except ValueError:
+        cache.add(VERSION_CACHE_KEY, 1, timeout=None)
+    with _table_lock:
+        _table = None
+
+
+def _is_current(table, version):
+    ttl = getattr(settings, "PRICE_TABLE_TTL", 60)
+    return table is not None and table.version == version and time.monotonic() - table.built_at < ttl
+
+
+def get_price_table():
+    global _table
+    version = price_version()
+    table = _table
+    if _is_current(table, version):
+        return table
+    with _table_lock:
+        if not _is_current(_table, version):
+            _table = PriceTable.build(version)
+        return _table
+
+
+def basket_price_table(lines):
+    """
+    A PriceTable of only the rows `lines` refer to, read now (at most three
+    queries). Checkout prices from it so a change made in another process
+    is charged at once, whatever the cache backend.
+    """
+    ids = defaultdict(set)
+    for line in lines:
+        row_id = parse_checker(line.get('checker', ''))
+        if row_id is not None:
+            ids[line.get('sale_type', '')].add(row_id)
+    return PriceTable.build(None, only=ids)
+
+
+def price_line(row, checker, sale_type, quantity, clamp=False):
+    """
+    Price one basket line against a PriceRow.
+
+    Discount is `discount` per full block of `discount_quantity` units, VAT is
+    per unit and profit excludes VAT. With clamp=True (cart validation)
+    damaged/expiring quantities are cut to what is available.
+    """
+    message = None
+    if clamp and row.available is not None and quantity > row.available:
+        quantity = row.available
+        message = f"Quantity adjusted to available stock ({row.available})"
+
+    amount = row.unit_price * quantity
+    discount = ZERO
+    if row.discount_quantity > 0:
+        discount = row.discount * (quantity // row.discount_quantity)
+    vat = row.vat_value * quantity
+    profit = amount - discount - row.cost_price * quantity
+
+    return PricedLine(
+        checker, sale_type, row, quantity, row.unit_price, row.cost_price,
+        vat, discount, amount, profit, message,
+    )
+
+
+def price_basket(lines, clamp=False, table=None):
+    """
+    Price a whole basket in one call.
+
+    `lines` are dicts with checker / sale_type / quantity. Returns one entry
+    per input line: a PricedLine, or None for malformed / unknown keys.
+    """
+    table = table or get_price_table()
+    priced = []
+    for line in lines:
+        sale_type = line.get('sale_type', '')
+        row_id = parse_checker(line.get('checker', ''))
+        row = table.get(sale_type, row_id) if row_id is not None else None
+        if row is None:
+            priced.append(None)
+            continue
+        priced.append(price_line(row, line.get('checker', ''), sale_type, line.get('quantity', 0), clamp=clamp))
+    return priced
+
+
+def cart_hash(version, lines):
+    """Fingerprint of a cart at a given price table version."""
+    payload = json.dumps(
+        [version] + [[line.get('checker'), line.get('sale_type'), line.get('quantity')] for line in lines],
+        separators=(",", ":"),
+    )
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+def price_cart(cart_items, table=None):
+    """
+    Price a cart for validate_cart.
+
+    `cart_items` are validated CartKeySerializer dicts. Returns
+    (validated_items, totals) in the shape validate_cart responds with.
+    """
+    table = table or get_price_table()
+    priced = price_basket(cart_items, clamp=True, table=table)
+
+    validated_items = []
+    sub_total = ZERO
+    total_vat = ZERO
+    total_discount = ZERO
+
+    for item, line in zip(cart_items, priced):
+        checker = item.get('checker', '')
+        sale_type = item.get('sale_type', '')
+
+        if line is None:
+            malformed = parse_checker(checker) is None
+            validated_items.append({
+                "checker": checker,
+                "sale_type": sale_type,
+                "quantity": 0 if malformed else item.get('quantity', 0),
+                "unit_price": ZERO,
+                "amount": ZERO,
+                "vat_value": ZERO,
+                "discount_value": ZERO,
+                "message": "Invalid key format" if malformed else NOT_FOUND_MESSAGES.get(sale_type)
+            })
+            continue
+
+        if line.quantity == 0:
+            continue
+
+        sub_total += line.amount
+        total_vat += line.vat_value
+        total_discount += line.discount_value
+
+        validated_items.append({
+            "checker": checker,
+            "sale_type": sale_type,
+            "quantity": line.quantity,
+            "unit_price": line.unit_price,
+            "amount": line.amount,
+            "vat_value": line.vat_value,
+            "discount_value": line.discount_value,
+            "message": line.message
+        })
+
+    totals = {
+        "sub_total": sub_total,
+        "total_vat": total_vat,
+        "total_discount": total_discount,
+        "grand_total": sub_total + total_vat - total_discount,
+    }
+    return validated_items, totals
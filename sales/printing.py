@@ -0,0 +1,209 @@
+"""
+Receipt output for counter printers.
+
+render_escpos() turns the same sale_data dict generate_receipt() draws into a
+raw ESC/POS byte stream for 80mm thermal printers, and the printer backends
+below deliver bytes (ESC/POS) or a stored PDF to a printer:
+
+    RECEIPT_PRINTER = {"BACKEND": "device", "PATH": "/dev/usb/lp0"}
+    RECEIPT_PRINTER = {"BACKEND": "cups", "NAME": "counter-1"}
+    RECEIPT_PRINTER = {"BACKEND": "file", "PATH": "/tmp/receipts"}
+    RECEIPT_PRINTER = {"BACKEND": "windows"}   # PDF through the Windows shell
+
+Nothing here imports a platform library at module level.
+"""
+import os
+import subprocess
+import threading
+
+from django.conf import settings
+
+
+# --- ESC/POS commands ---
+ESC = b"\x1b"
+GS = b"\x1d"
+INIT = ESC + b"@"
+ALIGN_LEFT = ESC + b"a\x00"
+ALIGN_CENTER = ESC + b"a\x01"
+BOLD_ON = ESC + b"E\x01"
+BOLD_OFF = ESC + b"E\x00"
+DOUBLE_ON = GS + b"!\x11"
+DOUBLE_OFF = GS + b"!\x00"
+FEED_AND_CUT = ESC + b"d\x04" + GS + b"V\x42\x00"
+
+# Font A characters per line on 80mm / 58mm paper
+PAPER_COLUMNS = {80: 48, 58: 32}
+ENCODING = "cp437"
+
+
+def _text(value):
+    return str(value).encode(ENCODING, errors="replace")
+
+
+def _columns():
+    return PAPER_COLUMNS.get(getattr(settings, "RECEIPT_PAPER_WIDTH_MM", 80), 48)
+
+
+def _pair(left, right, width):
+    """Left and right text on one line, the left side cut to fit."""
+    right = str(right)
+    left = str(left)[:max(width - len(right) - 1, 0)]
+    return left + " " * (width - len(left) - len(right)) + right
+
+
+def render_escpos(sale_data):
+    """
+    Render a receipt as ESC/POS bytes. Same content as generate_receipt(),
+    laid out for a narrow roll. Returns bytes.
+    """
+    width = _columns()
+    rule = _text("-" * width) + b"\n"
+    out = [INIT, ALIGN_CENTER]
+
+    shop_name = getattr(settings, "RECEIPT_SHOP_NAME", "")
+    if shop_name:
+        out += [BOLD_ON, DOUBLE_ON, _text(shop_name), b"\n", DOUBLE_OFF, BOLD_OFF]
+    out += [
+        _text(getattr(settings, "RECEIPT_SHOP_ADDRESS", "")), b"\n",
+        _text(getattr(settings, "RECEIPT_SHOP_PHONE", "")), b"\n",
+        ALIGN_LEFT, rule,
+        _text(_pair(f"Receipt No: {sale_data['receipt_no']}", sale_data['datetime'], width)), b"\n",
+        _text(f"Cashier: {sale_data['cashier_name']}"), b"\n",
+        _text(f"Customer: {sale_data['customer_name']}"), b"\n",
+        _text(f"Phone: {sale_data.get('customer_phone', 'N/A')}"), b"\n",
+        rule,
+    ]
+
+    # --- Items: description on one line, qty x price and amount below ---
+    for i, item in enumerate(sale_data['items'], start=1):
+        out += [
+            _text(f"{i}. {item['description'].strip()}"[:width]), b"\n",
+            _text(_pair(f"   {item['qty']} x {item['unit_price']:,.2f}", f"{item['amount']:,.2f}", width)), b"\n",
+        ]
+
+    # --- Totals ---
+    out += [
+        rule,
+        _text(_pair("Subtotal:", f"{sale_data['subtotal']:,.2f}", width)), b"\n",
+        _text(_pair("VAT:", f"{sale_data['vat']:,.2f}", width)), b"\n",
+        _text(_pair("Discount:", f"{sale_data['discount']:,.2f}", width)), b"\n",
+        rule,
+        BOLD_ON, _text(_pair("GRAND TOTAL:", f"{sale_data['grand_total']:,.2f}", width)), b"\n", BOLD_OFF,
+        b"\n",
+        _text(f"Reference: {sale_data['reference']}"), b"\n",
+        ALIGN_CENTER, _text("Thank you for shopping with us!"), b"\n",
+        FEED_AND_CUT,
+    ]
+    return b"".join(out)
+
+
+# --- Printer backends ---
+
+class PrinterBackend:
+    """Delivers one receipt. `send` takes ESC/POS bytes, `print_pdf` a PDF path."""
+    raw = True
+
+    def __init__(self, options):
+        self.options = options
+
+    def send(self, data):
+        raise NotImplementedError
+
+    def print_pdf(self, file_path):
+        raise NotImplementedError(f"{type(self).__name__} cannot print PDF files.")
+
+
+class DevicePrinter(PrinterBackend):
+    """Writes straight to a character device such as /dev/usb/lp0."""
+
+    def send(self, data):
+        with open(self.options.get("PATH", "/dev/usb/lp0"), "wb", buffering=0) as device:
+            device.write(data)
+
+
+class CupsPrinter(PrinterBackend):
+    """Hands the bytes to CUPS `lp` as a raw job."""
+
+    def _command(self, *extra):
+        command = ["lp", "-s"]
+        if self.options.get("NAME"):
+            command += ["-d", self.options["NAME"]]
+        return command + list(extra)
+
+    def send(self, data):
+        subprocess.run(self._command("-o", "raw"), input=data, check=True,
+                       timeout=self.options.get("TIMEOUT", 10))
+
+    def print_pdf(self, file_path):
+        subprocess.run(self._command(file_path), check=True, timeout=self.options.get("TIMEOUT", 10))
+
+
+class FilePrinter(PrinterBackend):
+    """Writes each job into a directory (tests, or tills without a printer)."""
+
+    def __init__(self, options):
+        super().__init__(options)
+        # Only a job count: the backend lives as long as the process
+        self._count = 0
+        self._lock = threading.Lock()
+
+    def send(self, data):
+        directory = self.options.get("PATH")
+        with self._lock:
+            self._count += 1
+            count = self._count
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+            with open(os.path.join(directory, f"receipt_{os.getpid()}_{count}.bin"), "wb") as f:
+                f.write(data)
+
+
+class WindowsPrinter(PrinterBackend):
+    """The original behaviour: the PDF printed through the Windows shell."""
+    raw = False
+
+    def print_pdf(self, file_path):
+        from .utils import print_pdf_file
+        print_pdf_file(file_path, self.options.get("NAME") or None)
+
+
+BACKENDS = {
+    "device": DevicePrinter,
+    "cups": CupsPrinter,
+    "file": FilePrinter,
+    "windows": WindowsPrinter,
+}
+
+_printer = {"key": None, "backend": None}
+_printer_lock = threading.Lock()
+
+
+def get_printer():
+    """The configured backend, built once per process (None if printing is off)."""
+    options = getattr(settings, "RECEIPT_PRINTER", None)
+    if not options:
+        return None
+    key = repr(sorted(options.items()))
+    with _printer_lock:
+        if _printer["key"] != key:
+            backend = options.get("BACKEND", "windows")
+            if backend not in BACKENDS:
+                raise ValueError(f"Unknown receipt printer backend: {backend}")
+            _printer["backend"] = BACKENDS[backend](options)
+            _printer["key"] = key
+        return _printer["backend"]
+
+
+def print_receipt(sale_data, pdf_path=None):
+    """
+    Print one receipt on the configured printer: ESC/POS for raw backends,
+    the stored PDF otherwise. Returns False when printing is disabled.
+    """
+    printer = get_printer()
+    if printer is None:
+        return False
+    if printer.raw:
+        printer.send(render_escpos(sale_data))
+    else:
+        printer.print_pdf(pdf_path)
+    return True
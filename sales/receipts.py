@@ -0,0 +1,167 @@
+import logging
+import threading
+from decimal import Decimal
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import transaction, close_old_connections
+
+from products import jobs
+from products.signals import broadcast_update
+from .models import ReceiptJob, Receipt
+
+logger = logging.getLogger(__name__)
+
+RETRY_BASE_DELAY = 5  # seconds, doubled on every failed attempt
+
+MONEY_KEYS = ['subtotal', 'discount', 'vat', 'grand_total']
+ITEM_MONEY_KEYS = ['unit_price', 'amount']
+
+
+def enqueue_receipt(sale, sale_data):
+    """
+    Queue receipt rendering for a sale. Call inside the checkout transaction:
+    the job row commits (or rolls back) together with the sale.
+    """
+    job = ReceiptJob.objects.create(sale=sale, sale_data=sale_data)
+    # Offline sales arrive in batches, sales.sync drains them with drain_in_thread()
+    if getattr(settings, "RECEIPT_QUEUE_INLINE", False) and sale.synced_at is None:
+        # Local stand-in for the worker: render on a thread once the sale commits
+        transaction.on_commit(lambda: _run_in_thread(job.pk))
+    return job
+
+
+def drain_in_thread(limit):
+    """Process up to `limit` due jobs on one background thread (inline mode only)."""
+    if not getattr(settings, "RECEIPT_QUEUE_INLINE", False):
+        return
+    thread = threading.Thread(target=_drain, args=(limit,), daemon=True)
+    thread.start()
+
+
+def _drain(limit):
+    try:
+        run_pending_jobs(limit)
+    finally:
+        close_old_connections()
+
+
+def _run_in_thread(job_id):
+    thread = threading.Thread(target=_process_in_thread, args=(job_id,), daemon=True)
+    thread.start()
+
+
+def _process_in_thread(job_id):
+    try:
+        job = jobs.claim_job(ReceiptJob, job_id)
+        if job:
+            process_job(job)
+    finally:
+        close_old_connections()
+
+
+def _decode_sale_data(data):
+    """JSONField gives Decimals back as strings; the renderer formats numbers."""
+    data = dict(data)
+    for key in MONEY_KEYS:
+        data[key] = Decimal(str(data.get(key, '0.00')))
+    items = []
+    for item in data.get('items', []):
+        item = dict(item)
+        for key in ITEM_MONEY_KEYS:
+            item[key] = Decimal(str(item.get(key, '0.00')))
+        items.append(item)
+    data['items'] = items
+    return data
+
+
+def claim_jobs(limit=10):
+    """Claim up to `limit` due receipt jobs (see products.jobs.claim_jobs)."""
+    return jobs.claim_jobs(ReceiptJob, limit)
+
+
+def process_job(job):
+    """
+    Render, store and print the receipt for a claimed job. Failures are
+    rescheduled with exponential backoff until max_attempts is reached.
+    """
+    # Imported here so the queue can be loaded without ReportLab / printer setup
+    from .utils import generate_receipt
+    from .printing import get_printer
+
+    sale = job.sale
+    sale_data = _decode_sale_data(job.sale_data)
+    # The till already printed offline sales, only the stored copy is needed
+    printer = None
+    if sale.synced_at is None:
+        try:
+            printer = get_printer()
+        except Exception as e:
+            logger.warning("Receipt printer misconfigured: %s", e)
+
+    # Thermal slips go out before the PDF is rendered, once per job
+    if printer is not None and printer.raw and job.attempts == 1:
+        _print(sale, sale_data)
+
+    try:
+        pdf_buffer = generate_receipt(sale_data)
+        pdf_buffer.seek(0)
+
+        receipt, created = Receipt.objects.get_or_create(sale=sale)
+        if sale.customer_id:
+            receipt.customer_id = sale.customer_id
+        receipt.sales_reference = sale.reference
+        receipt.receipt_number = sale.id
+        receipt.file.save(
+            f"receipt_{sale.id}.pdf",
+            ContentFile(pdf_buffer.read()),
+            save=False
+        )
+        pdf_buffer.close()
+        receipt.save()
+    except Exception as e:
+        logger.exception("Receipt job %s failed", job.pk)
+        jobs.schedule_retry(job, e, RETRY_BASE_DELAY)
+        if job.status == 'pending' and getattr(settings, "RECEIPT_QUEUE_INLINE", False):
+            jobs.retry_in_thread(job, _process_in_thread)
+        _notify(job)
+        return job
+
+    job.status = 'done'
+    job.last_error = None
+    job.save(update_fields=['status', 'last_error', 'updated_at'])
+    _notify(job, receipt)
+
+    if printer is not None and not printer.raw:
+        _print(sale, sale_data, receipt.file.path)
+
+    return job
+
+
+def _print(sale, sale_data, pdf_path=None):
+    # Printing is best effort, a jammed printer must not fail the job
+    from .printing import print_receipt
+    try:
+        print_receipt(sale_data, pdf_path)
+    except Exception as e:
+        logger.warning("Printing failed for sale %s: %s", sale.id, e)
+
+
+def _notify(job, receipt=None):
+    try:
+        broadcast_update({
+            "type": "receipt",
+            "sale": job.sale_id,
+            "status": job.status,
+            "receipt_url": receipt.file.url if receipt else None,
+        })
+    except Exception as e:
+        logger.warning("Receipt push failed for sale %s: %s", job.sale_id, e)
+
+
+def run_pending_jobs(limit=10):
+    """Claim and process one batch of due jobs. Returns the number processed."""
+    claimed = claim_jobs(limit)
+    for job in claimed:
+        process_job(job)
+    return len(claimed)
@@ -13,6 +13,7 @@ from rest_framework import serializers
 from .models import Sale, SaleItem, Product, Receipt
 from price_slash.models import DamageProduct, ExpiringProduct
 import re
+from .pricing import price_basket, basket_price_table, money, PriceRow, PricedLine, parse_checker, ZERO
 
 
 
@@ -117,11 +118,16 @@ class CustomerSerializer(serializers.ModelSerializer):
 class SaleItemSerializer(serializers.ModelSerializer):
     checker = serializers.CharField(write_only=True)
     sale_type = serializers.ChoiceField(choices=SaleItem._meta.get_field('sale_type').choices)
-    quantity = serializers.IntegerField()
-    unit_price = serializers.DecimalField(max_digits=12, decimal_places=2)
+    quantity = serializers.IntegerField(min_value=1)
+    # Prices sent by the till are accepted for compatibility but the server
+    # prices every line through sales.pricing
+    unit_price = serializers.DecimalField(max_digits=12, decimal_places=2, required=False)
     vat_value = serializers.DecimalField(max_digits=14, decimal_places=2, required=False, default=Decimal("0.00"))
     discount_value = serializers.DecimalField(max_digits=14, decimal_places=2, required=False, default=Decimal("0.00"))
-    amount = serializers.DecimalField(max_digits=14, decimal_places=2)
+    amount = serializers.DecimalField(max_digits=14, decimal_places=2, required=False)
+    # The row's product (catalog "product"); offline sync prices an expiring /
+    # damaged line that sold out meanwhile from it and the till's unit_price
+    product_id = serializers.IntegerField(write_only=True, required=False, min_value=1)
     cost_price = serializers.DecimalField(max_digits=14, decimal_places=2, read_only=True)
     profit = serializers.DecimalField(max_digits=14, decimal_places=2, read_only=True)
 
@@ -136,6 +142,7 @@ class SaleItemSerializer(serializers.ModelSerializer):
             "vat_value",
             "discount_value",
             "amount",
+            "product_id",
             "cost_price",
             "profit",
         ]
@@ -149,71 +156,6 @@ class SaleItemSerializer(serializers.ModelSerializer):
                 )
         return super().to_internal_value(data)
 
-    def create(self, validated_data):
-        receipt_amount = validated_data.pop("raw_amount", validated_data.get("amount", Decimal("0.00")))
-        checker = validated_data.pop("checker", None)
-        sale_type = validated_data.get("sale_type")
-        product = None
-
-        # Extract product id
-        try:
-            product_id = int(checker.split("-")[0])
-        except (ValueError, AttributeError, IndexError):
-            raise serializers.ValidationError({"checker": "Invalid checker format"})
-
-        # Resolve product
-        temp_expiring_id = None
-        temp_damage_id = None
-        if sale_type == "sales":
-            product = Product.objects.get(id=product_id)
-        elif sale_type == "damaged":
-            dmg = DamageProduct.objects.get(id=product_id)
-            product = dmg.product
-            temp_damage_id = dmg.id
-        elif sale_type == "expiring":
-            exp = ExpiringProduct.objects.get(id=product_id)
-            product = exp.product
-            temp_expiring_id = exp.id
-        else:
-            raise serializers.ValidationError({"sale_type": "Invalid sale type"})
-
-        # Compute DB amount
-       
-        raw_amount = validated_data.get("amount", Decimal("0.00"))
-        vat_value = validated_data.get("vat_value", Decimal("0.00"))
-        discount_value = validated_data.get("discount_value", Decimal("0.00"))
-        db_amount = raw_amount + vat_value - discount_value
-
-        validated_data["product"] = product
-        validated_data["amount"] = db_amount
-
-        cost_price = product.unit_buying_price
-        discount = Decimal("0.00")
-
-        # Apply discount only if quantity meets/exceeds discount_quantity
-        discount = Decimal("0.00")
-
-        if sale_type == "sales":
-            if validated_data["quantity"] >= product.discount_quantity and product.discount_quantity > 0:
-                discount = product.discount
-
-        validated_data["cost_price"] = cost_price
-        validated_data["profit"] = (
-            (validated_data["unit_price"] - cost_price - discount) * validated_data["quantity"]
-        )
-
-        if temp_expiring_id:
-            validated_data["expiring_product_id"] = temp_expiring_id
-        if temp_damage_id:
-            validated_data["damage_product_id"] = temp_damage_id
-
-
-
-        # Create SaleItem
-        sale_item = SaleItem.objects.create(**validated_data)
-
-        return sale_item
-
 
 class SaleSerializer(serializers.ModelSerializer):
     customer_id = serializers.PrimaryKeyRelatedField(
@@ -256,35 +198,111 @@ class SaleSerializer(serializers.ModelSerializer):
         user = request.user if request else None
 
         items_data = validated_data.pop("items", [])
-        grand_total = validated_data.pop("grand_total")
+        validated_data.pop("grand_total")
+
+        # Price the whole basket in one call, from its rows as they are now
+        priced = price_basket(items_data, table=basket_price_table(items_data))
+        if self.context.get("offline"):
+            priced = self._price_sold_out_lines(items_data, priced)
+
+        sale_items = []
+        total_cost = Decimal("0.00")
+        total_profit = Decimal("0.00")
+        total_vat = Decimal("0.00")
+        total_discount = Decimal("0.00")
+        total_amount = Decimal("0.00")
+
+        for item_data, line in zip(items_data, priced):
+            if line is None:
+                raise serializers.ValidationError({
+                    "cart": f"Item {item_data.get('checker')} is no longer available. Please remove it from cart."
+                })
+
+            db_amount = line.amount + line.vat_value - line.discount_value
+            sale_items.append(SaleItem(
+                product_id=line.row.product_id,
+                quantity=line.quantity,
+                cost_price=line.cost_price,
+                unit_price=line.unit_price,
+                vat_value=line.vat_value,
+                discount_value=line.discount_value,
+                amount=db_amount,
+                profit=line.profit,
+                sale_type=line.sale_type,
+                expiring_product_id=line.row.id if line.sale_type == "expiring" else None,
+                damage_product_id=line.row.id if line.sale_type == "damaged" else None,
+            ))
+
+            total_cost += line.cost_price * line.quantity
+            total_profit += line.profit
+            total_vat += line.vat_value
+            total_discount += line.discount_value
+            total_amount += db_amount
+
+        validated_data["total_vat"] = total_vat
+        validated_data["total_discount"] = total_discount
 
         with transaction.atomic():
-            # Create Sale
             sale = Sale.objects.create(
                 staff=user,
-                total_amount=grand_total,
+                total_amount=total_amount,
+                total_cost=total_cost,
+                total_profit=total_profit,
                 **validated_data
             )
+            for sale_item in sale_items:
+                sale_item.sale = sale
+            SaleItem.objects.bulk_create(sale_items)
 
-            total_cost = Decimal("0.00")
-            total_profit = Decimal("0.00")
+        return sale
 
-            # Use SaleItemSerializer to ensure custom logic runs
-            for item_data in items_data:
-                serializer = SaleItemSerializer(data=item_data, context={"request": request})
-                serializer.is_valid(raise_exception=True)
-                sale_item = serializer.save(sale=sale)
+    @staticmethod
+    def _price_sold_out_lines(items_data, priced):
+        """
+        An expiring / damaged row is deleted once it sells out, but an offline
+        sale of it has already happened. Price such lines from the queued
+        sale (the till's unit_price, cost from the product) so the sale is
+        recorded and the missing stock is flagged as a shortfall.
+        """
+        missing = [
+            index for index, (item_data, line) in enumerate(zip(items_data, priced))
+            if line is None and item_data.get("sale_type") in ("expiring", "damaged")
+            and item_data.get("product_id") and parse_checker(item_data.get("checker", "")) is not None
+        ]
+        if not missing:
+            return priced
 
-                # accumulate totals
-                total_cost += sale_item.cost_price * sale_item.quantity
-                total_profit += sale_item.profit
+        costs = dict(
+            Product.objects.filter(pk__in={items_data[index]["product_id"] for index in missing})
+            .values_list("pk", "unit_buying_price")
+        )
+        priced = list(priced)
+        for index in missing:
+            item_data = items_data[index]
+            quantity = item_data["quantity"]
+            unit_price = item_data.get("unit_price")
+            if unit_price is None and item_data.get("amount") is not None:
+                unit_price = item_data["amount"] / quantity
+            if item_data["product_id"] not in costs or unit_price is None:
+                continue
+
+            unit_price, cost = money(unit_price), money(costs[item_data["product_id"]])
+            row = PriceRow(
+                item_data["sale_type"], parse_checker(item_data["checker"]), item_data["product_id"],
+                unit_price, cost, ZERO, 0, ZERO, 0,
+            )
+            amount = unit_price * quantity
+            priced[index] = PricedLine(
+                item_data["checker"], item_data["sale_type"], row, quantity, unit_price, cost,
+                ZERO, ZERO, amount, amount - cost * quantity, None,
+            )
+        return priced
 
-            # update sale totals
-            sale.total_cost = total_cost
-            sale.total_profit = total_profit
-            sale.save()
+class OfflineSaleSerializer(serializers.Serializer):
+    """Envelope of one queued offline sale; the rest of the entry is a SaleSerializer payload."""
+    idempotency_key = serializers.CharField(max_length=Sale._meta.get_field('idempotency_key').max_length)
+    client_created_at = serializers.DateTimeField()
 
-        return sale
 
 class ReceiptSerializer(serializers.ModelSerializer):
     customer_name = serializers.CharField(source="customer.name", default=None, read_only=True)
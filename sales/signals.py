@@ -0,0 +1,19 @@
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from products.models import Product
+from price_slash.models import ExpiringProduct, DamageProduct
+from .pricing import invalidate_price_table
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+@receiver(post_save, sender=ExpiringProduct)
+@receiver(post_delete, sender=ExpiringProduct)
+@receiver(post_save, sender=DamageProduct)
+@receiver(post_delete, sender=DamageProduct)
+def price_source_changed(sender, instance, **kwargs):
+    # Drop the table now, and again on commit in case another request
+    # rebuilt it from the not-yet-committed state in between
+    invalidate_price_table()
+    transaction.on_commit(invalidate_price_table)
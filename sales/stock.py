@@ -0,0 +1,213 @@
+from collections import defaultdict
+
+from django.db import transaction
+from django.db.models import Case, When, Value, F, IntegerField
+from rest_framework.exceptions import ValidationError
+
+from products.models import Product, ProductBatch, StockHistory
+from products.references import assign_references
+from products.catalog import stamp_on_commit
+from products.barcode_cache import invalidate_products
+from price_slash.models import ExpiringProduct, DamageProduct
+from price_slash.signals import expiring_product_changed, damaged_product_changed
+from .pricing import invalidate_price_table
+
+
+SALE_NOTES = {
+    'sales': 'Sales',
+    'damage': 'Damaged',
+    'expiring': 'Expiring'
+}
+
+IMBALANCE_NOTE = " (Stock imbalance)"
+
+
+def _set_quantities(model, field, new_values, **extra):
+    """
+    Write {pk: value} into `field` for all rows in one UPDATE ... CASE statement.
+    `extra` fields are set to the same value on every row.
+    """
+    if not new_values:
+        return 0
+    whens = [When(pk=pk, then=Value(value)) for pk, value in new_values.items()]
+    return model.objects.filter(pk__in=new_values.keys()).update(
+        **{field: Case(*whens, default=F(field), output_field=IntegerField())},
+        **extra
+    )
+
+
+def _deduct_price_slash(model, items, id_attr, table_name, broadcast, allow_shortfall=False):
+    """
+    Lock, validate and deduct ExpiringProduct / DamageProduct rows for the given
+    sale items with a fixed number of queries. Rows that hit zero are deleted,
+    matching the behaviour of ExpiringProduct.save() / DamageProduct.save().
+
+    With allow_shortfall=True (offline sales that already happened) a line
+    asking for more than is left takes what remains instead of failing.
+    Returns the items that were short.
+    """
+    short = []
+    if not items:
+        return short
+
+    ids = sorted({getattr(item, id_attr) for item in items if getattr(item, id_attr)})
+    locked = {
+        obj.pk: obj
+        for obj in model.objects.select_for_update(of=('self',))
+        .select_related('product')
+        .filter(pk__in=ids)
+        .order_by('pk')
+    }
+
+    for item in items:
+        row = locked.get(getattr(item, id_attr))
+        if not row and allow_shortfall:
+            short.append(item)
+            continue
+        if not row:
+            raise ValidationError({
+                "cart": f"Product {item.product.name} no longer exists in the {table_name} table. Please remove it from cart."
+            })
+
+        if item.quantity > row.quantity:
+            if not allow_shortfall:
+                raise ValidationError({
+                    "cart": f"Product {item.product.name} has only {row.quantity} units available in the {table_name} table. Reduce quantity in cart."
+                })
+            short.append(item)
+            row.quantity = 0
+            continue
+
+        row.quantity -= item.quantity
+
+    emptied = [pk for pk, row in locked.items() if row.quantity == 0]
+    remaining = {pk: row.quantity for pk, row in locked.items() if row.quantity > 0}
+
+    # Quantities are part of the till catalog, so the rows get a new version
+    if remaining:
+        _set_quantities(model, 'quantity', remaining, catalog_version=None)
+        stamp_on_commit()
+    if emptied:
+        # Queryset delete still fires post_delete, so tills drop the rows
+        model.objects.filter(pk__in=emptied).delete()
+
+    # bulk updates skip post_save, so refresh the price table (available
+    # quantities) and push the new quantities once committed
+    invalidate_price_table()
+    transaction.on_commit(invalidate_price_table)
+    for pk in remaining:
+        row = locked[pk]
+        transaction.on_commit(lambda row=row: broadcast(sender=model, instance=row, created=False))
+    return short
+
+
+def _consume_batches(demand):
+    """
+    Consume ProductBatch.quantity_left first-expiry-first-out for every product
+    in `demand` ({product_id: qty}) with one locked read and one bulk update.
+    """
+    if not demand:
+        return
+
+    batches = (
+        ProductBatch.objects.select_for_update()
+        .filter(product_id__in=demand.keys(), quantity_left__gt=0)
+        .order_by('product_id', F('expiry_date').asc(nulls_last=True), 'pk')
+    )
+
+    remaining = dict(demand)
+    touched = []
+    for batch in batches:
+        left = remaining.get(batch.product_id, 0)
+        if left <= 0:
+            continue
+        used = min(batch.quantity_left, left)
+        batch.quantity_left -= used
+        remaining[batch.product_id] = left - used
+        touched.append(batch)
+
+    if touched:
+        ProductBatch.objects.bulk_update(touched, ['quantity_left'])
+
+
+def deduct_sale_stock(items, user, allow_shortfall=False):
+    """
+    Deduct stock for all items of a sale in a constant number of queries.
+
+    - Product rows are locked in one ordered SELECT ... FOR UPDATE (ordered by
+      pk so concurrent checkouts always lock in the same order) and written
+      back with a single UPDATE.
+    - Expiring/Damaged rows are validated and deducted the same way.
+    - ProductBatch rows are consumed FEFO with one bulk update.
+    - StockHistory rows are written with bulk_create.
+
+    Product shortfalls are clamped to zero and noted as "(Stock imbalance)".
+    With allow_shortfall=True expiring/damaged shortfalls are treated the same
+    way instead of raising (offline sync).
+
+    `items` must be SaleItem instances with `product` already loaded.
+    Returns the created StockHistory rows, one per item in order.
+    Must be called inside transaction.atomic().
+    """
+    items = list(items)
+    if not items:
+        return []
+
+    product_ids = sorted({item.product_id for item in items})
+    stock = dict(
+        Product.objects.select_for_update()
+        .filter(pk__in=product_ids)
+        .order_by('pk')
+        .values_list('pk', 'quantity')
+    )
+
+    # Walk the lines in order so a product sold on several lines is clamped
+    # exactly as the old per-line loop did
+    imbalanced = set()
+    batch_demand = defaultdict(int)
+    for index, item in enumerate(items):
+        on_hand = stock[item.product_id]
+        if on_hand >= item.quantity:
+            stock[item.product_id] = on_hand - item.quantity
+        else:
+            stock[item.product_id] = 0
+            imbalanced.add(index)
+        batch_demand[item.product_id] += item.quantity
+
+    _set_quantities(Product, 'quantity', stock)
+    # The bulk UPDATE skips post_save; scans must not show the old quantity
+    invalidate_products(stock.keys())
+
+    short = _deduct_price_slash(
+        ExpiringProduct,
+        [item for item in items if item.sale_type == "expiring"],
+        'expiring_product_id', 'Expiring', expiring_product_changed,
+        allow_shortfall=allow_shortfall,
+    )
+    short += _deduct_price_slash(
+        DamageProduct,
+        [item for item in items if item.sale_type == "damaged"],
+        'damage_product_id', 'Damaged', damaged_product_changed,
+        allow_shortfall=allow_shortfall,
+    )
+    short_ids = {id(item) for item in short}
+
+    _consume_batches(batch_demand)
+
+    username = user.get_full_name() or user.username or "Cashier"
+    history = []
+    for index, item in enumerate(items):
+        notes = f"{SALE_NOTES.get(item.sale_type, 'Sale')} sales made by {username}"
+        if index in imbalanced or id(item) in short_ids:
+            notes += IMBALANCE_NOTE
+        history.append(StockHistory(
+            product_id=item.product_id,
+            action='Sold',
+            quantity=item.quantity,
+            action_by=user,
+            notes=notes,
+        ))
+
+    # bulk_create bypasses StockHistory.save(), so assign references up front
+    assign_references(history)
+    return StockHistory.objects.bulk_create(history)
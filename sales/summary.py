@@ -0,0 +1,216 @@
+from decimal import Decimal
+
+from django.db import connection
+from django.db.models import Case, When, Value, F, Sum, Count, CharField, PositiveIntegerField
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+from django.utils.timezone import localdate
+
+from .models import CashierDailySummary, CashierDailyProductTotal, CustomerSpend, Sale, SaleItem
+
+
+PAYMENT_FIELDS = {
+    'Cash': 'cash_amount',
+    'Card': 'card_amount',
+    'Transfer': 'transfer_amount',
+}
+
+
+def _upsert_product_totals(summary_id, totals):
+    """
+    Add {product_id: [name, qty, amount]} onto the summary's product rows in a
+    single INSERT ... ON CONFLICT DO UPDATE. Returns the new
+    (product_name, quantity) of every touched row.
+    """
+    table = connection.ops.quote_name(CashierDailyProductTotal._meta.db_table)
+    placeholders = ", ".join(["(%s, %s, %s, %s, %s)"] * len(totals))
+    params = []
+    for product_id, (name, quantity, amount) in totals.items():
+        params.extend([summary_id, product_id, name, quantity, amount])
+
+    sql = (
+        f"INSERT INTO {table} (summary_id, product_id, product_name, quantity, amount) "
+        f"VALUES {placeholders} "
+        f"ON CONFLICT (summary_id, product_id) DO UPDATE SET "
+        f"quantity = {table}.quantity + EXCLUDED.quantity, "
+        f"amount = {table}.amount + EXCLUDED.amount "
+        f"RETURNING product_name, quantity"
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        return cursor.fetchall()
+
+
+def add_sale_to_summary(sale, items):
+    """
+    Fold a sale into its cashier's daily summary with F-expression increments.
+    `items` are the sale's SaleItems with `product` loaded.
+    Must be called inside the create_sale transaction.
+    """
+    if not sale.staff_id or not items:
+        return
+
+    summary, _ = CashierDailySummary.objects.get_or_create(
+        staff_id=sale.staff_id, date=localdate(sale.sale_date)
+    )
+
+    sale_total = Decimal("0.00")
+    totals = {}
+    for item in items:
+        sale_total += item.amount
+        entry = totals.setdefault(item.product_id, [item.product.name, 0, Decimal("0.00")])
+        entry[1] += item.quantity
+        entry[2] += item.amount
+
+    # Best seller among the products this sale touched, with its new day total
+    top_name, top_qty = max(_upsert_product_totals(summary.pk, totals), key=lambda row: row[1])
+
+    updates = {
+        'sales_count': F('sales_count') + 1,
+        'total_sales': F('total_sales') + sale_total,
+        'top_product_name': Case(
+            When(top_product_qty__lt=top_qty, then=Value(top_name)),
+            default=F('top_product_name'),
+            output_field=CharField(),
+        ),
+        'top_product_qty': Case(
+            When(top_product_qty__lt=top_qty, then=Value(top_qty)),
+            default=F('top_product_qty'),
+            output_field=PositiveIntegerField(),
+        ),
+    }
+    payment_field = PAYMENT_FIELDS.get(sale.payment_type)
+    if payment_field:
+        updates[payment_field] = F(payment_field) + sale_total
+
+    CashierDailySummary.objects.filter(pk=summary.pk).update(**updates)
+
+
+def summary_to_dict(summary):
+    """Shape returned to the till (same as the old aggregate-based summary)."""
+    result = {
+        'total_sales': 0,
+        'top_product': {},
+        'payment_type_amounts': {}
+    }
+    if summary is None:
+        return result
+
+    result['total_sales'] = summary.total_sales
+    if summary.top_product_name:
+        result['top_product'] = {
+            'product__name': summary.top_product_name,
+            'total_qty': summary.top_product_qty,
+        }
+    for payment_type, field in PAYMENT_FIELDS.items():
+        amount = getattr(summary, field)
+        if amount:
+            result['payment_type_amounts'][payment_type] = amount
+    return result
+
+
+def compute_summaries(sale_items):
+    """
+    Recompute summaries from raw SaleItems with grouped queries.
+    Returns {(staff_id, date): {"summary": CashierDailySummary, "products": {product_id: CashierDailyProductTotal}}}.
+    """
+    sale_items = sale_items.filter(sale__staff__isnull=False).annotate(day=TruncDate('sale__sale_date'))
+    result = {}
+
+    def entry(staff_id, day):
+        key = (staff_id, day)
+        if key not in result:
+            result[key] = {
+                "summary": CashierDailySummary(staff_id=staff_id, date=day),
+                "products": {},
+            }
+        return result[key]
+
+    by_payment = (
+        sale_items.values('sale__staff_id', 'day', 'sale__payment_type')
+        .annotate(amount=Sum('amount'), sales=Count('sale_id', distinct=True))
+        .order_by()
+    )
+    for row in by_payment.iterator():
+        summary = entry(row['sale__staff_id'], row['day'])["summary"]
+        summary.total_sales += row['amount'] or 0
+        summary.sales_count += row['sales']
+        field = PAYMENT_FIELDS.get(row['sale__payment_type'])
+        if field:
+            setattr(summary, field, getattr(summary, field) + (row['amount'] or 0))
+
+    by_product = (
+        sale_items.values('sale__staff_id', 'day', 'product_id', 'product__name')
+        .annotate(quantity=Sum('quantity'), amount=Sum('amount'))
+        .order_by()
+    )
+    for row in by_product.iterator():
+        data = entry(row['sale__staff_id'], row['day'])
+        data["products"][row['product_id']] = CashierDailyProductTotal(
+            product_id=row['product_id'],
+            product_name=row['product__name'],
+            quantity=row['quantity'] or 0,
+            amount=row['amount'] or 0,
+        )
+        summary = data["summary"]
+        if (row['quantity'] or 0) > summary.top_product_qty:
+            summary.top_product_qty = row['quantity']
+            summary.top_product_name = row['product__name']
+
+    return result
+
+
+# -------------------------
+# Customer spend (badge ranking)
+# -------------------------
+def add_sale_to_customer_spend(sale, items):
+    """
+    Add a sale onto its customer's CustomerSpend row in one
+    INSERT ... ON CONFLICT DO UPDATE. Call inside the create_sale
+    transaction, after sale.total_amount is set.
+    """
+    if not sale.customer_id:
+        return
+    table = connection.ops.quote_name(CustomerSpend._meta.db_table)
+    quantity = sum(item.quantity for item in items)
+    sql = (
+        f"INSERT INTO {table} (customer_id, sales_count, total_amount, total_qty, updated_at) "
+        f"VALUES (%s, 1, %s, %s, %s) "
+        f"ON CONFLICT (customer_id) DO UPDATE SET "
+        f"sales_count = {table}.sales_count + 1, "
+        f"total_amount = {table}.total_amount + EXCLUDED.total_amount, "
+        f"total_qty = {table}.total_qty + EXCLUDED.total_qty, "
+        f"updated_at = EXCLUDED.updated_at"
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [sale.customer_id, sale.total_amount, quantity, timezone.now()])
+
+
+def compute_customer_spend():
+    """
+    CustomerSpend rows recomputed from raw sales. Amounts and quantities are
+    aggregated in separate grouped queries: summing both over one
+    sales x items join would count each sale total once per item.
+    """
+    spend = {}
+    by_sale = (
+        Sale.objects.filter(customer__isnull=False)
+        .values('customer_id')
+        .annotate(amount=Sum('total_amount'), sales=Count('id'))
+        .order_by()
+    )
+    for row in by_sale.iterator():
+        spend[row['customer_id']] = CustomerSpend(
+            customer_id=row['customer_id'], sales_count=row['sales'], total_amount=row['amount'] or 0,
+        )
+
+    by_item = (
+        SaleItem.objects.filter(sale__customer__isnull=False)
+        .values('sale__customer_id')
+        .annotate(quantity=Sum('quantity'))
+        .order_by()
+    )
+    for row in by_item.iterator():
+        if row['sale__customer_id'] in spend:
+            spend[row['sale__customer_id']].total_qty = row['quantity'] or 0
+    return list(spend.values())
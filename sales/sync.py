@@ -0,0 +1,119 @@
+"""
+Upload of sales a till recorded while it could not reach the server.
+
+Each queued sale carries the till's idempotency key and timestamp. Sales are
+recorded through the same checkout.record_sale() as create_sale, a chunk of
+them per transaction with a savepoint per sale, so one bad sale is rejected
+on its own and a retried upload replays what already committed.
+
+An expiring / damaged row that sold out (and was deleted) while the till
+was offline cannot be priced from the catalog: such a line is priced from
+the queued sale (its unit_price and product_id) and flagged as a shortfall.
+"""
+from django.conf import settings
+from django.db import transaction, IntegrityError
+from rest_framework.exceptions import ValidationError
+
+from .checkout import record_sale, find_sale_by_key, lock_sale_key
+from .models import Sale
+from .receipts import drain_in_thread
+from .serializers import SaleSerializer, OfflineSaleSerializer
+
+
+def _chunk_size():
+    return getattr(settings, "OFFLINE_SYNC_CHUNK_SIZE", 50)
+
+
+def _result(index, key, status, sale=None, errors=None):
+    result = {
+        "index": index,
+        "idempotency_key": key,
+        "status": status,
+        "sale_id": sale.id if sale else None,
+        "reference": sale.reference if sale else None,
+        "stock_imbalance": [],
+        "errors": errors,
+    }
+    for item in getattr(sale, "stock_imbalances", []):
+        result["stock_imbalance"].append({
+            "product": item.product_id,
+            "product_name": item.product.name,
+            "sale_type": item.sale_type,
+            "quantity": item.quantity,
+        })
+    return result
+
+
+def _record(index, key, sale_date, serializer, user):
+    try:
+        # Savepoint: a rejected sale must not roll back the rest of the chunk
+        with transaction.atomic():
+            lock_sale_key(key)
+            sale = record_sale(serializer, user, idempotency_key=key, sale_date=sale_date)
+        return _result(index, key, "created", sale)
+    except IntegrityError:
+        # Committed by a concurrent upload of the same queue
+        existing = find_sale_by_key(key)
+        if not existing:
+            raise
+        return _result(index, key, "replayed", existing)
+    except ValidationError as e:
+        return _result(index, key, "rejected", errors=e.detail)
+
+
+def sync_offline_sales(entries, request):
+    """
+    Record a till's offline queue in order. Returns one result per entry:
+    created / replayed (already uploaded) / rejected (with errors). Stock
+    that ran out while the till was offline is flagged, not rejected.
+    """
+    results = [None] * len(entries)
+    pending = []
+    first_index = {}
+
+    envelopes = []
+    for index, entry in enumerate(entries):
+        envelope = OfflineSaleSerializer(data=entry)
+        if not envelope.is_valid():
+            results[index] = _result(index, entry.get('idempotency_key') if isinstance(entry, dict) else None,
+                                     "rejected", errors=envelope.errors)
+            continue
+        envelopes.append((index, entry, envelope.validated_data))
+
+    # One lookup for every key the till already uploaded
+    keys = [data['idempotency_key'] for _, _, data in envelopes]
+    existing = {
+        sale.idempotency_key: sale
+        for sale in Sale.objects.filter(idempotency_key__in=keys)
+    }
+
+    for index, entry, data in envelopes:
+        key = data['idempotency_key']
+        if key in existing:
+            results[index] = _result(index, key, "replayed", existing[key])
+            continue
+        if key in first_index:
+            # Same sale queued twice, answered from the first copy below
+            continue
+        first_index[key] = index
+
+        serializer = SaleSerializer(data=entry, context={'request': request, 'offline': True})
+        if not serializer.is_valid():
+            results[index] = _result(index, key, "rejected", errors=serializer.errors)
+            continue
+        pending.append((index, key, data['client_created_at'], serializer))
+
+    size = _chunk_size()
+    for start in range(0, len(pending), size):
+        chunk = pending[start:start + size]
+        with transaction.atomic():
+            for index, key, sale_date, serializer in chunk:
+                results[index] = _record(index, key, sale_date, serializer, request.user)
+            transaction.on_commit(lambda count=len(chunk): drain_in_thread(count))
+
+    for index, entry, data in envelopes:
+        if results[index] is None:
+            first = results[first_index[data['idempotency_key']]]
+            results[index] = dict(first, index=index, status="replayed" if first["sale_id"] else first["status"])
+
+    return results
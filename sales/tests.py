@@ -1,3 +1,458 @@
-from django.test import TestCase
+from decimal import Decimal
+from datetime import timedelta
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.db import connection, transaction
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from products.models import Product, ProductBatch, StockHistory, Unit
+from products.references import reset_reference_blocks
+from price_slash.models import ExpiringProduct
+from .models import Sale, SaleItem, CashierDailySummary, Customer, CustomerSpend, ReceiptJob
+from .receipts import claim_jobs
+from .summary import summary_to_dict, compute_customer_spend
+from .stock import deduct_sale_stock
+from .printing import render_escpos, FEED_AND_CUT
+from .catalog import build_snapshot
+from .pricing import PriceTable, price_cart, price_basket, invalidate_price_table, get_price_table, cart_hash
+
+
+IN_MEMORY_LAYERS = {"default": {"BACKEND": "channels.layers.InMemoryChannelLayer"}}
+
+
+@override_settings(CHANNEL_LAYERS=IN_MEMORY_LAYERS)
+class StockDeductionTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username="cashier", password="pass")
+        cls.unit = Unit.objects.create(name="pcs")
+
+    def make_product(self, code, quantity, batches=()):
+        product = Product.objects.create(
+            product_code=code,
+            name=f"Product {code}",
+            description=f"Product {code}",
+            quantity=quantity,
+            min_stock_threshold=1,
+            unit_buying_price=Decimal("100.00"),
+            unit_price=Decimal("120.00"),
+            unit=self.unit,
+        )
+        today = timezone.now().date()
+        for index, batch_qty in enumerate(batches):
+            ProductBatch.objects.create(
+                product=product,
+                batch_number=f"{code}-B{index}",
+                quantity_left=batch_qty,
+                expiry_date=today + timedelta(days=30 * (index + 1)),
+                expiry_min_threshold_days=7,
+                created_by=self.user,
+            )
+        return product
+
+    def make_sale(self, lines):
+        sale = Sale.objects.create(staff=self.user, payment_type="Cash")
+        for product, quantity in lines:
+            SaleItem.objects.create(
+                sale=sale,
+                product=product,
+                quantity=quantity,
+                unit_price=product.unit_price,
+                sale_type="sales",
+            )
+        return list(sale.items.select_related('product').order_by('pk'))
+
+    def count_deduction_queries(self, basket_size):
+        products = [
+            self.make_product(f"Q{basket_size}-{i}", 50, batches=(2, 10))
+            for i in range(basket_size)
+        ]
+        items = self.make_sale([(product, 5) for product in products])
+        # Start every run with an empty reference block so each run refills once
+        reset_reference_blocks()
+        with CaptureQueriesContext(connection) as ctx:
+            with transaction.atomic():
+                deduct_sale_stock(items, self.user)
+        return len(ctx.captured_queries)
+
+    def test_query_count_is_constant_in_basket_size(self):
+        baseline = self.count_deduction_queries(1)
+        self.assertEqual(self.count_deduction_queries(10), baseline)
+        self.assertEqual(self.count_deduction_queries(30), baseline)
+
+    def test_deducts_product_batches_fefo_and_writes_history(self):
+        product = self.make_product("FEFO", 10, batches=(3, 10))
+        items = self.make_sale([(product, 5)])
+
+        with transaction.atomic():
+            deduct_sale_stock(items, self.user)
+
+        product.refresh_from_db()
+        self.assertEqual(product.quantity, 5)
+        self.assertEqual(
+            list(product.batches.order_by('expiry_date').values_list('quantity_left', flat=True)),
+            [0, 8],
+        )
+        history = StockHistory.objects.get(product=product)
+        self.assertEqual(history.action, "Sold")
+        self.assertEqual(history.quantity, 5)
+        self.assertTrue(history.reference)
+
+    def test_shortfall_clamps_to_zero_and_flags_imbalance(self):
+        product = self.make_product("SHORT", 4)
+        items = self.make_sale([(product, 3), (product, 3)])
+
+        with transaction.atomic():
+            deduct_sale_stock(items, self.user)
+
+        product.refresh_from_db()
+        self.assertEqual(product.quantity, 0)
+        notes = list(StockHistory.objects.filter(product=product).order_by('pk').values_list('notes', flat=True))
+        self.assertNotIn("(Stock imbalance)", notes[0])
+        self.assertIn("(Stock imbalance)", notes[1])
+
+
+@override_settings(CHANNEL_LAYERS=IN_MEMORY_LAYERS)
+class CartPricingTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        unit = Unit.objects.create(name="pcs")
+        cls.products = [
+            Product.objects.create(
+                product_code=f"CART-{i}",
+                name=f"Cart product {i}",
+                description=f"Cart product {i}",
+                quantity=100,
+                min_stock_threshold=1,
+                unit_buying_price=Decimal("100.00"),
+                unit_price=Decimal("120.10"),
+                discount=Decimal("5.05"),
+                discount_quantity=3,
+                apply_vat=True,
+                vat_value=Decimal("0.10"),
+                unit=unit,
+            )
+            for i in range(20)
+        ]
+
+    def cart(self, size):
+        return [
+            {"checker": f"{product.id}-sales", "sale_type": "sales", "quantity": 7}
+            for product in self.products[:size]
+        ]
+
+    def setUp(self):
+        invalidate_price_table()
+
+    def test_query_count_is_constant_in_cart_size(self):
+        with CaptureQueriesContext(connection) as small:
+            price_cart(self.cart(1))
+        invalidate_price_table()
+        with CaptureQueriesContext(connection) as large:
+            price_cart(self.cart(20))
+        self.assertEqual(len(small.captured_queries), len(large.captured_queries))
+
+    def test_price_table_is_memoized_until_a_price_changes(self):
+        price_cart(self.cart(5))
+        with self.assertNumQueries(0):
+            price_cart(self.cart(20))
+
+        # unit_price is derived from the markup on save
+        product = self.products[0]
+        product.markup_percentage = Decimal("100")
+        product.save()
+
+        items, _ = price_cart(self.cart(1))
+        self.assertEqual(items[0]["unit_price"], Decimal("200.00"))
+
+    def test_cart_hash_changes_with_price_version(self):
+        cart = self.cart(3)
+        before = cart_hash(get_price_table().version, cart)
+        self.assertEqual(before, cart_hash(get_price_table().version, cart))
+
+        self.products[1].save()
+        self.assertNotEqual(before, cart_hash(get_price_table().version, cart))
+
+    def test_unchanged_cart_skips_the_price_table(self):
+        client = APIClient()
+        client.force_authenticate(User.objects.create_user(username="validator", password="pass"))
+        cart = self.cart(3)
+        first = client.post("/api/sales/validate-cart/", {"items": cart}, format='json')
+
+        # Expired table: an unchanged cart must not rebuild it
+        with override_settings(PRICE_TABLE_TTL=0), \
+                mock.patch.object(PriceTable, 'build', side_effect=AssertionError("rebuilt")):
+            again = client.post("/api/sales/validate-cart/", {"items": cart, "cart_hash": first.data["cart_hash"]}, format='json')
+        self.assertTrue(again.data["unchanged"])
+
+    def test_basket_profit_uses_discount_blocks(self):
+        line = price_basket(self.cart(1))[0]
+
+        # 7 x 120.10 - 2 blocks x 5.05 - 7 x 100.00 cost
+        self.assertEqual(line.profit, Decimal("840.70") - Decimal("10.10") - Decimal("700.00"))
+
+    def test_prices_in_exact_decimal(self):
+        items, totals = price_cart(self.cart(3))
+
+        self.assertEqual(items[0]["amount"], Decimal("840.70"))
+        self.assertEqual(items[0]["discount_value"], Decimal("10.10"))
+        self.assertEqual(items[0]["vat_value"], Decimal("0.70"))
+        self.assertEqual(totals["sub_total"], Decimal("2522.10"))
+        self.assertEqual(totals["grand_total"], Decimal("2522.10") + Decimal("2.10") - Decimal("30.30"))
+
+    def test_unknown_and_malformed_keys(self):
+        items, totals = price_cart([
+            {"checker": "999999-sales", "sale_type": "sales", "quantity": 1},
+            {"checker": "bad", "sale_type": "sales", "quantity": 1},
+        ])
+
+        self.assertEqual(items[0]["message"], "Product not found")
+        self.assertEqual(items[1]["message"], "Invalid key format")
+        self.assertEqual(totals["grand_total"], Decimal("0.00"))
+
+
+@override_settings(CHANNEL_LAYERS=IN_MEMORY_LAYERS, RECEIPT_QUEUE_INLINE=False)
+class SaleTestCase(TestCase):
+    """One product and an authenticated till posting sales to it."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username="till", password="pass")
+        unit = Unit.objects.create(name="pcs")
+        cls.product = Product.objects.create(
+            product_code="TILL",
+            name="Till product",
+            description="Till product",
+            quantity=10,
+            min_stock_threshold=1,
+            unit_buying_price=Decimal("100.00"),
+            unit_price=Decimal("150.00"),
+            unit=unit,
+        )
+
+    def setUp(self):
+        invalidate_price_table()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def post_sale(self, key, customer=None):
+        payload = {
+            "customer_id": customer.id if customer else None,
+            "payment_type": "Cash",
+            "grand_total": "300.00",
+            "total_vat": "0.00",
+            "total_discount": "0.00",
+            "items": [{
+                "checker": f"{self.product.id}-sales",
+                "sale_type": "sales",
+                "quantity": 2,
+                "unit_price": "150.00",
+                "amount": "300.00",
+            }],
+        }
+        return self.client.post(reverse('create-sale'), payload, format="json", HTTP_IDEMPOTENCY_KEY=key)
+
+
+class IdempotentSaleTests(SaleTestCase):
+
+    def test_retry_returns_the_committed_sale(self):
+        first = self.post_sale("till-1-0001")
+        retry = self.post_sale("till-1-0001")
+
+        self.assertEqual(first.status_code, 201)
+        self.assertEqual(retry.status_code, 200)
+        self.assertTrue(retry.data["replayed"])
+        self.assertEqual(Sale.objects.filter(idempotency_key="till-1-0001").count(), 1)
+        self.assertEqual(StockHistory.objects.filter(product=self.product).count(), 1)
+
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.quantity, 8)
+
+    def test_checkout_prices_from_current_rows_not_the_memo(self):
+        get_price_table()
+        # A price change another process made, invisible to this process' memo
+        Product.objects.filter(pk=self.product.pk).update(unit_price=Decimal("160.00"))
+
+        self.post_sale("till-1-0011")
+
+        self.assertEqual(SaleItem.objects.get(sale__idempotency_key="till-1-0011").unit_price, Decimal("160.00"))
+
+    def test_claimed_receipt_job_is_not_released_as_stale(self):
+        self.post_sale("till-1-0010")
+        # A backlog older than STALE_AFTER
+        ReceiptJob.objects.update(updated_at=timezone.now() - timedelta(minutes=30))
+
+        self.assertEqual(len(claim_jobs()), 1)
+        self.assertEqual(claim_jobs(), [])
+        self.assertEqual(ReceiptJob.objects.get().status, 'processing')
+
+    def test_different_keys_record_different_sales(self):
+        self.post_sale("till-1-0002")
+        self.post_sale("till-1-0003")
+
+        self.assertEqual(Sale.objects.count(), 2)
+
+
+class CashierSummaryTests(SaleTestCase):
+
+    def test_sale_updates_cashier_daily_summary(self):
+        self.post_sale("till-1-0004")
+        self.post_sale("till-1-0005")
+
+        summary = summary_to_dict(CashierDailySummary.objects.get(staff=self.user))
+        self.assertEqual(summary["total_sales"], Decimal("600.00"))
+        self.assertEqual(summary["payment_type_amounts"], {"Cash": Decimal("600.00")})
+        self.assertEqual(summary["top_product"], {"product__name": "Till product", "total_qty": 4})
+
+
+class CustomerSpendTests(SaleTestCase):
+
+    def test_sale_updates_customer_spend_and_badges(self):
+        regular = Customer.objects.create(name="Regular")
+        Customer.objects.create(name="Walk In")
+        self.post_sale("till-1-0006", customer=regular)
+        self.post_sale("till-1-0007", customer=regular)
+
+        spend = CustomerSpend.objects.get(customer=regular)
+        self.assertEqual((spend.sales_count, spend.total_amount, spend.total_qty), (2, Decimal("600.00"), 4))
+        self.assertEqual(
+            [(row.customer_id, row.total_amount, row.total_qty) for row in compute_customer_spend()],
+            [(regular.id, Decimal("600.00"), 4)],
+        )
+
+        with mock.patch.object(Customer, "TOP_BADGE_LIMIT", 1), mock.patch.object(Customer, "LOW_BADGE_LIMIT", 1):
+            self.assertEqual(Customer.update_all_badges(), 2)
+            self.assertEqual(Customer.update_all_badges(), 0)
+        badges = dict(Customer.objects.values_list("name", "badge"))
+        self.assertEqual(badges, {"Regular": "Top Customer", "Walk In": "Low Customer"})
+
+
+class OfflineSyncTests(SaleTestCase):
+
+    def test_offline_sync_flags_shortfalls_and_replays(self):
+        sales = [
+            {
+                "idempotency_key": f"till-2-{n}",
+                "client_created_at": (timezone.now() - timedelta(hours=1)).isoformat(),
+                "payment_type": "Cash",
+                "grand_total": "900.00",
+                "total_vat": "0.00",
+                "total_discount": "0.00",
+                "items": [{"checker": f"{self.product.id}-sales", "sale_type": "sales", "quantity": 6}],
+            }
+            for n in range(2)
+        ]
+
+        first = self.client.post(reverse('sync-offline-sales'), {"sales": sales}, format="json")
+        retry = self.client.post(reverse('sync-offline-sales'), {"sales": sales}, format="json")
+
+        self.assertEqual(first.data["created"], 2)
+        self.assertEqual([r["stock_imbalance"] != [] for r in first.data["results"]], [False, True])
+        self.assertEqual(retry.data["replayed"], 2)
+        self.assertEqual(Sale.objects.filter(synced_at__isnull=False).count(), 2)
+
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.quantity, 0)
+
+    def test_offline_sale_of_sold_out_expiring_row_is_flagged(self):
+        expiring = ExpiringProduct.objects.create(
+            product=self.product, product_code=self.product.product_code, product_name=self.product.name,
+            initial_unit_price=Decimal("150.00"), resale_price=Decimal("100.00"), quantity=2,
+        )
+        sales = [
+            {
+                "idempotency_key": f"till-3-{n}",
+                "client_created_at": (timezone.now() - timedelta(hours=1)).isoformat(),
+                "payment_type": "Cash",
+                "grand_total": "200.00",
+                "total_vat": "0.00",
+                "total_discount": "0.00",
+                "items": [{
+                    "checker": f"{expiring.id}-expiring", "sale_type": "expiring", "quantity": 2,
+                    "unit_price": "100.00", "product_id": self.product.id,
+                }],
+            }
+            for n in range(2)
+        ]
+
+        response = self.client.post(reverse('sync-offline-sales'), {"sales": sales}, format="json")
+
+        # The first sale empties (and deletes) the row, the second is still recorded
+        self.assertEqual(response.data["created"], 2)
+        self.assertFalse(ExpiringProduct.objects.filter(pk=expiring.pk).exists())
+        self.assertEqual([r["stock_imbalance"] != [] for r in response.data["results"]], [False, True])
+        late = SaleItem.objects.get(sale__idempotency_key="till-3-1")
+        self.assertEqual((late.unit_price, late.amount, late.expiring_product_id), (Decimal("100.00"), Decimal("200.00"), expiring.id))
+
+
+@override_settings(RECEIPT_SHOP_NAME="SwiftCart", RECEIPT_PAPER_WIDTH_MM=80)
+class EscPosReceiptTests(SimpleTestCase):
+
+    def test_renders_fixed_width_lines_and_cuts(self):
+        data = render_escpos({
+            "receipt_no": 7,
+            "cashier_name": "Till",
+            "datetime": "2024-01-01 10:00:00",
+            "customer_name": "N/A",
+            "items": [{"description": "Rice 50kg bag ", "qty": "2pcs", "unit_price": Decimal("1500.00"), "amount": Decimal("3000.00")}],
+            "subtotal": Decimal("3000.00"),
+            "discount": Decimal("0.00"),
+            "vat": Decimal("0.00"),
+            "grand_total": Decimal("3000.00"),
+            "reference": "Sale-00000007",
+        })
+
+        self.assertTrue(data.endswith(FEED_AND_CUT))
+        self.assertIn(b"   2pcs x 1,500.00" + b" " * 22 + b"3,000.00", data)
+        self.assertLess(len(data), 4096)
+
+
+@override_settings(CHANNEL_LAYERS=IN_MEMORY_LAYERS)
+class CatalogSyncTests(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user(username="catalog", password="pass")
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        unit = Unit.objects.create(name="pcs")
+        self.products = [
+            Product.objects.create(
+                product_code=f"CAT{n}", name=f"Catalog {n}", quantity=5, min_stock_threshold=1,
+                unit_buying_price=Decimal("10.00"), unit_price=Decimal("12.00"), unit=unit,
+            )
+            for n in range(3)
+        ]
+
+    def test_delta_returns_changes_and_tombstones(self):
+        full = self.client.get(reverse('sales-products'))
+        version = int(full["X-Catalog-Version"])
+
+        unchanged = self.client.get(reverse('sales-products'), HTTP_IF_NONE_MATCH=full["ETag"])
+        self.assertEqual(unchanged.status_code, 304)
+
+        changed, deleted, _ = self.products
+        changed.unit_price = Decimal("13.00")
+        changed.save()
+        deleted_id = deleted.pk  # delete() clears the instance's pk
+        deleted.delete()
+
+        delta = self.client.get(reverse('sales-products'), {"since": version})
+        self.assertEqual([p["id"] for p in delta.data["products"]], [changed.id])
+        self.assertEqual(delta.data["deleted"]["product"], [deleted_id])
+        self.assertGreater(delta.data["version"], version)
+
+    def test_snapshot_is_columnar_and_dictionary_encoded(self):
+        snapshot = build_snapshot(1)
+
+        self.assertEqual(snapshot["count"], 3)
+        self.assertEqual(snapshot["columns"]["unit_price"], [1200, 1200, 1200])
+        self.assertEqual(snapshot["columns"]["unit"], [0, 0, 0])
+        self.assertEqual(snapshot["dictionaries"]["unit"], ["pcs"])
+        self.assertEqual(snapshot["columns"]["category"], [-1, -1, -1])
@@ -3,11 +3,14 @@ from . import views
 
 urlpatterns = [
     path('sales-products/', views.sales_products, name='sales-products'),
+    path('catalog-snapshot/', views.catalog_snapshot, name='catalog-snapshot'),
     path('sales-customers/', views.sales_customers, name='sales-customers'),
     path('expiring-damaged/', views.expiring_and_damaged_products, name='expiring-damaged'),
     path('validate-cart/', views.validate_cart, name='expiring-damaged'),
     path('create/', views.create_sale, name='create-sale'),
+    path('sync/', views.sync_offline_sales_view, name='sync-offline-sales'),
     path("create-customers/", views.create_customer, name="create_customer"),
     path('today-receipts/', views.get_todays_receipts, name='today_receipts'),
+    path('receipt-status/<int:sale_id>/', views.receipt_status, name='receipt-status'),
    
 ]
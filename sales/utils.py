@@ -1,65 +1,158 @@
-from django.db.models import Sum
-from django.utils.timezone import now
-from .models import SaleItem, Sale 
 import os
-import win32api
-import win32print
 
 from reportlab.lib.pagesizes import A4
 from reportlab.pdfgen import canvas
 from reportlab.lib import colors
 from reportlab.lib.units import mm
+from reportlab.lib.utils import ImageReader
+from PIL import Image
 from io import BytesIO
+import threading
 
 from django.conf import settings
 
 
-def generate_receipt(sale_data):
-    buffer = BytesIO()
-    c = canvas.Canvas(buffer, pagesize=A4)
-    width, height = A4
+DEFAULT_SHOP_ADDRESS = "74 Woji Road, Rumurulu, Port Harcourt, Rivers State."
+DEFAULT_SHOP_PHONE = "Phone: 08109802115, 08105759394, 07064112128"
 
-    logo_path = os.path.join(settings.MEDIA_ROOT, 'logo.png')
+WATERMARK_SIZE = 500
+WATERMARK_ALPHA = 0.05
+TOP_LOGO_SIZE = (200, 140)
+# Pixels per point the cached logo images are downsampled to (2 ~= 144 dpi)
+LOGO_SCALE = 2
 
 
-    # --- Draw faint watermark (behind everything) ---
-    c.saveState()  # Save current canvas state
-    c.setFillAlpha(0.05)  # Very faint watermark
-    c.drawImage(
-        logo_path,
-        width/2 - 250, height/2 - 250,  # center page
-        width=500, height=500,
-        preserveAspectRatio=True,
-        mask='auto'
-    )
-    c.restoreState()  # Restore normal opacity
+class ReceiptTemplate:
+    """
+    Everything on a receipt that does not depend on the sale: the faint
+    watermark, the top logo, the address block and the table header.
 
-    # --- Top-left logo (bigger) ---
-    top_logo_width = 200
-    top_logo_height = 140
-    x_center = (width - top_logo_width) / 2  # Center horizontally
-    c.drawImage(
+    Built once per process and reused; each receipt only draws its own text.
+    """
+    FORM_NAME = "receipt_static_layer"
+
+    def __init__(self, logo_path, address, phone):
+        self.address = address
+        self.phone = phone
+        self.watermark = None
+        self.logo = None
+        if logo_path and os.path.exists(logo_path):
+            self._load_images(logo_path)
+
+    def _load_images(self, logo_path):
+        with Image.open(logo_path) as source:
+            logo = source.convert("RGBA")
+
+        # Watermark: pre-blend onto white at 5% so no alpha is needed per page
+        watermark = logo.copy()
+        watermark.thumbnail((WATERMARK_SIZE, WATERMARK_SIZE))  # faint, 72 dpi is plenty
+        faded = Image.new("RGBA", watermark.size, (255, 255, 255, 255))
+        alpha = watermark.getchannel("A").point(lambda a: int(a * WATERMARK_ALPHA))
+        faded.paste(watermark, (0, 0), alpha)
+        self.watermark = ImageReader(faded.convert("RGB"))
+
+        top_logo = logo.copy()
+        top_logo.thumbnail((TOP_LOGO_SIZE[0] * LOGO_SCALE, TOP_LOGO_SIZE[1] * LOGO_SCALE))
+        self.logo = ImageReader(top_logo)
+
+    def draw(self, c):
+        """Draw the static layer, defining it as a PDF form on first use per document."""
+        if not getattr(c, "_receipt_form_defined", False):
+            c.beginForm(self.FORM_NAME)
+            self._draw_static(c)
+            c.endForm()
+            c._receipt_form_defined = True
+        c.doForm(self.FORM_NAME)
+
+    def _draw_static(self, c):
+        width, height = A4
+
+        # --- Faint watermark (behind everything) ---
+        if self.watermark:
+            c.drawImage(
+                self.watermark,
+                width/2 - WATERMARK_SIZE/2, height/2 - WATERMARK_SIZE/2,  # center page
+                width=WATERMARK_SIZE, height=WATERMARK_SIZE,
+                preserveAspectRatio=True,
+            )
+
+        # --- Top logo (centered) ---
+        if self.logo:
+            top_logo_width, top_logo_height = TOP_LOGO_SIZE
+            c.drawImage(
+                self.logo,
+                (width - top_logo_width) / 2,
+                height - 90,
+                width=top_logo_width,
+                height=top_logo_height,
+                preserveAspectRatio=True,
+                mask='auto'
+            )
+
+        # --- Address and phone (centered) ---
+        c.setFont("Helvetica", 10)
+        c.drawCentredString(width/2, height - 50, self.address)
+        c.drawCentredString(width/2, height - 65, self.phone)
+
+        c.line(40, height - 90, width - 40, height - 85)
+
+        # --- Receipt info separator ---
+        y = height - 125
+        c.line(40, y-10, width - 40, y-10)
+        y -= 30
+
+        # --- Items table header (with gray background) ---
+        c.setFillColor(colors.lightgrey)
+        c.rect(40, y, width-80, 18, stroke=0, fill=1)
+        c.setFillColor(colors.black)
+        c.setFont("Helvetica-Bold", 9)
+        c.drawString(45, y+5, "No")
+        c.drawString(70, y+5, "Item Description")
+        c.drawRightString(300, y+5, "Qty")
+        c.drawRightString(400, y+5, "Unit Price")
+        c.drawRightString(width - 50, y+5, "Amount")
+
+
+_template_cache = {"key": None, "template": None}
+_template_lock = threading.Lock()
+
+
+def _template_key():
+    logo_path = os.path.join(settings.MEDIA_ROOT, 'logo.png')
+    try:
+        stat = os.stat(logo_path)
+        logo_version = (stat.st_mtime_ns, stat.st_size)
+    except OSError:
+        logo_version = None
+    return (
         logo_path,
-        x_center,  
-        height - 90,  # top-left corner
-        width=top_logo_width,
-        height=top_logo_height,
-        preserveAspectRatio=True,
-        mask='auto'
+        logo_version,
+        getattr(settings, "RECEIPT_SHOP_ADDRESS", DEFAULT_SHOP_ADDRESS),
+        getattr(settings, "RECEIPT_SHOP_PHONE", DEFAULT_SHOP_PHONE),
     )
 
-    # --- Company name + address + phone (centered) ---
-    # Remove company name
-    # c.setFont("Helvetica-Bold", 16)
-    # c.drawCentredString(width/2, height - 50, "MAC-ONELA SUPPLY NETWORK")
 
-    # address and phone up
-    c.setFont("Helvetica", 10)
-    c.drawCentredString(width/2, height - 50, "74 Woji Road, Rumurulu, Port Harcourt, Rivers State.")
-    c.drawCentredString(width/2, height - 65, "Phone: 08109802115, 08105759394, 07064112128")
+def get_receipt_template(force_rebuild=False):
+    """
+    Return the cached ReceiptTemplate, rebuilding it when the logo file or the
+    shop details in settings have changed.
+    """
+    key = _template_key()
+    with _template_lock:
+        if force_rebuild or _template_cache["key"] != key:
+            logo_path, _, address, phone = key
+            _template_cache["template"] = ReceiptTemplate(logo_path, address, phone)
+            _template_cache["key"] = key
+        return _template_cache["template"]
+
 
+def generate_receipt(sale_data, template=None):
+    buffer = BytesIO()
+    c = canvas.Canvas(buffer, pagesize=A4)
+    width, height = A4
 
-    c.line(40, height - 90, width - 40, height - 85)
+    # Watermark, logo, address block and table header come from the cached layer
+    (template or get_receipt_template()).draw(c)
 
     # --- Receipt info ---
     y = height - 110
@@ -72,20 +165,8 @@ def generate_receipt(sale_data):
     c.drawString(40, y, f"Customer: {sale_data['customer_name']}")
     c.drawString(220, y, f"Phone: {sale_data.get('customer_phone', 'N/A')}")
 
-    c.line(40, y-10, width - 40, y-10)
     y -= 30
 
-    # --- Items table header (with gray background) ---
-    c.setFillColor(colors.lightgrey)
-    c.rect(40, y, width-80, 18, stroke=0, fill=1)
-    c.setFillColor(colors.black)
-    c.setFont("Helvetica-Bold", 9)
-    c.drawString(45, y+5, "No")
-    c.drawString(70, y+5, "Item Description")
-    c.drawRightString(300, y+5, "Qty")
-    c.drawRightString(400, y+5, "Unit Price")
-    c.drawRightString(width - 50, y+5, "Amount")
-
     # --- Items table rows (alternate shading) ---
     y -= 20
     c.setFont("Helvetica", 9)
@@ -142,50 +223,22 @@ def generate_receipt(sale_data):
 
 
 
-from django.utils.timezone import now, localtime
-from datetime import datetime, time
-from django.db.models import Sum
+from django.utils.timezone import localdate
+from .models import CashierDailySummary
+from .summary import summary_to_dict
 
 def get_cashier_sales_summary(user):
-    today_local = localtime(now()).date()
-
-    start_of_day = datetime.combine(today_local, time.min)
-    end_of_day = datetime.combine(today_local, time.max)
-
-    summary = {
-        'total_sales': 0,
-        'top_product': {},
-        'payment_type_amounts': {}
-    }
-
+    """
+    Today's totals for a cashier, read from the CashierDailySummary rollup
+    that create_sale keeps up to date.
+    """
+    summary = None
     try:
-        sale_items = SaleItem.objects.filter(
-            sale__staff=user,
-            sale__sale_date__range=(start_of_day, end_of_day)
-        ).select_related('product', 'sale')
-
-        # Total sales
-        total_sales = sale_items.aggregate(total=Sum('amount'))['total'] or 0
-        summary['total_sales'] = total_sales
-
-        # Top product
-        top_product = (
-            sale_items
-            .values('product__name')
-            .annotate(total_qty=Sum('quantity'))
-            .order_by('-total_qty')
-            .first()
-        )
-        summary['top_product'] = top_product or {}
-
-        # Payment type amounts
-        for item in sale_items.values('sale__payment_type').annotate(amount=Sum('amount')):
-            summary['payment_type_amounts'][item['sale__payment_type']] = item['amount']
-
+        summary = CashierDailySummary.objects.filter(staff=user, date=localdate()).first()
     except Exception as e:
         print("Error generating cashier summary:", e)
 
-    return summary
+    return summary_to_dict(summary)
 
 
 
@@ -199,6 +252,10 @@ def print_pdf_file(file_path, printer_name=None):
         printer_name (str, optional): Name of the printer. 
                                       Defaults to system default printer.
     """
+    # Windows only, imported here so sales.utils loads on Linux tills
+    import win32api
+    import win32print
+
     if not os.path.exists(file_path):
         raise FileNotFoundError(f"PDF file not found: {file_path}")
 
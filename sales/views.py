@@ -1,37 +1,98 @@
 from rest_framework.decorators import api_view, permission_classes
 from rest_framework.response import Response
 from .models import Customer
-from products.models import Product, ProductBatch, StockHistory
-from .serializers import ProductSalesSerializer, CustomerBasicSerializer
+from .serializers import CustomerBasicSerializer
 from price_slash.models import ExpiringProduct, DamageProduct
 from .serializers import ExpiringProductSerializer, DamagedProductSerializer
 from rest_framework import status
 from rest_framework.permissions import IsAuthenticated
 from .serializers import SaleItemSerializer, SaleSerializer
-from django.db import transaction
+from django.db import transaction, IntegrityError
 from .models import Sale, SaleItem, Receipt
 from .serializers import CustomerSerializer, CartKeySerializer, ReceiptSerializer
 from django.db.models import Sum, F
 from django.utils.timezone import now
 from collections import defaultdict
-from sales.utils import generate_receipt
-from django.core.files.base import ContentFile
-from rest_framework.exceptions import ValidationError
+from .checkout import record_sale, get_idempotency_key, find_sale_by_key, lock_sale_key
+from .pricing import price_cart, get_price_table, price_version, cart_hash
 from .utils import get_cashier_sales_summary
 from .serializers import CustomerSerializer
-from .utils import print_pdf_file
-from decimal import Decimal, ROUND_HALF_UP
-from decimal import Decimal, ROUND_HALF_UP
 from django.utils.timezone import localdate
-from .models import Receipt
+from .models import Receipt, ReceiptJob
+from django.urls import reverse
+from django.conf import settings
+from .sync import sync_offline_sales
+from .catalog import full_catalog, catalog_delta, catalog_etag, get_snapshot_blob, msgpack, brotli
+from django.http import HttpResponse
+from products.catalog import current_catalog_version, stamp_pending
 
 
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
 def sales_products(request):
-    products = Product.objects.all()
-    serializer = ProductSalesSerializer(products, many=True)
-    return Response(serializer.data)
+    """
+    Till catalog. Without parameters: every active product, as before.
+    With ?since=<version>: only rows changed after that version plus tombstones.
+    Both send an ETag; a matching If-None-Match costs a 304.
+    """
+    since = request.query_params.get('since')
+    if since is not None:
+        try:
+            since = int(since)
+        except ValueError:
+            return Response({"since": "Must be an integer catalog version."}, status=status.HTTP_400_BAD_REQUEST)
+
+    # Rows whose on-commit stamp never ran would otherwise never reach the tills
+    stamp_pending()
+    version = current_catalog_version()
+    etag = catalog_etag(version, since)
+    if etag in [tag.strip() for tag in request.headers.get('If-None-Match', '').split(',')]:
+        response = Response(status=status.HTTP_304_NOT_MODIFIED)
+    elif since is None:
+        response = Response(full_catalog())
+    elif since > version:
+        # The till is ahead of the server (restored database): resync fully
+        response = Response({"version": version, "reset": True}, status=status.HTTP_409_CONFLICT)
+    else:
+        response = Response(catalog_delta(since, version))
+
+    response['ETag'] = etag
+    response['X-Catalog-Version'] = str(version)
+    return response
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def catalog_snapshot(request):
+    """
+    Columnar catalog for till boot (see sales.catalog.build_snapshot).
+    ?encoding=msgpack for msgpack, JSON otherwise; Brotli-compressed when the
+    till accepts `br`. The blob is rebuilt only when the catalog version changes.
+    """
+    stamp_pending()
+    version = current_catalog_version()
+    encoding = request.query_params.get('encoding', 'json')
+    if encoding not in ('json', 'msgpack'):
+        return Response({"encoding": "Use json or msgpack."}, status=status.HTTP_400_BAD_REQUEST)
+    if encoding == 'msgpack' and msgpack is None:
+        encoding = 'json'
+    compress = brotli is not None and 'br' in request.headers.get('Accept-Encoding', '')
+
+    etag = f'"snapshot-{version}-{encoding}{"-br" if compress else ""}"'
+    if etag in [tag.strip() for tag in request.headers.get('If-None-Match', '').split(',')]:
+        response = HttpResponse(status=status.HTTP_304_NOT_MODIFIED)
+    else:
+        response = HttpResponse(
+            get_snapshot_blob(version, encoding, compress),
+            content_type='application/x-msgpack' if encoding == 'msgpack' else 'application/json',
+        )
+        if compress:
+            response['Content-Encoding'] = 'br'
+
+    response['ETag'] = etag
+    response['Vary'] = 'Accept-Encoding'
+    response['X-Catalog-Version'] = str(version)
+    return response
+
 
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
@@ -44,7 +105,7 @@ def sales_customers(request):
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
 def expiring_and_damaged_products(request):
-    expiring_items = ExpiringProduct.objects.select_related('product').all()
+    expiring_items = ExpiringProduct.objects.select_related('product').filter(is_proposal=False)
     damaged_items = DamageProduct.objects.select_related('product').all()
     
     expiring_data = ExpiringProductSerializer(expiring_items, many=True).data
@@ -59,131 +120,41 @@ def expiring_and_damaged_products(request):
 
 
 
+MONEY_FIELDS = ("unit_price", "amount", "vat_value", "discount_value")
+
+
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
 def validate_cart(request):
     serializer = CartKeySerializer(data=request.data.get('items', []), many=True)
     serializer.is_valid(raise_exception=True)
 
-    validated_items = []
-    sub_total = 0.0
-    total_vat = 0.0
-    total_discount = 0.0
-    grand_total = 0.0
+    version = price_version()
+    fingerprint = cart_hash(version, serializer.validated_data)
 
-    for item in serializer.validated_data:
-        checker = item.get('checker', '')          
-        sale_type = item.get('sale_type', '')      
-        requested_qty = item.get('quantity', 0)
+    # Nothing changed since the till last validated this cart; checked before
+    # the price table, which may need a rebuild
+    if request.data.get('cart_hash') == fingerprint:
+        return Response({
+            "unchanged": True,
+            "cart_hash": fingerprint,
+            "price_version": version,
+        }, status=status.HTTP_200_OK)
 
-        # Parse product id from checker
-        try:
-            product_id_str, _ = checker.split('-')
-            product_id = int(product_id_str)
-        except Exception:
-            validated_items.append({
-                "checker": checker,
-                "sale_type": sale_type,
-                "quantity": 0,
-                "unit_price": 0,
-                "amount": 0,
-                "vat_value": 0,
-                "discount_value": 0,
-                "message": "Invalid key format"
-            })
-            continue
-
-        unit_price = 0.0
-        amount = 0.0
-        vat = 0.0
-        discount = 0.0
-        message = None
-        product_instance = None
-
-        # Retail or Bulk (Product table)
-        if sale_type == "sales":
-            try:
-                product_instance = Product.objects.get(id=product_id)
-
-                unit_price = float(getattr(product_instance, "unit_price", 0.0))
-
-
-                discount_quantity = int(getattr(product_instance, "discount_quantity", 0))
-
-                # Apply discount only if product has discount_quantity set
-                if discount_quantity > 0:
-                    full_blocks = requested_qty // discount_quantity
-                    discount = float(getattr(product_instance, "discount", 0.0)) * full_blocks
-
-                # VAT (per unit × qty)
-                vat = 0.0
-                if getattr(product_instance, "apply_vat", False):
-                    vat = float(getattr(product_instance, "vat_value", 0.0)) * requested_qty
-
-                # Final amount = (unit_price × qty) - discount
-                amount = unit_price * requested_qty
-
-            except Product.DoesNotExist:
-                message = "Product not found"
-
-
-        # Damaged (DamageProduct table)
-        elif sale_type == 'damaged':
-            try:
-                product_instance = DamageProduct.objects.get(id=product_id)
-                available_qty = getattr(product_instance, 'quantity', 0)
-                if requested_qty > available_qty:
-                    requested_qty = available_qty
-                    message = f"Quantity adjusted to available stock ({available_qty})"
-                if requested_qty == 0:
-                    continue
-                unit_price = float(getattr(product_instance, 'resale_price', 0.0))
-                amount = unit_price * requested_qty
-            except DamageProduct.DoesNotExist:
-                message = "Damaged product not found"
-
-        # Expiring (ExpiringProduct table)
-        elif sale_type == 'expiring':
-            try:
-                product_instance = ExpiringProduct.objects.get(id=product_id)
-                available_qty = getattr(product_instance, 'quantity', 0)
-                if requested_qty > available_qty:
-                    requested_qty = available_qty
-                    message = f"Quantity adjusted to available stock ({available_qty})"
-                if requested_qty == 0:
-                    continue
-                unit_price = float(getattr(product_instance, 'resale_price', 0.0))
-                amount = unit_price * requested_qty
-            except ExpiringProduct.DoesNotExist:
-                message = "Expiring product not found"
-
-        # Update totals only if product exists
-        if product_instance:
-            sub_total += amount
-            total_vat += vat
-            total_discount += discount
-            grand_total = sub_total + total_vat - total_discount
-        
-
-        validated_items.append({
-            "checker": checker,
-            "sale_type": sale_type,
-            "quantity": requested_qty,
-            "unit_price": unit_price,
-            "amount": amount,
-            "vat_value": vat,
-            "discount_value": discount,
-            "message": message
-        })
+    table = get_price_table()
+    fingerprint = cart_hash(table.version, serializer.validated_data)
+    validated_items, totals = price_cart(serializer.validated_data, table=table)
+
+    # Keep sending plain JSON numbers to the till
+    for item in validated_items:
+        for field in MONEY_FIELDS:
+            item[field] = float(item[field])
 
     return Response({
         "validated_items": validated_items,
-        "totals": {
-            "sub_total": sub_total,
-            "total_vat": total_vat,
-            "total_discount": total_discount,
-            "grand_total": grand_total
-        }
+        "totals": {key: float(value) for key, value in totals.items()},
+        "cart_hash": fingerprint,
+        "price_version": table.version,
     }, status=status.HTTP_200_OK)
 
 
@@ -205,203 +176,108 @@ def create_customer(request):
     }, status=status.HTTP_400_BAD_REQUEST)
 
 
+def _sale_response(request, sale, summary, replayed=False):
+    job = getattr(sale, 'receipt_job', None)
+    receipt = getattr(sale, 'receipt', None)
+    receipt_url = None
+    if receipt and receipt.file:
+        receipt_url = request.build_absolute_uri(receipt.file.url)
+
+    return Response({
+        "success": True,
+        "message": "Sale already recorded" if replayed else "Sale created successfully",
+        "replayed": replayed,
+        "sale": SaleSerializer(sale).data,
+        "summary": summary,
+        "receipt_url": receipt_url,
+        "receipt_status": job.status if job else None,
+        "receipt_status_url": request.build_absolute_uri(
+            reverse('receipt-status', args=[sale.id])
+        ),
+    }, status=status.HTTP_200_OK if replayed else status.HTTP_201_CREATED)
+
+
+def _cashier_summary(user):
+    try:
+        return get_cashier_sales_summary(user)
+    except Exception as e:
+        return {}
+
+
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
 def create_sale(request):
+    """
+    Record a sale. Tills send a client-generated `Idempotency-Key` header (or
+    `idempotency_key` field); a retry with the same key returns the sale that
+    was already committed instead of recording it twice.
+    """
+    try:
+        key = get_idempotency_key(request)
+    except ValueError as e:
+        return Response({"idempotency_key": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+    # Fast path for retries of a sale that already committed
+    existing = find_sale_by_key(key)
+    if existing:
+        return _sale_response(request, existing, _cashier_summary(request.user), replayed=True)
+
     serializer = SaleSerializer(data=request.data, context={'request': request})
     serializer.is_valid(raise_exception=True)
 
-    with transaction.atomic():
-        # Save Sale + SaleItems via serializer
-        sale = serializer.save()
-        user = request.user
-        items = sale.items.all()
-
-        for item in items:
-            product = Product.objects.select_for_update().get(pk=item.product_id)
-
-            qty_to_deduct = item.quantity
-            stock_flag = False  
-
-            if product.quantity >= qty_to_deduct:
-                product.quantity -= qty_to_deduct
-            else:
-                product.quantity = 0
-                stock_flag = True
-            product.save(update_fields=['quantity'])
-
-            # Handle expiring and damaged product deduction
-            if item.sale_type == "expiring":
-                exp_item = ExpiringProduct.objects.select_for_update().filter(
-                    id=getattr(item, 'expiring_product_id', None)
-                ).first()
-                if not exp_item:
-                    raise ValidationError({
-                        "cart": f"Product {item.product.name} no longer exists in the Expiring table. Please remove it from cart."
-                    })
-
-                if item.quantity > exp_item.quantity:
-                    raise ValidationError({
-                        "cart": f"Product {item.product.name} has only {exp_item.quantity} units available in the Expiring table. Reduce quantity in cart."
-                    })
-
-                # Safe to deduct
-                exp_item.quantity -= item.quantity
-                exp_item.save(update_fields=['quantity'])
-                if exp_item and exp_item.pk is not None and exp_item.quantity == 0:
-                    exp_item.delete()
-
-
-            elif item.sale_type == "damaged":
-                dmg_item = DamageProduct.objects.select_for_update().filter(
-                    id=getattr(item, 'damage_product_id', None)
-                ).first()
-
-                if not dmg_item:
-                    raise ValidationError({
-                        "cart": f"Product {item.product.name} no longer exists in the Damaged table. Please remove it from cart."
-                    })
-
-                if item.quantity > dmg_item.quantity:
-                    raise ValidationError({
-                        "cart": f"Product {item.product.name} has only {dmg_item.quantity} units available in the Damaged table. Reduce quantity in cart."
-                    })
-
-                # Safe to deduct
-                dmg_item.quantity -= item.quantity
-                dmg_item.save(update_fields=['quantity'])
-                if dmg_item and dmg_item.pk is not None and dmg_item.quantity == 0:
-                    dmg_item.delete()
-
-
-
-            # Deduct from batches (for retail/bulk sales)
-            remaining_qty = qty_to_deduct
-            batches = product.batches.filter(quantity_left__gt=0).order_by('expiry_date')
-            for batch in batches:
-                if remaining_qty <= 0:
-                    break
-                if batch.quantity_left >= remaining_qty:
-                    batch.quantity_left -= remaining_qty
-                    remaining_qty = 0
-                    batch.save(update_fields=['quantity_left'])
-                else:
-                    remaining_qty -= batch.quantity_left
-                    batch.quantity_left = 0
-                    batch.save(update_fields=['quantity_left'])
-
-            # Create StockHistory
-            sale_note = {
-                'sales': 'Sales',
-                'damage': 'Damaged',
-                'expiring': 'Expiring'
-            }.get(item.sale_type, "Sale")
-
-            username = user.get_full_name() or user.username or "Cashier"
-            notes = f"{sale_note} sales made by {username}"
-            if stock_flag:
-                notes += " (Stock imbalance)"
-
-            StockHistory.objects.create(
-                product=product,
-                action='Sold',
-                quantity=item.quantity,
-                action_by=user,
-                notes=notes
-            )
-
-        discount = Decimal(request.data.get('total_discount', "0.00"))
-        vat = Decimal(request.data.get('total_vat', "0.00"))
-
-        # subtotal is amount minus discount plus vat
-        # Compute items with amount
-        items_list = []
-        subtotal = Decimal("0.00")
-
-        for item in items:
-            amount = item.unit_price * item.quantity
-            subtotal += amount
-            items_list.append({
-                "description": f"{item.product.description} {' (EP)' if item.sale_type == 'expiring' else ' (DM)' if item.sale_type == 'damaged' else ''}",
-                "qty": f"{item.quantity}{getattr(item.product.unit, 'name', '')}{'s' if item.quantity > 1 and getattr(item.product.unit, 'name', '') else ''}",
-                "unit_price": item.unit_price,
-                "amount": amount,
-            })
-
-        # Get discounts, VAT, grand total
-        total_discount = Decimal(request.data.get('total_discount', "0.00"))
-        total_vat = Decimal(request.data.get('total_vat', "0.00"))
-        grand_total = subtotal + total_vat - total_discount
-
-        sale_data = {
-            "receipt_no": sale.id,
-            "cashier_name": username,
-            "datetime": sale.sale_date.strftime("%Y-%m-%d %H:%M:%S"),
-            "customer_name": getattr(sale.customer, "name", "N/A") if sale.customer else "N/A",
-            "customer_phone": getattr(sale.customer, "phone", "N/A") if sale.customer else "N/A",
-            "items": items_list,
-            "subtotal": subtotal,
-            "discount": total_discount,
-            "vat": total_vat,
-            "grand_total": grand_total,
-            "reference": sale.reference,
-        }
-
-
-        # Convert all numeric values to Decimal safely
-        for key in ['subtotal', 'discount', 'vat', 'grand_total']:
-            sale_data[key] = Decimal(str(sale_data.get(key, '0.00'))).quantize(Decimal("0.01"), rounding=ROUND_HALF_UP)
-
-        #save to Sale safely
-        sale.total_amount = sale_data['grand_total']
-        sale.total_vat = sale_data['vat']
-        sale.total_discount = sale_data['discount']
-        sale.save(update_fields=['total_amount', 'total_vat', 'total_discount'])
-
-        
-        # Generate PDF
-        pdf_buffer = generate_receipt(sale_data)
-
-        # Make sure buffer is at the beginning
-        pdf_buffer.seek(0)
-
-        # Save Receipt
-        receipt, created = Receipt.objects.get_or_create(sale=sale)
-        if sale.customer:  
-            receipt.customer = sale.customer  
-        receipt.sales_reference = sale.reference  
-        receipt.receipt_number = sale.id   
-        receipt.file.save(
-            f"receipt_{sale.id}.pdf",
-            ContentFile(pdf_buffer.read()),
-            save=False
-        )
-        pdf_buffer.close() 
+    try:
+        with transaction.atomic():
+            if key:
+                # Concurrent duplicates queue up here; the loser sees the winner's sale
+                lock_sale_key(key)
+                existing = find_sale_by_key(key)
+                if existing:
+                    return _sale_response(request, existing, _cashier_summary(request.user), replayed=True)
+
+            sale = record_sale(serializer, request.user, idempotency_key=key)
+            return _sale_response(request, sale, _cashier_summary(request.user))
+    except IntegrityError:
+        # Without advisory locks the unique key is what stops the duplicate
+        existing = find_sale_by_key(key)
+        if not existing:
+            raise
+        return _sale_response(request, existing, _cashier_summary(request.user), replayed=True)
 
-        receipt.save()
-        receipt.refresh_from_db()
 
-        # Build URL for browser access
-        receipt_url = request.build_absolute_uri(receipt.file.url)
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def sync_offline_sales_view(request):
+    """
+    Upload the sales a till queued while offline, oldest first:
+    {"sales": [{"idempotency_key": ..., "client_created_at": ..., <create_sale payload>}, ...]}
+    Every sale gets its own result; uploading the same queue again is safe.
+    """
+    entries = request.data.get('sales')
+    if not isinstance(entries, list) or not entries:
+        return Response({"sales": "Send a non-empty list of sales."}, status=status.HTTP_400_BAD_REQUEST)
+
+    max_sales = getattr(settings, "OFFLINE_SYNC_MAX_SALES", 1000)
+    if len(entries) > max_sales:
+        return Response(
+            {"sales": f"At most {max_sales} sales can be synced per request."},
+            status=status.HTTP_400_BAD_REQUEST
+        )
 
-        try:
-            file_path = receipt.file.path  
-            print_pdf_file(file_path)  
-            print(file_path)
-        except Exception as e:
-            print(f"Printing failed: {e}")
+    results = sync_offline_sales(entries, request)
 
-        try:
-            summary = get_cashier_sales_summary(user)
-        except Exception as e:
-            summary = {}
-        return Response({
-            "success": True,
-            "message": "Sale created successfully",
-            "sale": SaleSerializer(sale).data,
-            "summary": summary,
-            "receipt_url": receipt_url
-        }, status=status.HTTP_201_CREATED)
+    counts = defaultdict(int)
+    for result in results:
+        counts[result["status"]] += 1
+
+    return Response({
+        "success": counts["rejected"] == 0,
+        "created": counts["created"],
+        "replayed": counts["replayed"],
+        "rejected": counts["rejected"],
+        "stock_imbalances": sum(1 for result in results if result["stock_imbalance"]),
+        "results": results,
+        "summary": _cashier_summary(request.user),
+    }, status=status.HTTP_200_OK)
 
 
 @api_view(["GET"])
@@ -416,3 +292,29 @@ def get_todays_receipts(request):
 
     serializer = ReceiptSerializer(receipts, many=True, context={"request": request})
     return Response({"receipts": serializer.data})
+
+
+@api_view(["GET"])
+@permission_classes([IsAuthenticated])
+def receipt_status(request, sale_id):
+    """
+    Poll the receipt job for a sale. receipt_url is set once the worker is done.
+    """
+    try:
+        job = ReceiptJob.objects.select_related('sale__receipt').get(sale_id=sale_id)
+    except ReceiptJob.DoesNotExist:
+        return Response({"detail": "Receipt job not found."}, status=status.HTTP_404_NOT_FOUND)
+
+    receipt_url = None
+    if job.status == 'done':
+        receipt = getattr(job.sale, 'receipt', None)
+        if receipt and receipt.file:
+            receipt_url = request.build_absolute_uri(receipt.file.url)
+
+    return Response({
+        "sale": job.sale_id,
+        "status": job.status,
+        "attempts": job.attempts,
+        "error": job.last_error if job.status == 'failed' else None,
+        "receipt_url": receipt_url,
+    })
@@ -51,6 +51,7 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
     'rest_framework',
     'corsheaders',
 ]
@@ -175,6 +176,13 @@ STATIC_ROOT = BASE_DIR / "staticfiles"
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+# Product image derivatives (products.images): longest edge in pixels per
+# size, rendered as WebP and JPEG by `manage.py process_product_images`.
+# Inline mode renders on a thread after the upload commits instead.
+PRODUCT_IMAGE_SIZES = {"thumbnail": 160, "card": 480, "full": 1600}
+PRODUCT_IMAGE_QUALITY = 80
+PRODUCT_IMAGE_QUEUE_INLINE = config("PRODUCT_IMAGE_QUEUE_INLINE", default=True, cast=bool)
+
 # -------------------------
 # CORS & CSRF
 # -------------------------
@@ -224,8 +232,99 @@ CHANNEL_LAYERS = {
     },
 }
 
+# -------------------------
+# Cache
+# -------------------------
+# Set REDIS_CACHE_URL (e.g. redis://127.0.0.1:6379/1) so every process shares
+# the price table version, catalog snapshots and barcode lookups.
+REDIS_CACHE_URL = config("REDIS_CACHE_URL", default="")
+if REDIS_CACHE_URL:
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.redis.RedisCache",
+            "LOCATION": REDIS_CACHE_URL,
+        }
+    }
+
+# Longest a process prices carts from its memoized price table (sales.pricing);
+# without a shared cache this bounds how stale another process' prices get.
+# Checkout always reads the basket's rows fresh.
+PRICE_TABLE_TTL = 60
+
+# Widest expiry_min_threshold_days a product or batch may have; expiry alerts
+# look this many days ahead (products.models.ProductBatchQuerySet.expiry_alerts)
+EXPIRY_ALERT_HORIZON_DAYS = 365
+
+# Products kept in each process' in-memory barcode LRU (products.barcode_cache).
+# The barcode cache is only used with a shared (Redis) cache: another process
+# never sees a LocMem generation bump. Set BARCODE_CACHE_SHARED = True to force
+# it on for a single-process deployment.
+BARCODE_CACHE_SIZE = 2000
+
 APPEND_SLASH=True
 
+# References (Sale-00000001, StockHistory-00000001, ...) are taken from a
+# per-prefix sequence this many at a time per process
+REFERENCE_BLOCK_SIZE = 50
+
+# -------------------------
+# Receipt queue
+# -------------------------
+# True: render receipts on a background thread of the web process (single till / dev);
+# failed renders are retried on a timer in that process, so after a restart run
+# `python manage.py process_receipts --once` to pick up retries it had scheduled.
+# False: leave jobs for `python manage.py process_receipts`.
+RECEIPT_QUEUE_INLINE = config("RECEIPT_QUEUE_INLINE", default=True, cast=bool)
+
+# Printed on every receipt; the cached receipt layer is rebuilt when these change
+RECEIPT_SHOP_ADDRESS = config("RECEIPT_SHOP_ADDRESS", default="74 Woji Road, Rumurulu, Port Harcourt, Rivers State.")
+RECEIPT_SHOP_PHONE = config("RECEIPT_SHOP_PHONE", default="Phone: 08109802115, 08105759394, 07064112128")
+RECEIPT_SHOP_NAME = config("RECEIPT_SHOP_NAME", default="SwiftCart")
+
+# Counter printer (sales.printing). "device" / "cups" / "file" print ESC/POS
+# slips; "windows" prints the PDF through the Windows shell; "" disables printing.
+RECEIPT_PRINTER_BACKEND = config("RECEIPT_PRINTER_BACKEND", default="windows")
+RECEIPT_PRINTER = {
+    "BACKEND": RECEIPT_PRINTER_BACKEND,
+    "PATH": config("RECEIPT_PRINTER_PATH", default="/dev/usb/lp0"),
+    "NAME": config("RECEIPT_PRINTER_NAME", default=""),
+} if RECEIPT_PRINTER_BACKEND else None
+RECEIPT_PAPER_WIDTH_MM = config("RECEIPT_PAPER_WIDTH_MM", default=80, cast=int)
+
+# -------------------------
+# Offline sale sync
+# -------------------------
+# Sales per transaction when a till uploads its offline queue, and the most
+# sales accepted in one request
+OFFLINE_SYNC_CHUNK_SIZE = 50
+OFFLINE_SYNC_MAX_SALES = 1000
+
+# -------------------------
+# Reorder report (inventory_writeoffs.reorder)
+# -------------------------
+# Sales velocity window, supplier lead time and the stock to cover after
+# delivery, in days; the report is recomputed at most every REORDER_CACHE_SECONDS
+REORDER_VELOCITY_DAYS = 90
+REORDER_LEAD_TIME_DAYS = 7
+REORDER_COVER_DAYS = 14
+REORDER_CACHE_SECONDS = 15 * 60
+
+# Products per transaction when reconciling stock against the ledger
+# (inventory_writeoffs.reconcile)
+RECONCILE_CHUNK_SIZE = 5000
+
+# -------------------------
+# Expiry scanner (price_slash.scanner)
+# -------------------------
+# Suggested markdown for expiring stock: (at most this many days to expiry,
+# percent off the unit price). Expired batches take the first rule.
+EXPIRY_MARKDOWN_RULES = [
+    (0, 50),
+    (3, 30),
+    (7, 20),
+    (14, 10),
+]
+
 
 
 import os
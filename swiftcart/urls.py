@@ -3,7 +3,7 @@ from django.conf import settings
 from django.urls import path, include, re_path
 from users.views import TokenValidateView
 from products.consumers import InventoryConsumer
-from .views import index
+from .views import index, serve_immutable
 from django.views.static import serve
 import socket
 
@@ -26,5 +26,6 @@ urlpatterns = [
 
 
 urlpatterns += [
+    re_path(r'^media/(?P<path>products/derived/.*)$', serve_immutable, {'document_root': settings.MEDIA_ROOT}),
     re_path(r'^media/(?P<path>.*)$', serve, {'document_root': settings.MEDIA_ROOT}),
 ]
@@ -1,4 +1,15 @@
 from django.shortcuts import render
+from django.views.static import serve
+
+# Content-hashed files never change under the same URL
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
 
 def index(request):
     return render(request, "index.html")
+
+
+def serve_immutable(request, path, document_root=None):
+    """django.views.static.serve for content-hashed media, cacheable for a year."""
+    response = serve(request, path, document_root=document_root)
+    response["Cache-Control"] = IMMUTABLE_CACHE_CONTROL
+    return response